@@ -0,0 +1,405 @@
+import math
+import multiprocessing
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+from PySide6.QtCore import QObject, QSize, QThread, Signal, Slot
+
+from frame_ring import FrameRing
+from frame_tap import TappedFrame
+from input_bus import InputBus, autoFollowSource
+
+# The first is the default. Only the template tracker keeps up with four tracks at 60fps on one core, KCF drops a few
+# frames and CSRT, the most accurate, manages about one in five. KCF and CSRT need opencv-contrib-python, see
+# createTracker for the fallback. MOSSE isn't offered, at WORK_WIDTH a performer's box is too small for it and it
+# reports the performer lost on the first frame.
+TRACKER_TYPES = ["Template", "KCF", "CSRT"]
+COLOUR_TRACKERS = {"KCF"}  # Its default colour names features fail on a single channel image after the first update
+WORK_WIDTH = 640  # pixels, the stage ROI is downscaled to at most this wide before tracking
+BOX_SIZE = (0.06, 0.16)  # width, height of a performer's box as a fraction of the frame height
+SLOTS = 3  # Frames in the ring shared with the worker
+
+
+class TemplateTracker:
+    """Normalised cross correlation around the last position, for OpenCV builds without the contrib trackers"""
+
+    SEARCH = 0.75  # Fraction of the box size searched either side of the last position
+    MIN_SCORE = 0.4
+    LEARNING_RATE = 0.1
+
+    def init(self, image: np.ndarray, box: tuple[int, int, int, int]) -> None:
+        x, y, w, h = box
+        self.box = box
+        self.template = image[y : y + h, x : x + w].astype(np.float32)
+
+    def update(self, image: np.ndarray) -> tuple[bool, tuple[int, int, int, int]]:
+        x, y, w, h = self.box
+        dx = math.ceil(w * self.SEARCH)
+        dy = math.ceil(h * self.SEARCH)
+        x0 = max(0, x - dx)
+        y0 = max(0, y - dy)
+        window = image[y0 : y + h + dy, x0 : x + w + dx].astype(np.float32)
+        if window.shape[0] < h or window.shape[1] < w:
+            return False, self.box
+        _, score, _, (bx, by) = cv.minMaxLoc(cv.matchTemplate(window, self.template, cv.TM_CCOEFF_NORMED))
+        if score < self.MIN_SCORE:
+            return False, self.box
+        self.box = (x0 + bx, y0 + by, w, h)
+        cv.accumulateWeighted(window[by : by + h, bx : bx + w], self.template, self.LEARNING_RATE)
+        return True, self.box
+
+
+def _opencvFactory(kind: str):
+    name = f"Tracker{kind}_create"
+    for module in (cv, getattr(cv, "legacy", None)):
+        if module is not None and hasattr(module, name):
+            return getattr(module, name)
+    return None
+
+
+def availableTrackers() -> list[str]:
+    """The trackers this OpenCV build can actually create, the template tracker always works"""
+    return [kind for kind in TRACKER_TYPES if kind == "Template" or _opencvFactory(kind) is not None]
+
+
+def createTracker(kind: str) -> tuple[object, str]:
+    """The requested tracker, or a TemplateTracker if this OpenCV build doesn't have it"""
+    factory = _opencvFactory(kind) if kind != "Template" else None
+    if factory is not None:
+        return factory(), kind
+    return TemplateTracker(), "Template"
+
+
+def stageRoi(screen_points: np.ndarray, width: int, height: int) -> tuple[int, int, int, int]:
+    """The part of the frame worth tracking in: the stage's screen bounds, extended upwards to fit performers standing
+    on the upstage edge. The whole frame if the stage isn't marked out yet."""
+    if len(screen_points) < 3:
+        return 0, 0, width, height
+    x0, y0 = screen_points.min(axis=0)
+    x1, y1 = screen_points.max(axis=0)
+    pad = 0.1 * (x1 - x0)
+    x0 = max(0, math.floor(x0 - pad))
+    x1 = min(width, math.ceil(x1 + pad))
+    y0 = max(0, math.floor(y0 - BOX_SIZE[1] * height))
+    y1 = min(height, math.ceil(y1 + pad))
+    if x1 - x0 < 16 or y1 - y0 < 16:
+        return 0, 0, width, height
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class _Follower:
+    def __init__(self, kind: str, box: tuple[float, float, float, float]):
+        self.kind = kind
+        self.box = box  # x, y, w, h in full frame pixels
+        self.tracker = None  # Created on the next frame, and again whenever the working image changes
+
+
+def _worker(connection, results) -> None:
+    """The tracking process. Frames and commands arrive on connection, positions go back on results.
+
+    Only the newest frame is ever tracked: every message waiting is read before each frame, so a slow pass skips
+    frames rather than falling further behind.
+    """
+    ring = None
+    roi = None
+    scale = 1.0
+    size = (0, 0)
+    followers: dict[int, _Follower] = {}
+    latest = 0
+    processed = 0
+    reported = set()
+
+    def setRoi(new_roi):
+        nonlocal roi, scale, size
+        x, y, w, h = new_roi
+        rows, columns = ring.shape
+        x = min(max(0, x), columns - 16)
+        y = min(max(0, y), rows - 16)
+        roi = (x, y, min(w, columns - x), min(h, rows - y))
+        scale = min(1.0, WORK_WIDTH / roi[2])
+        size = (max(1, round(roi[2] * scale)), max(1, round(roi[3] * scale)))
+        for follower in followers.values():
+            follower.tracker = None
+
+    requested_roi = None
+    running = True
+    while running:
+        messages = [connection.recv()]
+        while connection.poll():
+            messages.append(connection.recv())
+        for message in messages:
+            command = message[0]
+            if command == "frame":
+                latest = message[1]
+            elif command == "frames":
+                if ring is not None:
+                    ring.close()
+                ring = FrameRing.attach(message[1])
+                latest = processed = 0
+                setRoi(requested_roi or (0, 0, ring.shape[1], ring.shape[0]))
+            elif command == "roi":
+                requested_roi = message[1]
+                if ring is not None:
+                    setRoi(requested_roi)
+            elif command == "follow":
+                followers[message[1]] = _Follower(message[2], message[3])
+            elif command == "release":
+                followers.pop(message[1], None)
+            elif command == "stop":
+                running = False
+
+        if not running or ring is None or latest == processed or not followers:
+            continue
+        processed = latest
+        start = time.perf_counter()
+        frame = ring.read(latest)
+        if frame is None:
+            continue
+        t, view = frame
+        x, y, w, h = roi
+        image = cv.resize(view[y : y + h, x : x + w], size, interpolation=cv.INTER_AREA)
+        del view
+        if not ring.valid(latest):
+            continue  # Overwritten while it was being resized
+        colour = None
+        if any(follower.kind in COLOUR_TRACKERS for follower in followers.values()):
+            colour = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+
+        positions = []
+        lost = []
+        for id, follower in followers.items():
+            if follower.tracker is None:
+                x, y, w, h = follower.box
+                box = (round((x - roi[0]) * scale), round((y - roi[1]) * scale), round(w * scale), round(h * scale))
+                box = (max(0, box[0]), max(0, box[1]), min(box[2], size[0] - 1), min(box[3], size[1] - 1))
+                box = (min(box[0], size[0] - box[2]), min(box[1], size[1] - box[3]), box[2], box[3])
+                follower.tracker, used = createTracker(follower.kind)
+                if used != follower.kind and follower.kind not in reported:
+                    reported.add(follower.kind)
+                    print(f"[info] {follower.kind} tracker is not in this OpenCV build, using {used}")
+                follower.kind = used
+                follower.tracker.init(colour if used in COLOUR_TRACKERS else image, box)
+                ok = True
+            else:
+                try:
+                    ok, box = follower.tracker.update(colour if follower.kind in COLOUR_TRACKERS else image)
+                except cv.error as e:
+                    # Some trackers throw rather than report a loss, for instance KCF once its box leaves the image
+                    print(f"[Error] {follower.kind} tracker failed for track {id}, {e.err}: box {follower.box}")
+                    ok = False
+            if not ok:
+                lost.append(id)
+                continue
+            x, y, w, h = (box[0] / scale + roi[0], box[1] / scale + roi[1], box[2] / scale, box[3] / scale)
+            follower.box = (x, y, w, h)
+            positions.append((id, x + w / 2, y + h / 2))
+        for id in lost:
+            followers.pop(id)
+        results.send((latest, t, time.perf_counter() - start, positions, lost))
+
+    if ring is not None:
+        ring.close()
+    results.close()
+
+
+class _ResultReader(QThread):
+    """Blocks on the worker's results and pushes them straight into the input bus"""
+
+    lost = Signal(int)  # track id
+
+    def __init__(self, results, bus: InputBus, parent=None):
+        QThread.__init__(self, parent)
+        self.results = results
+        self.bus = bus
+        self.frames = 0
+        self.skipped = 0  # Frames the worker never got to because it was still busy
+        self.process_time = 0.0  # seconds per frame, exponential moving average
+        self._last_seq = 0
+
+    def run(self):
+        while True:
+            try:
+                seq, t, elapsed, positions, lost = self.results.recv()
+            except (EOFError, OSError):
+                break
+            if self._last_seq and seq > self._last_seq:
+                self.skipped += seq - self._last_seq - 1
+            self._last_seq = seq
+            self.frames += 1
+            self.process_time += (elapsed - self.process_time) * 0.05
+            for id, x, y in positions:
+                self.bus.push(autoFollowSource(id), x, y, t)
+            for id in lost:
+                self.lost.emit(id)
+
+
+class AutoTracker(QObject):
+    """Follows performers in the camera image and feeds their positions to the input bus.
+
+    Frames from a FrameTap are copied into shared memory only while at least one track is following, and tracked in a separate process
+    so neither the GUI nor the output threads compete with OpenCV for the GIL. Each followed track gets its own
+    "Auto follow" bus source, so the operator grabs control back by routing the track to its usual device again.
+    """
+
+    lost = Signal(int)  # track id, the tracker lost the performer and stopped following
+
+    def __init__(self, bus: InputBus, parent=None):
+        super().__init__(parent)
+        self.bus = bus
+        self._ring = None
+        self._resolution = QSize(1280, 720)
+        self._roi = None
+        self._following: set[int] = set()
+        self._send_lock = threading.Lock()
+
+        context = multiprocessing.get_context("spawn")
+        self._connection, worker_connection = context.Pipe()
+        results, worker_results = context.Pipe(duplex=False)
+        self.process = context.Process(target=_worker, args=(worker_connection, worker_results), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        worker_results.close()
+
+        self.reader = _ResultReader(results, bus)
+        self.reader.lost.connect(self.onLost)
+        self.reader.start()
+
+    @Slot(QSize)
+    def setResolution(self, size: QSize) -> None:
+        self._resolution = size
+
+    def setRoi(self, roi: tuple[int, int, int, int]) -> None:
+        """(x, y, w, h) in frame pixels, see stageRoi"""
+        self._roi = roi
+        self._send(("roi", roi))
+
+    def follow(self, id: int, point, kind: str = TRACKER_TYPES[0]) -> None:
+        """Start (or restart) following whatever is at the screen point, for instance where the track is now"""
+        height = self._resolution.height()
+        w = BOX_SIZE[0] * height
+        h = BOX_SIZE[1] * height
+        self.bus.addSource(autoFollowSource(id))
+        self._following.add(id)
+        self._send(("follow", id, kind, (float(point[0]) - w / 2, float(point[1]) - h / 2, w, h)))
+
+    def release(self, id: int) -> None:
+        self._following.discard(id)
+        self._send(("release", id))
+
+    def following(self, id: int) -> bool:
+        return id in self._following
+
+    @Slot(int)
+    def onLost(self, id: int) -> None:
+        if id in self._following:
+            self._following.discard(id)
+            self.lost.emit(id)
+
+    def active(self) -> bool:
+        return bool(self._following)
+
+    def onFrame(self, frame: TappedFrame) -> None:
+        """FrameTap consumer, runs on the tap's thread"""
+        if frame.gray is not None:
+            self.pushGray(frame.gray, frame.t)
+
+    def pushGray(self, gray: np.ndarray, t: float | None = None) -> None:
+        """Only ever called from one thread at a time"""
+        if not self._following:
+            return
+        if self._ring is None or self._ring.shape != gray.shape:
+            if self._ring is not None:
+                self._ring.close()  # The worker keeps its mapping until it has switched over
+            self._ring = FrameRing.create(gray.shape, SLOTS)
+            self._resolution = QSize(gray.shape[1], gray.shape[0])
+            self._send(("frames", self._ring.name))
+        seq = self._ring.write(gray, t)
+        self._send(("frame", seq))
+
+    def _send(self, message: tuple) -> None:
+        with self._send_lock:  # Frames come from the tap's thread, commands from the GUI thread
+            self._connection.send(message)
+
+    def stop(self) -> None:
+        if self.process.is_alive():
+            self._send(("stop",))
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.reader.wait()
+        self._connection.close()
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+
+if __name__ == "__main__":
+    import sys
+
+    from PySide6.QtCore import QCoreApplication
+
+    app = QCoreApplication([])
+
+    # Four performers crossing a noisy 1080p stage at camera rate
+    rng = np.random.default_rng(0)
+    background = cv.GaussianBlur(rng.integers(0, 256, (1080, 1920), dtype=np.uint8), (0, 0), 3)
+    starts = np.array([[300.0, 500.0], [700.0, 600.0], [1100.0, 550.0], [1500.0, 650.0]])
+    velocities = np.array([[240.0, 0.0], [-180.0, 60.0], [150.0, -90.0], [-240.0, 30.0]])  # pixels per second
+    figure = np.zeros((int(BOX_SIZE[1] * 1080), int(BOX_SIZE[0] * 1080)), dtype=np.uint8)
+    cv.ellipse(figure, (figure.shape[1] // 2, figure.shape[0] // 2), (figure.shape[1] // 3, figure.shape[0] // 2 - 4), 0, 0, 360, 255, -1)
+    cv.circle(figure, (figure.shape[1] // 2, figure.shape[0] // 5), figure.shape[1] // 4, 90, -1)
+
+    def render(t):
+        frame = background.copy()
+        centres = starts + velocities * t
+        for cx, cy in centres:
+            x = int(cx) - figure.shape[1] // 2
+            y = int(cy) - figure.shape[0] // 2
+            region = frame[y : y + figure.shape[0], x : x + figure.shape[1]]
+            np.maximum(region, figure, out=region)
+        return frame, centres
+
+    seconds = 3
+    frames = [render(i / 60) for i in range(seconds * 60)]
+
+    def benchmark(kind: str) -> None:
+        bus = InputBus()
+        tracker = AutoTracker(bus)
+        tracker.setResolution(QSize(1920, 1080))
+        tracker.setRoi(stageRoi(np.array([[100, 300], [1800, 300], [1800, 900], [100, 900]]), 1920, 1080))
+        for id, start in enumerate(starts):
+            tracker.follow(id, start, kind)
+        time.sleep(1)  # Let the worker finish importing
+
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+        for i, (frame, _) in enumerate(frames):
+            tracker.pushGray(frame, wall_start + i / 60)
+            time.sleep(max(0.0, wall_start + (i + 1) / 60 - time.monotonic()))
+        producer_cpu = (time.process_time() - cpu_start) / seconds
+        time.sleep(0.2)
+
+        errors = []
+        for id in range(len(starts)):
+            samples = bus.sources[autoFollowSource(id)].drain()
+            if not len(samples):
+                errors.append(np.inf)
+                continue
+            t, x, y = samples[-1]
+            index = min(round((t - wall_start) * 60), len(frames) - 1)
+            errors.append(np.hypot(*(frames[index][1][id] - (x, y))))
+        reader = tracker.reader
+        tracker.stop()
+
+        print(f"{kind}, 4 tracks: tracked {reader.frames}/{len(frames)} frames, {reader.skipped} skipped")
+        print(f"  Worker {reader.process_time * 1000:.2f}ms per frame, producer thread {producer_cpu * 100:.1f}% CPU")
+        print(f"  Final errors {np.round(errors, 1)} pixels")
+        if kind == TRACKER_TYPES[0]:  # The default has to keep up with camera rate
+            assert reader.frames >= 0.95 * len(frames)
+            assert max(errors) < 15
+
+    # Every tracker this build has, or the ones named on the command line
+    for kind in sys.argv[1:] or availableTrackers():
+        benchmark(kind)
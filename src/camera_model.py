@@ -0,0 +1,198 @@
+from pathlib import Path
+
+import numpy as np
+
+
+def rodrigues(r_vec: np.ndarray) -> np.ndarray:
+    """Rotation vector -> 3x3 rotation matrix, same convention as cv.Rodrigues"""
+    r_vec = np.asarray(r_vec, dtype=np.float64).reshape(3)
+    theta = np.linalg.norm(r_vec)
+    if theta < 1e-12:
+        return np.identity(3)
+    k = r_vec / theta
+    K = np.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    return np.identity(3) + np.sin(theta) * K + (1 - np.cos(theta)) * (K @ K)
+
+
+class CameraModel:
+    """Pinhole camera with OpenCV's 4/5 coefficient (k1, k2, p1, p2[, k3]) distortion model in plain NumPy.
+
+    Undistortion uses a fixed number of Newton iterations rather than OpenCV's default fixed-point scheme, so strongly
+    distorted image corners converge fully. Run this file for a parity check against OpenCV and a per-point benchmark.
+    """
+
+    undistort_iterations = 8
+
+    def __init__(self, camera_matrix: np.ndarray, camera_dist: np.ndarray | None = None):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.camera_dist = np.zeros(5) if camera_dist is None else np.asarray(camera_dist, dtype=np.float64).ravel()
+
+        self.fx = self.camera_matrix[0, 0]
+        self.fy = self.camera_matrix[1, 1]
+        self.cx = self.camera_matrix[0, 2]
+        self.cy = self.camera_matrix[1, 2]
+        coeffs = np.zeros(5)
+        coeffs[: min(5, len(self.camera_dist))] = self.camera_dist[:5]
+        self.k1, self.k2, self.p1, self.p2, self.k3 = coeffs
+        self.has_distortion = bool(coeffs.any())
+
+        self._r_vec_key = None
+        self._rot_m = np.identity(3)
+
+    @classmethod
+    def load(cls, folder: Path) -> "CameraModel | None":
+        """Load calibration_matrix.npy and distortion_coefficients.npy from a calibration folder"""
+        try:
+            camera_matrix = np.load(str((folder / "calibration_matrix.npy").absolute()))
+            camera_dist = np.load(str((folder / "distortion_coefficients.npy").absolute()))
+        except FileNotFoundError:
+            return None
+        return cls(camera_matrix, camera_dist)
+
+    def distort(self, points: np.ndarray) -> np.ndarray:
+        """Apply distortion to an (N, 2) array of normalised camera plane points"""
+        x = points[:, 0]
+        y = points[:, 1]
+        r2 = x * x + y * y
+        radial = 1 + r2 * (self.k1 + r2 * (self.k2 + r2 * self.k3))
+        xy = x * y
+        result = np.empty_like(points)
+        result[:, 0] = x * radial + 2 * self.p1 * xy + self.p2 * (r2 + 2 * x * x)
+        result[:, 1] = y * radial + self.p1 * (r2 + 2 * y * y) + 2 * self.p2 * xy
+        return result
+
+    def undistort(self, pixels: np.ndarray) -> np.ndarray:
+        """(N, 2) pixel coordinates -> undistorted normalised camera plane points.
+
+        Inverts the distortion with a fixed number of Newton iterations so the cost is constant per point.
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        distorted = np.empty_like(pixels)
+        distorted[:, 0] = (pixels[:, 0] - self.cx) / self.fx
+        distorted[:, 1] = (pixels[:, 1] - self.cy) / self.fy
+        if not self.has_distortion:
+            return distorted
+
+        k1, k2, k3, p1, p2 = self.k1, self.k2, self.k3, self.p1, self.p2
+        x = distorted[:, 0].copy()
+        y = distorted[:, 1].copy()
+        for _ in range(self.undistort_iterations):
+            r2 = x * x + y * y
+            radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+            d_radial = k1 + r2 * (2 * k2 + r2 * 3 * k3)  # d(radial) / d(r2)
+            xy = x * y
+            ex = x * radial + 2 * p1 * xy + p2 * (r2 + 2 * x * x) - distorted[:, 0]
+            ey = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * xy - distorted[:, 1]
+
+            # Jacobian of the distortion function
+            j00 = radial + 2 * x * x * d_radial + 2 * p1 * y + 6 * p2 * x
+            j01 = 2 * xy * d_radial + 2 * p1 * x + 2 * p2 * y
+            j10 = 2 * xy * d_radial + 2 * p1 * x + 2 * p2 * y
+            j11 = radial + 2 * y * y * d_radial + 6 * p1 * y + 2 * p2 * x
+            det = j00 * j11 - j01 * j10
+
+            x -= (j11 * ex - j01 * ey) / det
+            y -= (j00 * ey - j10 * ex) / det
+
+        return np.stack((x, y), axis=1)
+
+    def undistortPixels(self, pixels: np.ndarray) -> np.ndarray:
+        """Equivalent of cv.undistortPoints(..., P=camera_matrix): undistorted points back in pixel coordinates"""
+        points = self.undistort(pixels)
+        points[:, 0] = points[:, 0] * self.fx + self.cx
+        points[:, 1] = points[:, 1] * self.fy + self.cy
+        return points
+
+    def distortPixels(self, pixels: np.ndarray) -> np.ndarray:
+        """Inverse of undistortPixels: undistorted pixel coordinates -> where they appear in the raw image"""
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        points = np.empty_like(pixels)
+        points[:, 0] = (pixels[:, 0] - self.cx) / self.fx
+        points[:, 1] = (pixels[:, 1] - self.cy) / self.fy
+        if self.has_distortion:
+            points = self.distort(points)
+        points[:, 0] = points[:, 0] * self.fx + self.cx
+        points[:, 1] = points[:, 1] * self.fy + self.cy
+        return points
+
+    def project(self, points: np.ndarray, r_vec: np.ndarray, t_vec: np.ndarray) -> np.ndarray:
+        """Equivalent of cv.projectPoints: (N, 3) world points -> (N, 2) distorted pixel coordinates"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        r_vec_key = np.asarray(r_vec, dtype=np.float64).tobytes()
+        if r_vec_key != self._r_vec_key:
+            self._rot_m = rodrigues(r_vec)
+            self._r_vec_key = r_vec_key
+
+        cam = points @ self._rot_m.T + np.asarray(t_vec, dtype=np.float64).reshape(3)
+        normalised = cam[:, :2] / cam[:, 2:3]
+        if self.has_distortion:
+            normalised = self.distort(normalised)
+        normalised[:, 0] = normalised[:, 0] * self.fx + self.cx
+        normalised[:, 1] = normalised[:, 1] * self.fy + self.cy
+        return normalised
+
+
+if __name__ == "__main__":
+    import time
+
+    import cv2 as cv
+
+    camera_matrix = np.array([[1100.0, 0, 640], [0, 1050.0, 360], [0, 0, 1]])
+    rng = np.random.default_rng(0)
+    pixels = rng.random((2000, 2)) * [1280, 720]
+    r_vec = np.array([[-2.2], [0.1], [0.05]])
+    t_vec = np.array([[100.0], [3000.0], [12000.0]])
+    world = np.concatenate((rng.random((2000, 2)) * [8000, 6000] - [4000, 11000], np.zeros((2000, 1))), axis=1)
+
+    # Parity against OpenCV for both the 4 and 5 coefficient models
+    for camera_dist in (np.array([-0.12, 0.05, 0.001, -0.0005]), np.array([0.08, -0.2, -0.001, 0.002, 0.1])):
+        camera = CameraModel(camera_matrix, camera_dist)
+
+        assert np.allclose(rodrigues(r_vec), cv.Rodrigues(r_vec)[0])
+
+        ours = camera.project(world, r_vec, t_vec)
+        theirs = cv.projectPoints(world, r_vec, t_vec, camera_matrix, camera_dist)[0].reshape(-1, 2)
+        assert np.abs(ours - theirs).max() < 1e-6, np.abs(ours - theirs).max()
+
+        ours = camera.undistort(pixels)
+        criteria = (cv.TERM_CRITERIA_COUNT | cv.TERM_CRITERIA_EPS, 100, 1e-12)
+        theirs = cv.undistortPointsIter(
+            pixels.reshape(-1, 1, 2), camera_matrix, camera_dist, None, None, criteria
+        ).reshape(-1, 2)
+        assert np.abs(ours - theirs).max() * camera.fx < 1e-3, np.abs(ours - theirs).max() * camera.fx
+
+        # Round trip: undistort then distort should land back on the original pixel
+        round_trip = camera.distort(ours) * [camera.fx, camera.fy] + [camera.cx, camera.cy]
+        assert np.abs(round_trip - pixels).max() < 1e-6
+
+        assert np.abs(camera.undistortPixels(pixels) - (ours * [camera.fx, camera.fy] + [camera.cx, camera.cy])).max() < 1e-9
+        assert np.abs(camera.distortPixels(camera.undistortPixels(pixels)) - pixels).max() < 1e-6
+
+    # Per point microbenchmark, single points being the common case in the GUI
+    camera_dist = np.array([-0.12, 0.05, 0.001, -0.0005])
+    camera = CameraModel(camera_matrix, camera_dist)
+    repeats = 2000
+    single_pixel = pixels[:1]
+    single_world = world[:1]
+
+    def bench(fn):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - start) / repeats * 1e6
+
+    cv_undistort = bench(lambda: cv.undistortPoints(single_pixel.reshape(-1, 1, 2), camera_matrix, camera_dist))
+    np_undistort = bench(lambda: camera.undistort(single_pixel))
+    cv_project = bench(lambda: cv.projectPoints(single_world, r_vec, t_vec, camera_matrix, camera_dist))
+    np_project = bench(lambda: camera.project(single_world, r_vec, t_vec))
+    print(f"undistort 1 point: OpenCV {cv_undistort:.1f}us, NumPy {np_undistort:.1f}us")
+    print(f"project 1 point:   OpenCV {cv_project:.1f}us, NumPy {np_project:.1f}us")
+
+    many_pixels = rng.random((1_000_000, 2)) * [1280, 720]
+    start = time.perf_counter()
+    cv.undistortPoints(many_pixels.reshape(-1, 1, 2), camera_matrix, camera_dist)
+    cv_batch = time.perf_counter() - start
+    start = time.perf_counter()
+    camera.undistort(many_pixels)
+    np_batch = time.perf_counter() - start
+    print(f"undistort 1M points: OpenCV {cv_batch * 1e3:.0f}ms, NumPy {np_batch * 1e3:.0f}ms")
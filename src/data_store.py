@@ -1,14 +1,24 @@
-import pickle
+import threading
+import time
 from typing import Tuple
 
-from PySide6.QtCore import Signal, Slot, Qt, QPoint, QObject, QAbstractListModel
+from PySide6.QtCore import Signal, Slot, QPoint, QObject, QSize, QTimer
 from PySide6.QtGui import QVector2D, QVector3D
-from PySide6.QtWidgets import QLabel, QWidget, QVBoxLayout, QLineEdit, QComboBox
 from pathlib import Path
 import numpy as np
 import cv2 as cv
 
-from plane_ray_intersection import planeRayIntersection
+from camera_model import CameraModel
+from plane_ray_intersection import planeRayIntersections
+from image_point_to_ray import imagePointsToRays
+from input_bus import InputBus, autoFollowSource, spaceMouseSource
+from latency import pipeline
+from pixel_lookup_table import PixelLookupTable
+from response_curve import ResponseCurve
+from show_file import ShowFile, ShowFileError, loadShow, writeShow
+from startup_timer import startup
+from track_projection import TrackProjector
+from track_store import OWNER_AUTO_FOLLOW, OWNER_INPUT, TrackStore
 
 # import ptvsd  # ptvsd.debug_this_thread()
 
@@ -25,26 +35,102 @@ class HomographyPoint:
 
 
 class Track:
+    # Class level defaults so tracks saved before these existed still load
+    filter = "One-Euro"
+    smoothing = 0.0
+    response_curve = ResponseCurve()
+    tracker = "Template"
+
     def __init__(self, name: str):
         self.name = name
         self.input_device = ""
         self.height_offset = 0.0
+        self.filter = "One-Euro"  # One of track_filter.FILTER_TYPES
+        self.smoothing = 0.0
+        self.response_curve = ResponseCurve()  # Replaced rather than modified, see ResponseCurve
+        self.tracker = "Template"  # One of auto_tracker.TRACKER_TYPES
+
+
+class Fixture:
+    # Class level defaults so fixtures saved before these existed still load
+    orientation = QVector3D()  # degrees about x, y then z, zero is hung pointing straight down
+    invert_pan = False
+    invert_tilt = False
+    calibration_samples: dict = {}  # Homography point name -> (pan, tilt) the fixture was aimed at it with, never mutated
+
+    def __init__(
+        self,
+        name: str,
+        universe: int = 1,
+        address: int = 1,
+        position=QVector3D(),
+        pan_range: float = 540.0,
+        tilt_range: float = 270.0,
+        track: int = 0,
+        orientation=QVector3D(),
+        invert_pan: bool = False,
+        invert_tilt: bool = False,
+    ):
+        self.name = name
+        self.universe = universe
+        self.address = address  # 1-based DMX start address
+        self.position = position  # mm, stage coordinates
+        self.pan_range = pan_range  # degrees of travel
+        self.tilt_range = tilt_range
+        self.pan_offset = 0  # 16 bit pan coarse/fine channels relative to the start address
+        self.tilt_offset = 2
+        self.track = track
+        self.orientation = orientation
+        self.invert_pan = invert_pan
+        self.invert_tilt = invert_tilt
+
+    def __format__(self, format_spec):
+        p = f"({round(self.position.x(), 2)}, {round(self.position.y(), 2)}, {round(self.position.z(), 2)})"
+        return f"U{self.universe}.{self.address} {p} -> Track {self.track}"
+
+
+def solvePose(src: np.ndarray, dst: np.ndarray, camera_matrix: np.ndarray, camera_dist: np.ndarray | None):
+    """(N, 2) float32 pixel and (N, 3) float32 stage positions of the homography points -> r_vec, t_vec, camera_inv"""
+    # If calibrated camera, account for distortion parameters:
+    if camera_matrix is not None:
+        src = cv.undistortPoints(np.expand_dims(src, axis=1), camera_matrix, camera_dist, None, camera_matrix)
+
+    # Calculate relation between real world planar surface of stage and imaging plane (camera sensor)
+    success, r_vec, t_vec = cv.solvePnP(
+        objectPoints=dst,
+        imagePoints=src,
+        cameraMatrix=camera_matrix,
+        distCoeffs=camera_dist,
+        flags=cv.SOLVEPNP_IPPE,
+    )
+
+    rot_m = cv.Rodrigues(r_vec)[0]
+
+    cam_pos = -np.matrix(rot_m).T * np.matrix(t_vec)
+    cam_pos = np.array(cam_pos.T.tolist()[0])
+    print("\nCamera position within stage system: \n", cam_pos)
+
+    transform_M_i = np.empty((4, 4))
+    transform_M_i[:3, :3] = rot_m.T
+    transform_M_i[:3, 3] = cam_pos
+    transform_M_i[3, :] = [0, 0, 0, 1]
+    return r_vec, t_vec, transform_M_i
+
+
+DISPLAY_PERIOD = 16  # ms, GUI track updates are coalesced to at most one per display refresh
 
 
 class DataStore(QObject):
-    track_changed = Signal(int, QVector3D)  # id, screen space pos
+    tracks_moved = Signal(object, object, object)  # (N,) ids, (N, 3) stage positions, (N,) input times, every batch
+    tracks_updated = Signal(object)  # (N,) ids of the tracks that moved since the last one, once per display refresh
     homography_points_changed = Signal(object)  # The dictionary of homography points
-
-    serialise_attributes = [
-        "_camera_dist",
-        "_camera_matrix",
-        "_camera_inv",
-        "_homography_points",
-        "_t_vec",
-        "_r_vec",
-        "_height_offset",
-        "tracks",
-    ]
+    fixtures_changed = Signal(object)  # The list of fixtures
+    response_curves_changed = Signal(object)  # (devices, 4, TABLE_SIZE) SpaceMouse response curve tables
+    height_offset_changed = Signal(float)  # Only when a show file is loaded, setHeightOffset doesn't echo
+    track_added = Signal(int)  # id
+    track_removed = Signal(int)  # id, may be reused by a later track
+    show_loaded = Signal(str)  # Path of the show, empty if there wasn't one, after a load has been applied
+    _load_finished = Signal(int, object)  # Load generation and what readShow returned, from the loading thread
 
     def __init__(self):
         super().__init__()
@@ -57,32 +143,53 @@ class DataStore(QObject):
             # "DSL": HomographyPoint(QVector3D(3000, -11000, 0), QVector2D(801, 676)),
             # "DSR": HomographyPoint(QVector3D(-3000, -11000, 0), QVector2D(70, 410)),
         }
-        self._tracks = [QVector3D(), QVector3D()]
         self._camera_inv = None  # np.identity(3, dtype=np.float32)
-        self._camera_matrix = np.identity(3, dtype=np.float32)  # 3x3 camera matrix
-        self._camera_dist = np.zeros(4, dtype=np.float32)  # 4 vector of distortion coefficients
+        # Loaded from calibration_files with the first show, see loadInBackground
+        self._camera_matrix = None  # 3x3 camera matrix
+        self._camera_dist = None  # 4 vector of distortion coefficients
+        self.calibration_loaded = False
         self._r_vec = None
         self._t_vec = None
 
-        self.tracks: list[Track] = [Track("Default track"), Track("Default track 2")]
+        # Per track settings, indexed by track id with None where a track was removed. Live positions are in track_store.
+        self.tracks: list[Track | None] = [Track("Default track"), Track("Default track 2")]
+        self.track_store = TrackStore()
+        for _ in self.tracks:
+            self.track_store.add()
+        self.fixtures: list[Fixture] = []
+        self.space_mouse_count = 2  # Until a reader says otherwise, see setSpaceMouseCount
 
         self._height_offset = 0.0
+        # The show file last loaded or saved, kept open for any sections this version doesn't use, see showSection
+        self.show_file: ShowFile | None = None
 
-        # Attempt to load camera calibration numpy saved files
-        calibration_matrix_file_dir = str((self.src_folder / "calibration_files" / "calibration_matrix.npy").absolute())
-        distortion_coefficients_file_dir = str(
-            (self.src_folder / "calibration_files" / "distortion_coefficients.npy").absolute()
-        )
-        try:
-            self._camera_matrix = np.load(calibration_matrix_file_dir)
-            self._camera_dist = np.load(distortion_coefficients_file_dir)
-            print("\n[info] Camera Calibration Matrix Imported: \n", self._camera_matrix)
-        except FileNotFoundError:
-            self._camera_matrix = None
-            self._camera_dist = None
-            print("\n[info] Camera Calibration Matrix Could Not Be Imported")
+        # Editing state, set by whichever front end is attached. While editing homography points, clicks move the
+        # selected point instead of the tracks.
+        self.edit_homography_points = False
+        self.selected_homography_point: str | None = None
+
+        # Constant time pixel -> stage lookups, rebuilt in the background whenever the calibration changes
+        self.pixel_lookup = PixelLookupTable(self.src_folder.parent / "Projects" / ".cache")
+
+        # Bumped whenever anything affecting the screen <-> world mapping changes
+        self._calibration_version = 0
+        self.track_projector = TrackProjector()
 
-        self.update_homography()
+        # Tracks moved since the last tracks_updated, as the id arrays of each batch
+        self._dirty_ids: list[np.ndarray] = []
+        self.display_timer = QTimer(self)
+        self.display_timer.setSingleShot(True)
+        self.display_timer.setInterval(DISPLAY_PERIOD)
+        self.display_timer.timeout.connect(self.flushTrackUpdates)
+
+        # Every input device pushes here, tracks are updated from it in one batch per output tick
+        self.input_bus = InputBus(self)
+        self.updateTrackSources()
+        self.input_bus.tracks_input.connect(self.setTracks)
+
+        # Shows load on a thread of their own, the newest load is the only one applied
+        self._load_generation = 0
+        self._load_finished.connect(self._applyLoad)
 
     def write_previous_config(self, filename: str):
         conf_filename = self.src_folder.parent / "Projects/.conf"
@@ -93,47 +200,285 @@ class DataStore(QObject):
         file.write(filename)
         file.close()
 
-    def find_previous_config(self):
+    def find_previous_config(self) -> Path | None:
         conf_filename = self.src_folder.parent / "Projects/.conf"
         try:
             file = open(conf_filename, "r")
         except FileNotFoundError:
-            return
+            return None
         contents = file.readline()
         file.close()
 
         my_file = Path(contents)
         if my_file.is_file():
-            self.deserialise(str(my_file))
-        else:
-            print("Cannot find file:", my_file)
+            return my_file
+        print("Cannot find file:", my_file)
+        return None
+
+    def showContents(self) -> dict:
+        """Everything saved in a show file, as the plain values show_file writes"""
+        tracks = []
+        for track in self.tracks:
+            if track is None:
+                tracks.append(None)
+                continue
+            curve = track.response_curve
+            tracks.append(
+                {
+                    "name": track.name,
+                    "input_device": track.input_device,
+                    "filter": track.filter,
+                    "tracker": track.tracker,
+                    "height_offset": track.height_offset,
+                    "smoothing": track.smoothing,
+                    "curve_expo": curve.expo,
+                    "curve_dead_zone": curve.dead_zone,
+                    "curve_gain": curve.gain,
+                    "curve_max_speed": curve.max_speed,
+                }
+            )
+        fixtures = []
+        for f in self.fixtures:
+            fixtures.append(
+                {
+                    "name": f.name,
+                    "position_x": f.position.x(),
+                    "position_y": f.position.y(),
+                    "position_z": f.position.z(),
+                    "orientation_x": f.orientation.x(),
+                    "orientation_y": f.orientation.y(),
+                    "orientation_z": f.orientation.z(),
+                    "pan_range": f.pan_range,
+                    "tilt_range": f.tilt_range,
+                    "universe": f.universe,
+                    "address": f.address,
+                    "pan_offset": f.pan_offset,
+                    "tilt_offset": f.tilt_offset,
+                    "track": f.track,
+                    "invert_pan": f.invert_pan,
+                    "invert_tilt": f.invert_tilt,
+                    "calibration_samples": f.calibration_samples,
+                }
+            )
+        points = {
+            name: ((p.world_coord.x(), p.world_coord.y(), p.world_coord.z()), (p.screen_coord.x(), p.screen_coord.y()))
+            for name, p in self._homography_points.items()
+        }
+        calibration = {
+            "camera_matrix": self._camera_matrix,
+            "camera_dist": self._camera_dist,
+            "camera_inv": self._camera_inv,
+            "r_vec": self._r_vec,
+            "t_vec": self._t_vec,
+        }
+        return {
+            "height_offset": self._height_offset,
+            "calibration": calibration,
+            "homography_points": points,
+            "tracks": tracks,
+            "fixtures": fixtures,
+        }
 
+    def applyShowContents(self, contents: dict) -> None:
+        # Imported pickles leave out what they didn't save, which keeps what was loaded from calibration_files
+        for name, value in contents["calibration"].items():
+            setattr(self, f"_{name}", value)
+        self._height_offset = contents["height_offset"]
+        self._homography_points = {
+            name: HomographyPoint(QVector3D(*world), QVector2D(*screen))
+            for name, (world, screen) in contents["homography_points"].items()
+        }
 
-    def serialise(self):
-        return {a: getattr(self, a) for a in self.serialise_attributes}
+        self.tracks = []
+        for fields in contents["tracks"]:
+            if fields is None:
+                self.tracks.append(None)
+                continue
+            track = Track(fields["name"])
+            track.input_device = fields["input_device"]
+            track.filter = fields["filter"]
+            track.tracker = fields["tracker"]
+            track.height_offset = fields["height_offset"]
+            track.smoothing = fields["smoothing"]
+            track.response_curve = ResponseCurve(
+                fields["curve_expo"], fields["curve_dead_zone"], fields["curve_gain"], fields["curve_max_speed"]
+            )
+            self.tracks.append(track)
+
+        self.fixtures = []
+        for fields in contents["fixtures"]:
+            fixture = Fixture(
+                fields["name"],
+                fields["universe"],
+                fields["address"],
+                QVector3D(fields["position_x"], fields["position_y"], fields["position_z"]),
+                fields["pan_range"],
+                fields["tilt_range"],
+                fields["track"],
+                QVector3D(fields["orientation_x"], fields["orientation_y"], fields["orientation_z"]),
+                fields["invert_pan"],
+                fields["invert_tilt"],
+            )
+            fixture.pan_offset = fields["pan_offset"]
+            fixture.tilt_offset = fields["tilt_offset"]
+            fixture.calibration_samples = fields["calibration_samples"]
+            self.fixtures.append(fixture)
+
+    def showSection(self, name: str) -> np.ndarray | None:
+        """A section of the show file that isn't part of the show itself, memory mapped rather than read"""
+        if self.show_file is None:
+            return None
+        return self.show_file.section(name)
 
-    def deserialise(self, fileName):
+    def save(self, fileName) -> None:
+        extra = {}
+        if self.show_file is not None:
+            extra = {name: self.show_file.section(name) for name in self.show_file.extraSections()}
         try:
-            file = open(fileName, "rb")
-        except FileNotFoundError:
+            writeShow(fileName, self.showContents(), extra)
+        except OSError as e:
+            print("[Error] Couldn't save", fileName, e)
             return
-        attributes = pickle.load(file)
-        file.close()
-        for a in self.serialise_attributes:
-            if a in attributes:
-                setattr(self, a, attributes[a])
-                if a == "_height_offset":
-                    self.parent().geometry_settings_dock.height_offset.setValue(attributes[a])
-        self.broadcast()
+        self.show_file = ShowFile.open(fileName)
+
+    def loadInBackground(self, fileName=None) -> None:
+        """Load a show file, or the last one opened, on another thread and apply it all at once when it's read.
+
+        The first load also reads the camera calibration. show_loaded is emitted once it's applied, a newer load
+        replaces one that hasn't finished yet.
+        """
+        self._load_generation += 1
+        args = (self._load_generation, fileName, not self.calibration_loaded)
+        threading.Thread(target=self._loadThread, args=args, name="Show loader", daemon=True).start()
+
+    def _loadThread(self, generation: int, fileName, calibration: bool) -> None:
+        # Whatever goes wrong the load has to finish, the GUI waits for show_loaded to get its calibration
+        loaded = {"path": fileName, "camera": None, "show_file": None, "contents": None}
+        try:
+            if fileName is None:
+                with startup.phase("Finding the previous show"):
+                    fileName = self.find_previous_config()
+            loaded = self.readShow(fileName, calibration)
+        except Exception as e:
+            print("[Error] Couldn't load", fileName, repr(e))
+        finally:
+            self._load_finished.emit(generation, loaded)
+
+    @Slot(int, object)
+    def _applyLoad(self, generation: int, loaded: dict) -> None:
+        if generation == self._load_generation:
+            self.applyLoad(loaded)
+
+    def readShow(self, fileName, calibration: bool) -> dict:
+        """Everything loading fileName changes, read without touching the data store so it's safe on any thread"""
+        loaded = {"path": fileName, "camera": None, "show_file": None, "contents": None}
+        if calibration:
+            with startup.phase("Loading the camera calibration"):
+                loaded["camera"] = CameraModel.load(self.src_folder / "calibration_files")
+        if fileName is None:
+            return loaded
+
+        try:
+            with startup.phase("Reading the show file"):
+                show = loadShow(fileName)
+                if isinstance(show, ShowFile):
+                    loaded["show_file"] = show
+                    show = show.contents()
+                else:
+                    print("[info] Imported an old style show, it will be saved in the new format")
+        except FileNotFoundError:
+            return loaded
+        except (ShowFileError, OSError) as e:
+            print("[Error] Couldn't load", fileName, e)
+            return loaded
+        loaded["contents"] = show
+
+        # Shows saved before the camera was calibrated only have the homography points, solve the pose here too
+        camera = show["calibration"]
+        camera_matrix = camera.get("camera_matrix", self._camera_matrix)
+        if camera_matrix is None and loaded["camera"] is not None:
+            camera_matrix = loaded["camera"].camera_matrix
+            camera.setdefault("camera_dist", loaded["camera"].camera_dist)
+        points = show["homography_points"]
+        if camera.get("camera_inv") is None and camera_matrix is not None and len(points) >= 4:
+            with startup.phase("Solving the camera pose"):
+                screen = np.array([screen for _, screen in points.values()], dtype=np.float32)
+                world = np.array([world for world, _ in points.values()], dtype=np.float32)
+                pose = solvePose(screen, world, camera_matrix, camera.get("camera_dist", self._camera_dist))
+            camera["r_vec"], camera["t_vec"], camera["camera_inv"] = pose
+        return loaded
+
+    def applyLoad(self, loaded: dict) -> None:
+        with startup.phase("Applying the show"):
+            if loaded["camera"] is not None:
+                self._camera_matrix = loaded["camera"].camera_matrix
+                self._camera_dist = loaded["camera"].camera_dist
+                print("\n[info] Camera Calibration Matrix Imported: \n", self._camera_matrix)
+            elif not self.calibration_loaded:
+                print("\n[info] Camera Calibration Matrix Could Not Be Imported")
+            self.calibration_loaded = True
+
+            contents = loaded["contents"]
+            if contents is not None:
+                self.show_file = loaded["show_file"]
+                for id in self.trackIds():
+                    self.track_store.remove(id)
+                    self.track_removed.emit(id)
+                self.applyShowContents(contents)
+                self.track_store = TrackStore(max(8, len(self.tracks)))
+                for track in self.tracks:
+                    self.track_store.add()
+                for id, track in enumerate(self.tracks):
+                    if track is None:
+                        self.track_store.remove(id)
+                for id in self.trackIds():
+                    self.track_added.emit(id)
+                self.height_offset_changed.emit(self._height_offset)
+                self.updateTrackSources()
+            self.rebuildLookupTable()
+            self.broadcast()
+        self.show_loaded.emit("" if contents is None else str(loaded["path"]))
+        startup.milestone("Show loaded")
+
+    def deserialise(self, fileName):
+        """Load a show file, or a show pickled by versions before show files, on this thread"""
+        self.applyLoad(self.readShow(fileName, not self.calibration_loaded))
 
     def broadcast(self) -> None:
         self.homography_points_changed.emit(self._homography_points)
-        for id in range(len(self._tracks)):
-            self.track_changed.emit(id, self._tracks[id])
+        self.fixtures_changed.emit(self.fixtures)
+        self.response_curves_changed.emit(self.responseCurveTables())
+        ids = self.track_store.ids()
+        self.tracks_moved.emit(ids, self.track_store.position[ids], np.full(len(ids), time.monotonic()))
+        self.markTracksDirty(ids)
+
+    def markTracksDirty(self, ids: np.ndarray) -> None:
+        self._dirty_ids.append(ids)
+        if not self.display_timer.isActive():
+            self.display_timer.start()
+
+    @Slot()
+    def flushTrackUpdates(self) -> None:
+        if not self._dirty_ids:
+            return
+        ids = np.unique(np.concatenate(self._dirty_ids))
+        self._dirty_ids = []
+        ids = ids[self.track_store.alive(ids)]
+        if len(ids):
+            self.tracks_updated.emit(ids)
+
+    @Slot(QSize)
+    def setVideoResolution(self, resolution: QSize) -> None:
+        """The lookup table has one entry per video pixel, so it has to be rebuilt at the camera's resolution"""
+        size = resolution.toTuple()
+        if size != self.pixel_lookup.resolution:
+            self.pixel_lookup.resolution = size
+            self.rebuildLookupTable()
 
     @Slot(float)
     def setHeightOffset(self, height: float):
         self._height_offset = height
+        self.rebuildLookupTable()
         print(height)
 
     @Slot(str, QVector3D)
@@ -144,6 +489,8 @@ class DataStore(QObject):
     def setHomographyPoint(self, existing_name: str, updated_name: str, updated_point: HomographyPoint) -> None:
         self._homography_points.pop(existing_name)
         self._homography_points[updated_name] = updated_point
+        if self.selected_homography_point == existing_name:
+            self.selected_homography_point = updated_name
         self.homography_points_changed.emit(self._homography_points)
 
     @Slot(str)
@@ -151,17 +498,110 @@ class DataStore(QObject):
         self._homography_points.pop(existing_name)
         self.homography_points_changed.emit(self._homography_points)
 
-    @Slot(str, QPoint)
-    def setHomographyScreenPoint(self, point: QPoint) -> None:
-        settings_dock = self.parent().geometry_settings_dock
-
-        if settings_dock.edit_homography_points.checkState() is Qt.CheckState.Unchecked:
+    @Slot(int, str)
+    def setTrackInputDevice(self, id: int, name: str) -> None:
+        self.tracks[id].input_device = name
+        self.updateTrackSources()
+
+    @Slot(int, bool)
+    def setTrackAutoFollow(self, id: int, follow: bool) -> None:
+        if self.track_store.isAlive(id):
+            self.track_store.setOwner(id, OWNER_AUTO_FOLLOW if follow else OWNER_INPUT)
+            self.updateTrackSources()
+
+    def updateTrackSources(self) -> None:
+        owner = self.track_store.owner
+        sources = []
+        for id, track in enumerate(self.tracks):
+            if track is None:
+                sources.append(None)
+            elif owner[id] == OWNER_AUTO_FOLLOW:
+                sources.append(autoFollowSource(id))
+            else:
+                sources.append(track.input_device)
+        self.input_bus.setTrackSources(sources)
+        self.response_curves_changed.emit(self.responseCurveTables())
+
+    @Slot()
+    def addTrack(self, name: str = "") -> int:
+        id = self.track_store.add()
+        track = Track(name or f"Track {id + 1}")
+        if id < len(self.tracks):
+            self.tracks[id] = track
+        else:
+            self.tracks.append(track)
+        self.updateTrackSources()
+        self.track_added.emit(id)
+        return id
+
+    @Slot(int)
+    def removeTrack(self, id: int) -> None:
+        if not self.track_store.isAlive(id):
             return
+        self.track_store.remove(id)
+        self.tracks[id] = None
+        del self.tracks[self.track_store.count :]
+        self.updateTrackSources()
+        self.track_removed.emit(id)
+
+    def trackIds(self) -> list[int]:
+        return self.track_store.ids().tolist()
+
+    @Slot(int, object)
+    def setTrackResponseCurve(self, id: int, curve: ResponseCurve) -> None:
+        self.tracks[id].response_curve = curve
+        self.response_curves_changed.emit(self.responseCurveTables())
+
+    @Slot(int)
+    def setSpaceMouseCount(self, count: int) -> None:
+        """How many SpaceMice the reader has open, each gets an input bus source and a response curve table"""
+        self.space_mouse_count = count
+        for device in range(count):
+            self.input_bus.addSource(spaceMouseSource(device))
+        self.response_curves_changed.emit(self.responseCurveTables())
+
+    def responseCurveTables(self, devices: int | None = None) -> np.ndarray:
+        """Each SpaceMouse takes the curve of the first track following it"""
+        devices = self.space_mouse_count if devices is None else devices
+        curves = [ResponseCurve()] * devices
+        for id in reversed(self.trackIds()):
+            source = self.input_bus.trackSource(id)
+            for device in range(devices):
+                if source == spaceMouseSource(device):
+                    curves[device] = self.tracks[id].response_curve
+        return np.stack([curve.tables() for curve in curves])
+
+    @Slot(Fixture)
+    def addFixture(self, fixture: Fixture) -> None:
+        self.fixtures.append(fixture)
+        self.fixtures_changed.emit(self.fixtures)
+
+    @Slot(int, Fixture)
+    def setFixture(self, index: int, fixture: Fixture) -> None:
+        self.fixtures[index] = fixture
+        self.fixtures_changed.emit(self.fixtures)
+
+    @Slot(int)
+    def removeFixture(self, index: int) -> None:
+        self.fixtures.pop(index)
+        self.fixtures_changed.emit(self.fixtures)
+
+    @Slot(bool)
+    def setEditHomographyPoints(self, edit: bool) -> None:
+        self.edit_homography_points = edit
+
+    @Slot(str)
+    def setSelectedHomographyPoint(self, name: str) -> None:
+        """Name of the point clicks move while editing, names that aren't points (like "Add New") select nothing"""
+        self.selected_homography_point = name or None
 
-        item_widget = settings_dock.list_widget.itemWidget(settings_dock.list_widget.currentItem())
-        name = item_widget.findChildren(QLabel)[0].objectName()
+    @Slot(QPoint)
+    def setHomographyScreenPoint(self, point: QPoint) -> None:
+        if not self.edit_homography_points:
+            return
 
-        if name != "__add_new__":
+        name = self.selected_homography_point
+        if name in self._homography_points:
             self._homography_points[name].screen_coord = point
             if len(self._homography_points) >= 4:
                 self.update_homography()
@@ -169,38 +609,60 @@ class DataStore(QObject):
 
     @Slot(int, QPoint)
     def setTrack(self, id: int, point: QPoint) -> None:
-        if self.parent().geometry_settings_dock.edit_homography_points.checkState() is Qt.CheckState.Unchecked:
-            if id < len(self._tracks):
-                new_target = self.apply_homography(point)
-                if new_target is not None:
-                    self._tracks[id] = new_target
-                    self.track_changed.emit(id, self._tracks[id])
+        self.setTracks([id], np.array([point.toTuple()]))
+
+    def setTracks(self, ids: list[int], screen_points: np.ndarray, input_times: np.ndarray | None = None) -> None:
+        """Map an (N, 2) array of screen points onto the tracks in ids with a single batched homography.
+
+        input_times are the time.monotonic() each point was input, for the latency stats. Defaults to now.
+        """
+        if not self.edit_homography_points:
+            if input_times is None:
+                input_times = np.full(len(ids), time.monotonic())
+            pipeline.recordSince("set_track", input_times.tolist())
+            world_points, valid = self.map_screen_points(screen_points)
+            pipeline.recordSince("homography", input_times.tolist())
+            ids = np.asarray(ids, dtype=np.intp)
+            keep = valid & self.track_store.alive(ids)
+            ids = ids[keep]
+            input_times = input_times[keep]
+            if len(ids):
+                self.track_store.update(ids, world_points[keep], input_times)
+                self.tracks_moved.emit(ids, self.track_store.position[ids], input_times)
+                self.markTracksDirty(ids)
 
     @Slot(QPoint)
     def setTrack0(self, point: QPoint) -> None:
-        if self.parent().geometry_settings_dock.edit_homography_points.checkState() is Qt.CheckState.Unchecked:
-            new_target = self.apply_homography(point)
-            if new_target is not None:
-                self._tracks[0] = new_target
-                self.track_changed.emit(0, self._tracks[0])
+        self.setTrack(0, point)
 
     def getTrack(self, id: int) -> QVector3D:
-        return self._tracks[id]
+        return QVector3D(*self.track_store.position[id])
 
     def getTrack2D(self, id: int) -> Tuple[QVector2D, QVector2D]:
+        c = self.getTracks2D()[id]
+        return (QVector2D(c[0][0], c[0][1]), QVector2D(c[1][0], c[1][1]))
+
+    def getTracks2D(self) -> np.ndarray:
+        """Screen space [ground, target] points of every track as an (N, 2, 2) array"""
         if self._r_vec is not None and self._t_vec is not None:
-            track = self.getTrack(id)
-            pts = np.array([track.x(), track.y(), track.z()])
-            res, _ = cv.projectPoints(pts, self._r_vec, self._t_vec, self._camera_matrix, self._camera_dist)
-            pts = np.array(
-                [track.x(), track.y(), track.z() - self._height_offset * 1000]
-            )  # TODO subtract height offset in here
-            res2, _ = cv.projectPoints(pts, self._r_vec, self._t_vec, self._camera_matrix, self._camera_dist)
-            return (QVector2D(res2[0][0][0], res2[0][0][1]), QVector2D(res[0][0][0], res[0][0][1]))
-        return (QVector2D(0, 0), QVector2D(0, 0))
+            return self.track_projector.project(
+                self.track_store.positions(),
+                self._height_offset,
+                self._r_vec,
+                self._t_vec,
+                self._camera_matrix,
+                self._camera_dist,
+                self._calibration_version,
+            )
+        return np.zeros((self.track_store.count, 2, 2))
+
+    def cameraModel(self) -> CameraModel | None:
+        if self._camera_matrix is None:
+            return None
+        return CameraModel(self._camera_matrix, self._camera_dist)
 
     def getNumTracks(self) -> int:
-        return len(self._tracks)
+        return len(self.trackIds())
 
     def update_homography(self):
         if self._homography_points.items():
@@ -214,72 +676,135 @@ class DataStore(QObject):
             src = np.array(np.array(stage_corners_pixel_locs, dtype=np.float32))
             dst = np.array(np.array(stage_corners_world_geometry, dtype=np.float32))
 
-            # If calibrated camera, account for distortion parameters:
-            if self._camera_matrix is not None:
-                src = cv.undistortPoints(
-                    np.expand_dims(src, axis=1), self._camera_matrix, self._camera_dist, None, self._camera_matrix
-                )
-
-            # Calculate relation between real world planar surface of stage and imaging plane (camera sensor)
-            success, r_vec, t_vec = cv.solvePnP(
-                objectPoints=dst,
-                imagePoints=src,
-                cameraMatrix=self._camera_matrix,
-                distCoeffs=self._camera_dist,
-                flags=cv.SOLVEPNP_IPPE,
-            )
-
-            self._r_vec = r_vec
-            self._t_vec = t_vec
-
-            rot_m = cv.Rodrigues(r_vec)[0]
+            self._r_vec, self._t_vec, self._camera_inv = solvePose(src, dst, self._camera_matrix, self._camera_dist)
+            self.rebuildLookupTable()
 
-            cam_pos = -np.matrix(rot_m).T * np.matrix(t_vec)
-            cam_pos = np.array(cam_pos.T.tolist()[0])
-            print("\nCamera position within stage system: \n", cam_pos)
-
-            transform_M_i = np.empty((4, 4))
-            transform_M_i[:3, :3] = rot_m.T
-            transform_M_i[:3, 3] = cam_pos
-            transform_M_i[3, :] = [0, 0, 0, 1]
-
-            self._camera_inv = transform_M_i
+    def rebuildLookupTable(self) -> None:
+        self._calibration_version += 1
+        if self._camera_inv is not None and self._camera_matrix is not None:
+            self.pixel_lookup.rebuild(self._camera_matrix, self._camera_dist, self._camera_inv, self._height_offset)
+        else:
+            self.pixel_lookup.invalidate()
 
     def apply_homography(self, screen_point=QPoint) -> QVector3D | None:
-        if self._camera_inv is not None:
-            img_pt = screen_point.toTuple()
-
-            # If calibrated camera, account for distortion parameters:
-            if self._camera_matrix is not None:
-                img_pt = cv.undistortPoints(
-                    np.array(img_pt, dtype=np.float32),
-                    self._camera_matrix,
-                    self._camera_dist,
-                    None,
-                    self._camera_matrix,
-                )[0][0]
-
-            cam_pos = self._camera_inv[:3, 3]
-
-            point_on_camera_plane = np.array(
-                [
-                    (img_pt[0] - self._camera_matrix[0, 2]) / self._camera_matrix[0, 0],
-                    (img_pt[1] - self._camera_matrix[1, 2]) / self._camera_matrix[1, 1],
-                    1,
-                    1,
-                ]
-            )
-            point_in_world_plane = self._camera_inv.dot(point_on_camera_plane)
-            point_in_world_plane = point_in_world_plane[:3] / point_in_world_plane[3]
-
-            ray = point_in_world_plane - cam_pos
-            result = planeRayIntersection(cam_pos, ray, self._height_offset)
-            if result is None:
-                return None
-            # print(f"Pt {screen_point.toTuple()} -> Real World Coords {result}")
-            return QVector3D(result[0], result[1], result[2])
-        else:
+        world_points, valid = self.apply_homography_batch(np.array([screen_point.toTuple()]))
+        if not valid[0]:
             return None
+        # print(f"Pt {screen_point.toTuple()} -> Real World Coords {world_points[0]}")
+        return QVector3D(*world_points[0])
+
+    def apply_homography_batch(self, screen_points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Map an (N, 2) array of screen points onto the stage plane at the current height offset.
+
+        Returns an (N, 3) array of world points and an (N,) boolean mask of which points hit the plane.
+        """
+        screen_points = np.asarray(screen_points, dtype=np.float64).reshape(-1, 2)
+        if self._camera_inv is None or self._camera_matrix is None:
+            return np.zeros((len(screen_points), 3)), np.zeros(len(screen_points), dtype=bool)
+
+        cam_pos, rays = imagePointsToRays(screen_points, self._camera_matrix, self._camera_dist, self._camera_inv)
+        return planeRayIntersections(cam_pos, rays, self._height_offset)
+
+    def map_screen_points(self, screen_points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Like apply_homography_batch but served from the pixel lookup table where it is ready"""
+        screen_points = np.asarray(screen_points, dtype=np.float64).reshape(-1, 2)
+        world_points, valid = self.pixel_lookup.sample(screen_points)
+        if not valid.all():
+            exact_points, exact_valid = self.apply_homography_batch(screen_points[~valid])
+            world_points[~valid] = exact_points
+            valid[~valid] = exact_valid
+        return world_points, valid
+
+    def lookupTableAccuracyReport(self) -> dict | None:
+        return self.pixel_lookup.accuracyReport(self.apply_homography_batch)
 
     def getHomographyPoints(self):
         return self._homography_points
+
+
+if __name__ == "__main__":
+    from PySide6.QtCore import Qt
+    from PySide6.QtWidgets import QApplication, QMainWindow
+
+    from geometry_settings_dock import GeometrySettingsDock
+
+    # GUI thread cost of a second of input from two devices at 60Hz each, driving every track between them. "Per track"
+    # is how it was before tracks_updated: the old track_changed signal fired for each moved track in turn, so each
+    # one missed the projection cache, set its geometry dock label and moved its video cursor. "Coalesced" is the slots
+    # main.py connects to tracks_updated now. The cost of mapping the input, which the outputs need anyway, is measured
+    # on its own and taken off.
+    try:
+        from PySide6.QtMultimedia import QMediaCaptureSession
+
+        from video_display_widget import VideoDisplayWidget
+    except ImportError as e:
+        VideoDisplayWidget = None
+        print("[info] No QtMultimedia, timing the geometry dock without the video overlay:", e)
+
+    app = QApplication([])
+    refreshes = 60
+    for count in (2, 32, 256):
+        window = QMainWindow()
+        window.data = data = DataStore()
+        data._camera_matrix = np.array([[1000.0, 0, 640], [0, 1000.0, 360], [0, 0, 1]])
+        data._camera_dist = np.zeros(4)
+        data._homography_points = {
+            "USL": HomographyPoint(QVector3D(3000, -5000, 0), QVector2D(982, 205)),
+            "USR": HomographyPoint(QVector3D(-3000, -5000, 0), QVector2D(467, 96)),
+            "DSL": HomographyPoint(QVector3D(3000, -11000, 0), QVector2D(801, 676)),
+            "DSR": HomographyPoint(QVector3D(-3000, -11000, 0), QVector2D(70, 410)),
+        }
+        data.update_homography()
+        while len(data.trackIds()) < count:
+            data.addTrack()
+
+        dock = GeometrySettingsDock(parent=window)
+        window.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, dock)
+        slots = [dock.updateTracks]
+        if VideoDisplayWidget is not None:
+            video_widget = VideoDisplayWidget(parent=window)
+            capture_session = QMediaCaptureSession()
+            video_widget.setVideoInput(capture_session)
+            for id in data.trackIds():
+                video_widget.addTrack(id)
+            window.setCentralWidget(video_widget)
+            slots.append(video_widget.updateTracks)
+        window.resize(1280, 800)
+        window.show()
+        app.processEvents()
+
+        def perTrack(ids, positions, input_times) -> None:
+            for id, pos in zip(ids.tolist(), positions):
+                data.track_projector.invalidate()
+                if VideoDisplayWidget is not None:
+                    video_widget.updateTracks(np.array([id]))
+                else:
+                    data.getTracks2D()
+                dock.tracks[id].setText(f"Track {id}: {round(pos[0], 2)}, {round(pos[1], 2)}, {round(pos[2], 2)}")
+
+        rng = np.random.default_rng(0)
+        halves = np.array_split(np.arange(count), 2)
+
+        def run() -> float:
+            start = time.perf_counter()
+            for frame in range(refreshes):
+                for ids in halves:
+                    data.setTracks(ids, rng.uniform((100, 100), (1200, 700), (len(ids), 2)))
+                data.flushTrackUpdates()
+                dock.readout.refresh()  # Its display rate timer, once per refresh like on screen
+                app.processEvents()  # Lays out and paints
+            return time.perf_counter() - start
+
+        run()  # Warm up
+        mapping = run()
+        data.tracks_moved.connect(perTrack)
+        before = (run() - mapping) * 1000
+        data.tracks_moved.disconnect(perTrack)
+        for slot in slots:
+            data.tracks_updated.connect(slot)
+        after = (run() - mapping) * 1000
+        for slot in slots:
+            data.tracks_updated.disconnect(slot)
+        budget = "" if after < 1000 else ", over budget"
+        print(f"{count} tracks: {before:.0f}ms per track, {after:.0f}ms coalesced, per second of input{budget}")
+        window.close()
@@ -0,0 +1,367 @@
+import socket
+import struct
+import threading
+import time
+import uuid
+
+import numpy as np
+from PySide6.QtCore import Slot, QObject
+from PySide6.QtGui import QVector3D
+
+from fixture_geometry import FixtureGeometry
+from psn_output import JitterStats
+
+ARTNET_PORT = 6454
+ARTNET_BROADCAST_ADDR = "2.255.255.255"
+ARTNET_KEEP_ALIVE = 4.0  # seconds
+ARTNET_UNIVERSES = range(0, 32768)  # 15 bit port address
+
+SACN_PORT = 5568
+SACN_KEEP_ALIVE = 1.0  # seconds
+SACN_DEFAULT_PRIORITY = 100
+SACN_UNIVERSES = range(1, 64000)  # 0 is reserved
+
+DMX_UNIVERSE_SIZE = 512
+DMX_MAX_FREQUENCY = 44
+
+
+def universeRange(protocol: str) -> range:
+    """The universe numbers protocol can send to"""
+    if protocol == "sACN":
+        return SACN_UNIVERSES
+    if protocol == "Art-Net":
+        return ARTNET_UNIVERSES
+    return range(0, 64000)
+
+
+class DMXUniverse:
+    """One preallocated universe of channel data, only sent when it changes or the keep alive expires"""
+
+    def __init__(self, number: int):
+        self.number = number
+        self.data = bytearray(DMX_UNIVERSE_SIZE)
+        self.channels = np.frombuffer(self.data, dtype=np.uint8)  # Writable view of data
+        self.dirty = True
+        self.last_sent = 0.0
+
+    def setChannels16(self, indices: np.ndarray, values: np.ndarray) -> None:
+        """Write many 16 bit values at once, indices are the 0-based coarse channels"""
+        coarse = (values >> 8).astype(np.uint8)
+        fine = (values & 0xFF).astype(np.uint8)
+        if np.array_equal(self.channels[indices], coarse) and np.array_equal(self.channels[indices + 1], fine):
+            return
+        self.channels[indices] = coarse
+        self.channels[indices + 1] = fine
+        self.dirty = True
+
+
+class ArtNetPacket:
+    """ArtDmx packet with the header written once, later frames only patch the sequence number and channel data"""
+
+    header_size = 18
+
+    def __init__(self, universe: int):
+        self.buffer = bytearray(self.header_size + DMX_UNIVERSE_SIZE)
+        self.buffer[0:8] = b"Art-Net\x00"
+        struct.pack_into("<H", self.buffer, 8, 0x5000)  # OpDmx
+        struct.pack_into(">H", self.buffer, 10, 14)  # Protocol version
+        self.buffer[13] = 0  # Physical port
+        struct.pack_into("<H", self.buffer, 14, universe & 0x7FFF)  # SubUni, Net
+        struct.pack_into(">H", self.buffer, 16, DMX_UNIVERSE_SIZE)
+        self.sequence = 0
+
+    def update(self, data: bytearray) -> bytearray:
+        self.sequence = self.sequence % 255 + 1  # 0 disables sequencing
+        self.buffer[12] = self.sequence
+        self.buffer[self.header_size :] = data
+        return self.buffer
+
+
+class SACNPacket:
+    """E1.31 data packet with the header written once, later frames only patch the sequence number and channel data"""
+
+    data_offset = 126
+
+    def __init__(self, universe: int, cid: bytes, source_name: str, priority: int = SACN_DEFAULT_PRIORITY):
+        length = self.data_offset + DMX_UNIVERSE_SIZE
+        self.buffer = bytearray(length)
+        # Root layer
+        struct.pack_into(">HH", self.buffer, 0, 0x0010, 0x0000)
+        self.buffer[4:16] = b"ASC-E1.17\x00\x00\x00"
+        struct.pack_into(">HI", self.buffer, 16, 0x7000 | (length - 16), 0x00000004)
+        self.buffer[22:38] = cid
+        # Framing layer
+        struct.pack_into(">HI", self.buffer, 38, 0x7000 | (length - 38), 0x00000002)
+        self.buffer[44:108] = source_name.encode()[:63].ljust(64, b"\x00")
+        self.buffer[108] = priority
+        struct.pack_into(">H", self.buffer, 109, 0)  # Synchronization address
+        self.buffer[112] = 0  # Options
+        struct.pack_into(">H", self.buffer, 113, universe)
+        # DMP layer
+        struct.pack_into(">HBBHHH", self.buffer, 115, 0x7000 | (length - 115), 0x02, 0xA1, 0, 1, DMX_UNIVERSE_SIZE + 1)
+        self.buffer[125] = 0  # DMX start code
+        self.sequence = 0
+
+    def update(self, data: bytearray) -> bytearray:
+        self.sequence = (self.sequence + 1) % 256
+        self.buffer[111] = self.sequence
+        self.buffer[self.data_offset :] = data
+        return self.buffer
+
+
+def sacnMulticastAddress(universe: int) -> str:
+    return f"239.255.{(universe >> 8) & 0xFF}.{universe & 0xFF}"
+
+
+class DMXOutput(QObject):
+    """Drives moving head pan/tilt over sACN or Art-Net from a dedicated thread.
+
+    Like PSNOutput the GUI only publishes state (track positions and the fixture list) by swapping references, and the
+    transmit thread reads a snapshot each frame.
+    """
+
+    protocols = ["Off", "sACN", "Art-Net"]
+
+    def __init__(self, frequency: int = DMX_MAX_FREQUENCY):
+        super().__init__()
+        self.transmit_frequency = min(frequency, DMX_MAX_FREQUENCY)
+        self.jitter = JitterStats()
+        self.protocol = "Off"
+        self.destination = ""  # Empty for multicast (sACN) or broadcast (Art-Net)
+        self.source_name = "Lighthouse"
+        self.cid = uuid.uuid4().bytes
+
+        self._tracks = np.empty((0, 3))  # Row per track id, NaN until a position arrives
+        self._geometry = FixtureGeometry([], DMX_UNIVERSE_SIZE)
+        self._override: tuple[int, float, float] | None = None  # Fixture index, pan, tilt while calibrating
+
+        self.universes: dict[int, DMXUniverse] = {}  # Owned by the transmit thread
+        self._packets: dict[tuple[str, int], ArtNetPacket | SACNPacket] = {}
+        self.errors = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+
+        self._exiting = False
+        self._thread = threading.Thread(target=self.run, name="DMX output", daemon=True)
+        self._thread.start()
+
+    @Slot(str)
+    def setProtocol(self, protocol: str) -> None:
+        self.protocol = protocol
+        self.universes = {}  # Resend everything on the new protocol
+        self._checkUniverses()
+
+    @Slot(str)
+    def setDestination(self, destination: str) -> None:
+        self.destination = destination.strip()
+
+    @Slot(object)
+    def setFixtures(self, fixtures: list) -> None:
+        geometry = FixtureGeometry(list(fixtures), DMX_UNIVERSE_SIZE)
+        for index in np.flatnonzero(~geometry.patched):
+            fixture = fixtures[index]
+            print(f"[Error] Fixture {fixture.name} at address {fixture.address} is past the end of its universe")
+        geometry.continueFrom(self._geometry)
+        self._geometry = geometry
+        self._checkUniverses()
+
+    def _checkUniverses(self) -> None:
+        geometry = self._geometry
+        valid = universeRange(self.protocol)
+        for index in range(geometry.count):
+            if geometry.universes[index] not in valid:
+                print(
+                    f"[Error] Fixture {geometry.names[index]} is on universe {geometry.universes[index]},"
+                    f" which {self.protocol} can't send to"
+                )
+
+    @Slot(int, float, float)
+    def setOverride(self, index: int, pan: float, tilt: float) -> None:
+        """Hold one fixture at a manual pan/tilt (degrees, before inversion) instead of following its track"""
+        self._override = (index, pan, tilt)
+
+    @Slot()
+    def clearOverride(self) -> None:
+        self._override = None
+
+    @Slot(int, QVector3D)
+    def setTrackWithPos(self, id: int, pos: QVector3D) -> None:
+        if id >= len(self._tracks):
+            tracks = np.full((id + 1, 3), np.nan)
+            tracks[: len(self._tracks)] = self._tracks
+        else:
+            tracks = self._tracks.copy()
+        tracks[id] = (pos.x(), pos.y(), pos.z())
+        self._tracks = tracks
+
+    def setTracks(self, ids: np.ndarray, positions: np.ndarray, input_times: np.ndarray | None = None) -> None:
+        """(N, 3) stage positions in mm for tracks ids. Takes DataStore.tracks_moved directly, input times unused."""
+        if len(ids) == 0:
+            return
+        size = max(len(self._tracks), int(ids.max()) + 1)
+        tracks = np.full((size, 3), np.nan)
+        tracks[: len(self._tracks)] = self._tracks
+        tracks[ids] = positions
+        self._tracks = tracks
+
+    @Slot(int)
+    def removeTrack(self, id: int) -> None:
+        """Fixtures on a removed track hold where they are"""
+        if id < len(self._tracks):
+            tracks = self._tracks.copy()
+            tracks[id] = np.nan
+            self._tracks = tracks
+
+    def run(self) -> None:
+        period = 1 / self.transmit_frequency
+        deadline = time.monotonic()
+        last_error = None
+        while not self._exiting:
+            deadline += period
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            now = time.monotonic()
+            if now - deadline > period:
+                self.jitter.overruns += 1
+                deadline = now
+            self.jitter.record(now - deadline)
+            try:
+                self.send(now)
+            except Exception as e:
+                # Keep the other fixtures going, only report each different failure once in a row
+                self.errors += 1
+                if repr(e) != last_error:
+                    print("[Error] DMX output frame failed:", repr(e))
+                    last_error = repr(e)
+            else:
+                last_error = None
+
+    def stop(self) -> None:
+        self._exiting = True
+        self._thread.join()
+
+    def _universe(self, number: int) -> DMXUniverse:
+        if number not in self.universes:
+            self.universes[number] = DMXUniverse(number)
+        return self.universes[number]
+
+    def update(self) -> None:
+        """Solve every fixture against its track in one pass and write the results into the universes"""
+        geometry = self._geometry
+        tracks = self._tracks
+        if geometry.count == 0:
+            return
+        targets = np.full((geometry.count, 3), np.nan)
+        known = (geometry.tracks >= 0) & (geometry.tracks < len(tracks))
+        targets[known] = tracks[geometry.tracks[known]]
+        valid = ~np.isnan(targets).any(axis=1)
+        pan, tilt = geometry.solve(np.nan_to_num(targets), valid)
+        solved = ~np.isnan(geometry.last_pan)  # Fixtures whose track has never had a position are left alone
+
+        override = self._override
+        if override is not None and override[0] < geometry.count:
+            index = override[0]
+            pan[index] = -override[1] if geometry.invert_pan[index] else override[1]
+            tilt[index] = -override[2] if geometry.invert_tilt[index] else override[2]
+            solved[index] = True
+        pan_value, tilt_value = geometry.toDMX(pan, tilt)
+
+        for number, rows in geometry.universe_rows.items():
+            rows = rows[solved[rows]]
+            if len(rows) == 0:
+                continue
+            universe = self._universe(number)
+            universe.setChannels16(
+                np.concatenate((geometry.pan_channels[rows], geometry.tilt_channels[rows])),
+                np.concatenate((pan_value[rows], tilt_value[rows])),
+            )
+
+    def send(self, now: float) -> None:
+        protocol = self.protocol
+        if protocol == "Off":
+            return
+        self.update()
+        keep_alive = SACN_KEEP_ALIVE if protocol == "sACN" else ARTNET_KEEP_ALIVE
+        valid = universeRange(protocol)
+        for number, universe in self.universes.items():
+            if number not in valid:
+                continue  # Logged by _checkUniverses
+            if not universe.dirty and now - universe.last_sent < keep_alive:
+                continue
+            key = (protocol, number)
+            if key not in self._packets:
+                if protocol == "sACN":
+                    self._packets[key] = SACNPacket(number, self.cid, self.source_name)
+                else:
+                    self._packets[key] = ArtNetPacket(number)
+            packet = self._packets[key].update(universe.data)
+            if protocol == "sACN":
+                address = (self.destination or sacnMulticastAddress(number), SACN_PORT)
+            else:
+                address = (self.destination or ARTNET_BROADCAST_ADDR, ARTNET_PORT)
+            try:
+                self.sock.sendto(packet, address)
+            except OSError:
+                self.errors += 1
+                continue
+            universe.dirty = False
+            universe.last_sent = now
+
+
+if __name__ == "__main__":
+    from data_store import Fixture
+
+    # Loopback test: aim one fixture at a moving track and check what a local receiver sees
+    for protocol, port in (("sACN", SACN_PORT), ("Art-Net", ARTNET_PORT)):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", port))
+        receiver.settimeout(ARTNET_KEEP_ALIVE + 1)
+
+        output = DMXOutput()
+        output.setDestination("127.0.0.1")
+        fixture = Fixture("Spot 1", universe=1, address=1, position=QVector3D(0, 0, 6000))
+        output.setFixtures([fixture])
+        output.setTrackWithPos(0, QVector3D(0, 0, 0))
+        output.setProtocol(protocol)
+
+        packet = receiver.recv(1024)
+        if protocol == "sACN":
+            assert len(packet) == 638 and packet[4:13] == b"ASC-E1.17"
+            assert struct.unpack_from(">H", packet, 113)[0] == 1
+            data = packet[SACNPacket.data_offset :]
+        else:
+            assert packet[:8] == b"Art-Net\x00" and struct.unpack_from("<H", packet, 8)[0] == 0x5000
+            data = packet[ArtNetPacket.header_size :]
+        # Straight down is the centre of travel for both axes
+        assert data[0:4] == bytes([0x80, 0x00, 0x80, 0x00]), data[0:4]
+
+        # Unchanged data is only resent on the keep alive
+        start = time.monotonic()
+        receiver.recv(1024)
+        elapsed = time.monotonic() - start
+        print(f"{protocol}: keep alive after {elapsed:.2f}s")
+
+        output.setTrackWithPos(0, QVector3D(3000, 0, 0))
+        packet = receiver.recv(1024)
+        data = packet[-DMX_UNIVERSE_SIZE:]
+        print(f"{protocol}: pan {data[0] << 8 | data[1]}, tilt {data[2] << 8 | data[3]}")
+        assert data[2:4] != bytes([0x80, 0x00])
+
+        output.stop()
+        receiver.close()
+
+    # A fixture on a negative track follows nothing, and sACN never sends universe 0
+    output = DMXOutput()
+    output.setDestination("127.0.0.1")
+    output.setFixtures([Fixture("No track", universe=0, track=-1, position=QVector3D(0, 0, 6000))])
+    output.setTrackWithPos(0, QVector3D(0, 0, 0))
+    output.setProtocol("sACN")
+    output.update()
+    assert np.isnan(output._geometry.last_pan[0])
+    output.setFixtures([Fixture("Universe 0", universe=0, position=QVector3D(0, 0, 6000))])
+    output.send(time.monotonic())
+    assert output.universes[0].last_sent == 0.0
+    output.stop()
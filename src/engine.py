@@ -0,0 +1,78 @@
+from PySide6.QtCore import QObject, Qt, Slot
+
+from data_store import DataStore
+from dmx_output import DMXOutput
+from latency import LatencyDumper
+from psn_output import PSNOutput
+from startup_timer import startup
+
+
+class Engine(QObject):
+    """Show state, input, mapping, filtering and the PSN and DMX outputs, with no widgets.
+
+    The GUI in main.py builds one of these and hooks its docks up to the data store, headless.py runs one on its own
+    under a QCoreApplication.
+    """
+
+    def __init__(self, use_space_mouse: bool = True, parent=None):
+        super().__init__(parent)
+
+        with startup.phase("Creating the data store"):
+            self.data = DataStore()
+            self.data.setParent(self)
+
+        with startup.phase("Setting up PSN"):
+            self.psn_output = PSNOutput()
+            for id in self.data.trackIds():
+                self.trackAdded(id)
+            self.data.track_added.connect(self.trackAdded)
+            self.data.track_removed.connect(self.psn_output.removeTrack)
+            self.data.tracks_moved.connect(self.psn_output.setTracksWithPos)
+            # Machine readable copy of the latency stats for monitoring under load
+            self.latency_dumper = LatencyDumper(
+                self.data.src_folder.parent / "Projects" / ".cache" / "latency.json",
+                extra=lambda: {"psn_jitter": self.psn_output.jitterStats(), "psn_send": self.psn_output.sendStats()},
+                parent=self,
+            )
+
+        with startup.phase("Setting up DMX"):
+            self.dmx_output = DMXOutput()
+            self.data.tracks_moved.connect(self.dmx_output.setTracks)
+            self.data.fixtures_changed.connect(self.dmx_output.setFixtures)
+            self.data.track_removed.connect(self.dmx_output.removeTrack)
+
+        self.space_mouse_reader = None
+        if use_space_mouse:
+            with startup.phase("Setting up SpaceMouse"):
+                self.startSpaceMouse()
+
+    def startSpaceMouse(self) -> None:
+        # Imported here so the engine still runs on machines without the HID libraries when it isn't wanted
+        from space_mouse import createSpaceMouseReader
+
+        try:
+            self.space_mouse_reader = createSpaceMouseReader(self)
+        except AttributeError as e:
+            print("[Error] No 3d input device found", e)
+        if self.space_mouse_reader is not None:
+            self.data.setSpaceMouseCount(len(self.space_mouse_reader.sources))
+            self.space_mouse_reader.setCurves(self.data.responseCurveTables())
+            self.data.response_curves_changed.connect(self.space_mouse_reader.setCurves)
+            # Straight into the input bus from the reader thread, drained once per output tick
+            self.space_mouse_reader.cursor_moved.connect(self.data.input_bus.pushSpaceMouse, Qt.DirectConnection)
+
+    @Slot(int)
+    def trackAdded(self, id: int) -> None:
+        track = self.data.tracks[id]
+        self.psn_output.addTrack(id)
+        self.psn_output.setTrackFilter(id, track.filter, track.smoothing)
+
+    def load(self, path: str | None = None) -> None:
+        """Load a .lho show file, or the last one that was opened, in the background. See DataStore.show_loaded."""
+        self.data.loadInBackground(path)
+
+    def stop(self) -> None:
+        self.psn_output.stop()
+        self.dmx_output.stop()
+        if self.space_mouse_reader is not None:
+            self.space_mouse_reader.stop()
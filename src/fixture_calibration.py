@@ -0,0 +1,200 @@
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+
+from fixture_geometry import eulerToMatrix
+
+MIN_SAMPLES = 3  # Each sample constrains two degrees of freedom, the pose has six
+
+
+def panTiltToDirections(pan: np.ndarray, tilt: np.ndarray) -> np.ndarray:
+    """Unit aim directions in the fixture's frame, the inverse of FixtureGeometry.solve"""
+    pan = np.radians(np.asarray(pan, dtype=np.float64))
+    tilt = np.radians(np.asarray(tilt, dtype=np.float64))
+    return np.stack((np.sin(tilt) * np.cos(pan), np.sin(tilt) * np.sin(pan), -np.cos(tilt)), axis=-1)
+
+
+def _predict(params: np.ndarray, world_points: np.ndarray) -> np.ndarray:
+    fixture_to_world = eulerToMatrix(np.degrees(params[3:]))[0]
+    local = (world_points - params[:3]) @ fixture_to_world  # Row vector form of R^T (p - position)
+    return local / np.linalg.norm(local, axis=1, keepdims=True)
+
+
+def _residuals(params: np.ndarray, world_points: np.ndarray, measured: np.ndarray) -> np.ndarray:
+    return (_predict(params, world_points) - measured).ravel()
+
+
+def _jacobian(params: np.ndarray, world_points: np.ndarray, measured: np.ndarray, r: np.ndarray) -> np.ndarray:
+    jacobian = np.empty((len(r), len(params)))
+    for i in range(len(params)):
+        step = 1e-6 * max(1.0, abs(params[i]))
+        shifted = params.copy()
+        shifted[i] += step
+        jacobian[:, i] = (_residuals(shifted, world_points, measured) - r) / step
+    return jacobian
+
+
+class FixturePose:
+    """Result of a fixture calibration solve, angles in degrees and positions in mm"""
+
+    def __init__(self, position: np.ndarray, orientation: np.ndarray, errors: np.ndarray, iterations: int):
+        self.position = position
+        self.orientation = (orientation + 180) % 360 - 180
+        self.errors = errors  # Angle between where each sample was aimed and where the solved pose would aim
+        self.iterations = iterations
+
+    @property
+    def rms(self) -> float:
+        return float(np.sqrt(np.mean(self.errors**2)))
+
+    def __format__(self, format_spec):
+        p = ", ".join(str(round(v, 1)) for v in self.position)
+        o = ", ".join(str(round(v, 1)) for v in self.orientation)
+        return f"({p}) rot ({o}) rms {self.rms:.2f} deg"
+
+
+def solveFixturePose(
+    world_points: np.ndarray,
+    pan: np.ndarray,
+    tilt: np.ndarray,
+    initial_position: np.ndarray,
+    initial_orientation: np.ndarray,
+    max_iterations: int = 100,
+    progress=None,
+) -> FixturePose:
+    """Levenberg-Marquardt fit of a fixture's position and orientation to pan/tilt samples aimed at known points.
+
+    progress, if given, is called with (iteration, rms error in degrees) after every accepted step.
+    """
+    world_points = np.asarray(world_points, dtype=np.float64).reshape(-1, 3)
+    measured = panTiltToDirections(pan, tilt)
+    params = np.concatenate((np.asarray(initial_position, dtype=np.float64), np.radians(initial_orientation)))
+
+    r = _residuals(params, world_points, measured)
+    cost = r @ r
+    damping = 1e-3
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        jacobian = _jacobian(params, world_points, measured, r)
+        jtj = jacobian.T @ jacobian
+        gradient = jacobian.T @ r
+        improved = False
+        while damping < 1e10:
+            try:
+                delta = np.linalg.solve(jtj + damping * np.diag(np.diag(jtj) + 1e-12), -gradient)
+            except np.linalg.LinAlgError:
+                damping *= 10
+                continue
+            candidate = params + delta
+            candidate_r = _residuals(candidate, world_points, measured)
+            candidate_cost = candidate_r @ candidate_r
+            if np.isfinite(candidate_cost) and candidate_cost < cost:
+                improved = True
+                break
+            damping *= 10
+        if not improved:
+            break
+        converged = cost - candidate_cost < 1e-12 * max(cost, 1e-12) or np.abs(delta).max() < 1e-9
+        params, r, cost = candidate, candidate_r, candidate_cost
+        damping = max(damping / 10, 1e-12)
+        if progress is not None:
+            progress(iteration, _rms(r))
+        if converged:
+            break
+
+    return FixturePose(params[:3], np.degrees(params[3:]), _errors(r), iteration)
+
+
+def _errors(r: np.ndarray) -> np.ndarray:
+    chord = np.linalg.norm(r.reshape(-1, 3), axis=1)
+    return np.degrees(2 * np.arcsin(np.clip(chord / 2, 0, 1)))
+
+
+def _rms(r: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(_errors(r) ** 2)))
+
+
+def initialGuesses(world_points: np.ndarray, position: np.ndarray, orientation: np.ndarray) -> list[tuple]:
+    """Starting poses: the rigged guess, then hung above and standing below the points facing each way"""
+    centre = np.asarray(world_points, dtype=np.float64).reshape(-1, 3).mean(axis=0)
+    guesses = [(np.asarray(position, dtype=np.float64), np.asarray(orientation, dtype=np.float64))]
+    for yaw in (0, 90, 180, 270):
+        guesses.append((centre + [0, 0, 6000], np.array([0.0, 0, yaw])))
+        guesses.append((centre + [0, 6000, 0], np.array([180.0, 0, yaw])))
+    return guesses
+
+
+class FixtureCalibrationWorker(QThread):
+    """Runs the multi-start pose solve for one fixture off the GUI thread"""
+
+    progress = Signal(int, float)  # percent complete, best rms error so far in degrees
+    solved = Signal(int, object)  # fixture index, FixturePose
+    failed = Signal(int, str)  # fixture index, reason
+
+    def __init__(self, index: int, fixture, samples: list[tuple], parent=None):
+        """samples are (world point, pan, tilt) with the world point in mm and the angles in degrees"""
+        QThread.__init__(self, parent)
+        self.index = index
+        self.fixture = fixture
+        self.samples = samples
+        self.exiting = False
+
+    def run(self):
+        if len(self.samples) < MIN_SAMPLES:
+            self.failed.emit(self.index, f"At least {MIN_SAMPLES} points are needed, {len(self.samples)} recorded")
+            return
+
+        world_points = np.array([s[0] for s in self.samples], dtype=np.float64)
+        pan = np.array([s[1] for s in self.samples], dtype=np.float64)
+        tilt = np.array([s[2] for s in self.samples], dtype=np.float64)
+        guesses = initialGuesses(world_points, self.fixture.position.toTuple(), self.fixture.orientation.toTuple())
+
+        best = None
+        for i, (position, orientation) in enumerate(guesses):
+            if self.exiting:
+                return
+            try:
+                pose = solveFixturePose(world_points, pan, tilt, position, orientation)
+            except (np.linalg.LinAlgError, FloatingPointError):
+                continue
+            if np.all(np.isfinite(pose.errors)) and (best is None or pose.rms < best.rms):
+                best = pose
+            self.progress.emit(int(100 * (i + 1) / len(guesses)), best.rms if best is not None else float("nan"))
+
+        if best is None:
+            self.failed.emit(self.index, "The solve didn't converge")
+            return
+        print(f"[info] Fixture {self.index} calibrated: {best}")
+        self.solved.emit(self.index, best)
+
+
+if __name__ == "__main__":
+    import time
+
+    from fixture_geometry import FixtureGeometry
+    from data_store import Fixture
+    from PySide6.QtGui import QVector3D
+
+    # Aim a known fixture at some stage points, then recover its pose from a rough guess
+    truth = Fixture("Truth", position=QVector3D(2500, -3000, 7200), orientation=QVector3D(4, -3, 130))
+    points = np.array([[3000, -5000, 0], [-3000, -5000, 0], [3000, -11000, 0], [-3000, -11000, 0], [0, -8000, 0]])
+    geometry = FixtureGeometry([truth] * len(points))
+    pan, tilt = geometry.solve(points.astype(np.float64))
+
+    rng = np.random.default_rng(1)
+    noisy_pan = pan + rng.normal(0, 0.1, len(pan))
+    noisy_tilt = tilt + rng.normal(0, 0.1, len(tilt))
+
+    start = time.perf_counter()
+    best = None
+    for position, orientation in initialGuesses(points, (0, 0, 6000), (0, 0, 0)):
+        pose = solveFixturePose(points, noisy_pan, noisy_tilt, position, orientation)
+        if best is None or pose.rms < best.rms:
+            best = pose
+    print(f"Solved in {(time.perf_counter() - start) * 1000:.1f}ms: {best}")
+    assert np.linalg.norm(best.position - truth.position.toTuple()) < 100, best.position
+    assert best.rms < 0.5
+
+    # Exact samples recover the pose exactly
+    pose = solveFixturePose(points, pan, tilt, best.position, best.orientation)
+    assert np.linalg.norm(pose.position - truth.position.toTuple()) < 1, pose.position
+    assert np.allclose(pose.orientation, truth.orientation.toTuple(), atol=0.01), pose.orientation
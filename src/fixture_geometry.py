@@ -0,0 +1,191 @@
+import numpy as np
+
+
+def eulerToMatrix(rotation_deg: np.ndarray) -> np.ndarray:
+    """(N, 3) rotations about x, y then z in degrees -> (N, 3, 3) fixture to world rotation matrices"""
+    rx, ry, rz = np.radians(np.asarray(rotation_deg, dtype=np.float64).reshape(-1, 3)).T
+    cx, sx = np.cos(rx), np.sin(rx)
+    cy, sy = np.cos(ry), np.sin(ry)
+    cz, sz = np.cos(rz), np.sin(rz)
+    result = np.empty((len(rx), 3, 3))
+    result[:, 0, 0] = cz * cy
+    result[:, 0, 1] = cz * sy * sx - sz * cx
+    result[:, 0, 2] = cz * sy * cx + sz * sx
+    result[:, 1, 0] = sz * cy
+    result[:, 1, 1] = sz * sy * sx + cz * cx
+    result[:, 1, 2] = sz * sy * cx - cz * sx
+    result[:, 2, 0] = -sy
+    result[:, 2, 1] = cy * sx
+    result[:, 2, 2] = cy * cx
+    return result
+
+
+class FixtureGeometry:
+    """Structure of arrays view of a fixture list for solving every fixture's pan/tilt in one vectorised pass.
+
+    With no rotation a fixture hangs pointing straight down, pan 0 faces +x and tilt is the angle away from straight
+    down. Angles are in degrees relative to the centre of each fixture's travel.
+    """
+
+    # Pan candidates: the direct solution then the flipped one (pan + 180, tilt mirrored), each wrapped by 360k for k
+    # in -2..2 which covers fixtures with up to 720 degrees of pan
+    _wraps = np.arange(-2, 3) * 360.0
+    _candidates = np.concatenate((_wraps, _wraps + 180))[None, :]
+
+    def __init__(self, fixtures: list, universe_size: int = 512):
+        n = len(fixtures)
+        self.count = n
+        self.names = [f.name for f in fixtures]
+        self.positions = np.array([f.position.toTuple() for f in fixtures], dtype=np.float64).reshape(n, 3)
+        orientations = np.array([f.orientation.toTuple() for f in fixtures], dtype=np.float64).reshape(n, 3)
+        self.world_to_fixture = eulerToMatrix(orientations).transpose(0, 2, 1)
+        pan_range = np.array([f.pan_range for f in fixtures], dtype=np.float64)
+        tilt_range = np.array([f.tilt_range for f in fixtures], dtype=np.float64)
+        # Travel is symmetric about the centre so a half range is all the solver needs
+        self.pan_half = pan_range / 2
+        self.tilt_half = tilt_range / 2
+        self._pan_scale = 65535 / np.maximum(pan_range, 1e-9)
+        self._tilt_scale = 65535 / np.maximum(tilt_range, 1e-9)
+        self.invert_pan = np.array([f.invert_pan for f in fixtures], dtype=bool)
+        self.invert_tilt = np.array([f.invert_tilt for f in fixtures], dtype=bool)
+        self.tracks = np.array([f.track for f in fixtures], dtype=np.intp)
+
+        self.universes = np.array([f.universe for f in fixtures], dtype=np.intp)
+        self.pan_channels = np.array([f.address + f.pan_offset - 1 for f in fixtures], dtype=np.intp)
+        self.tilt_channels = np.array([f.address + f.tilt_offset - 1 for f in fixtures], dtype=np.intp)
+        # Both coarse/fine pairs have to fit inside the universe, fixtures patched past either end aren't output
+        first = np.minimum(self.pan_channels, self.tilt_channels)
+        last = np.maximum(self.pan_channels, self.tilt_channels) + 1
+        self.patched = (first >= 0) & (last < universe_size)
+        self.universe_rows = {
+            int(u): np.flatnonzero((self.universes == u) & self.patched)
+            for u in np.unique(self.universes[self.patched])
+        }
+
+        # Last solution for continuity, NaN until a fixture has been solved
+        self.last_pan = np.full(n, np.nan)
+        self.last_tilt = np.full(n, np.nan)
+
+    def continueFrom(self, previous: "FixtureGeometry") -> None:
+        """Start from previous' last solution for fixtures that were already there, matched by name or else by
+        position in the list, so editing one fixture doesn't make the rest pick their pan afresh"""
+        rows = {}
+        for row, name in enumerate(previous.names):
+            rows.setdefault(name, row)
+        matches = [rows.get(name) for name in self.names]
+        claimed = set(matches)
+        for index, row in enumerate(matches):
+            if row is None and index < previous.count and index not in claimed:
+                row = index  # Renamed in place
+            if row is not None:
+                self.last_pan[index] = previous.last_pan[row]
+                self.last_tilt[index] = previous.last_tilt[row]
+
+    def solve(self, targets: np.ndarray, valid: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Pan/tilt for every fixture aimed at the matching row of an (N, 3) array of targets.
+
+        Of all the equivalent solutions (pan wrapped by 360, or pan + 180 with the tilt mirrored) inside each fixture's
+        range the one closest to the previous pan is chosen, so fixtures never swing the long way round. Rows where
+        valid is False keep their previous solution.
+        """
+        offsets = targets - self.positions
+        local = np.matmul(self.world_to_fixture, offsets[:, :, None])[:, :, 0]
+        pan = np.degrees(np.arctan2(local[:, 1], local[:, 0]))
+        tilt = np.degrees(np.arctan2(np.hypot(local[:, 0], local[:, 1]), -local[:, 2]))
+
+        pans = pan[:, None] + self._candidates
+        reference = np.where(np.isnan(self.last_pan), 0.0, self.last_pan)
+        cost = np.abs(pans - reference[:, None])
+        cost[np.abs(pans) > self.pan_half[:, None]] = np.inf
+        best = np.argmin(cost, axis=1)
+        rows = np.arange(self.count)
+        new_pan = pans[rows, best]
+        new_tilt = np.where(best >= len(self._wraps), -tilt, tilt)
+
+        # Fixtures with less than 360 degrees of pan can have no reachable candidate: clamp the direct solution
+        unreachable = np.isinf(cost[rows, best])
+        if unreachable.any():
+            new_pan[unreachable] = np.clip(pan[unreachable], -self.pan_half[unreachable], self.pan_half[unreachable])
+            new_tilt[unreachable] = tilt[unreachable]
+        new_tilt = np.minimum(np.maximum(new_tilt, -self.tilt_half), self.tilt_half)  # np.clip is slow on small arrays
+
+        if valid is not None:
+            new_pan = np.where(valid, new_pan, self.last_pan)
+            new_tilt = np.where(valid, new_tilt, self.last_tilt)
+        self.last_pan = new_pan
+        self.last_tilt = new_tilt
+
+        pan_out = np.where(self.invert_pan, -new_pan, new_pan)
+        tilt_out = np.where(self.invert_tilt, -new_tilt, new_tilt)
+        return pan_out, tilt_out
+
+    def toDMX(self, pan: np.ndarray, tilt: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Map solved angles onto 16 bit DMX values across each fixture's range"""
+        pan_value = (pan + self.pan_half) * self._pan_scale
+        tilt_value = (tilt + self.tilt_half) * self._tilt_scale
+        # Never solved fixtures sit in the centre
+        pan_value[np.isnan(pan_value)] = 32767.5
+        tilt_value[np.isnan(tilt_value)] = 32767.5
+        pan_value = np.minimum(np.maximum(pan_value, 0), 65535).round().astype(np.uint16)
+        tilt_value = np.minimum(np.maximum(tilt_value, 0), 65535).round().astype(np.uint16)
+        return pan_value, tilt_value
+
+
+if __name__ == "__main__":
+    import time
+
+    from PySide6.QtGui import QVector3D
+
+    from data_store import Fixture
+
+    # Straight down is the centre of travel, +x is pan 0
+    fixtures = [Fixture("Down", position=QVector3D(0, 0, 6000))]
+    geometry = FixtureGeometry(fixtures)
+    pan, tilt = geometry.solve(np.array([[3000.0, 0, 6000 - 3000]]))
+    assert abs(pan[0]) < 1e-6 and abs(tilt[0] - 45) < 1e-6
+
+    # Continuity: sweeping past +-180 should carry on round rather than jumping back the long way
+    geometry = FixtureGeometry([Fixture("Sweep", position=QVector3D(0, 0, 6000))])
+    sweep = np.radians(np.concatenate((np.linspace(0, 250, 200), np.linspace(250, -250, 400))))
+    previous = None
+    for angle in sweep:
+        pan, tilt = geometry.solve(np.array([[3000 * np.cos(angle), 3000 * np.sin(angle), 0]]))
+        if previous is not None:
+            assert abs(pan[0] - previous) < 5, (pan[0], previous)
+        previous = pan[0]
+    assert abs(previous + 250) < 1e-6, previous
+
+    # Past the end of travel the fixture flips over (pan - 180, tilt mirrored) instead of clamping
+    pan, tilt = geometry.solve(np.array([[3000 * np.cos(np.radians(-280)), 3000 * np.sin(np.radians(-280)), 0]]))
+    assert abs(pan[0] - (-100)) < 1e-6 and tilt[0] < 0, (pan[0], tilt[0])
+
+    # An edit rebuilds the geometry, fixtures already there carry on from their last pan rather than swinging back
+    edited = FixtureGeometry([Fixture("New", position=QVector3D(0, 0, 6000)), Fixture("Sweep")])
+    edited.continueFrom(geometry)
+    assert np.isnan(edited.last_pan[0]) and abs(edited.last_pan[1] + 100) < 1e-6
+
+    # A floor mounted fixture (flipped over) aiming up at a point directly above
+    floor = Fixture("Floor", position=QVector3D(0, 0, 0))
+    floor.orientation = QVector3D(180, 0, 0)
+    pan, tilt = FixtureGeometry([floor]).solve(np.array([[0.0, 0, 5000]]))
+    assert abs(tilt[0]) < 1e-6
+
+    # Many fixtures on one track: one vectorised pass per frame
+    rng = np.random.default_rng(0)
+    target = np.array([0.0, -8000, 1500])
+    repeats = 2000
+    for count in (24, 256):
+        fixtures = []
+        for i in range(count):
+            position = rng.random(3) * [12000, 8000, 0] + [-6000, -12000, 7000]
+            fixture = Fixture(f"Spot {i}", position=QVector3D(*position))
+            fixture.orientation = QVector3D(0, 0, float(rng.random() * 360))
+            fixture.invert_pan = bool(i % 2)
+            fixtures.append(fixture)
+        geometry = FixtureGeometry(fixtures)
+        targets = np.broadcast_to(target, (count, 3))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            pan, tilt = geometry.solve(targets)
+            geometry.toDMX(pan, tilt)
+        print(f"{count} fixtures: {(time.perf_counter() - start) / repeats * 1e6:.1f}us per frame")
@@ -10,20 +10,25 @@ from PySide6.QtWidgets import (
     QCheckBox,
     QSlider,
     QPushButton,
+    QComboBox,
+    QLineEdit,
 )
 from PySide6.QtCore import Signal, Slot, Qt, QSize
 from PySide6.QtGui import QVector3D, QVector2D, QIconEngine, QIcon
 
-from data_store import HomographyPoint
-from settings_dialogs import AddNewPointDialog, EditPointDialog
+from data_store import Fixture
+from dmx_output import DMXOutput
+from settings_dialogs import AddFixtureDialog, EditFixtureDialog, FixtureCalibrationDialog
 
 from double_slider import DoubleSlider
 
 
 class FixtureSettingsDock(QDockWidget):
-    addNewHomographyPoint = Signal(str, HomographyPoint)
-    editHomographyPoint = Signal(str, str, HomographyPoint)
-    removeHomographyPoint = Signal(str)
+    addFixture = Signal(Fixture)
+    editFixture = Signal(int, Fixture)
+    removeFixture = Signal(int)
+    overrideFixture = Signal(int, float, float)  # index, pan, tilt while calibrating
+    clearOverride = Signal()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -48,4 +53,75 @@ class FixtureSettingsDock(QDockWidget):
         title_layout.addWidget(QLabel("Fixtures"))
         title_layout.addStretch()
 
+        self.settings_layout.addWidget(QLabel("DMX output"))
+        self.protocol = QComboBox()
+        self.protocol.addItems(DMXOutput.protocols)
+        self.settings_layout.addWidget(self.protocol)
+        self.destination = QLineEdit()
+        self.destination.setPlaceholderText("Multicast / broadcast")
+        self.settings_layout.addWidget(self.destination)
+
+        self.list_widget = QListWidget()
+        self.settings_layout.addWidget(self.list_widget)
+
+        add_new = QListWidgetItem()
+        add_new.setData(-1, -1)
+        add_new_widget = QWidget()
+        add_new_layout = QHBoxLayout()
+        add_new_widget.setLayout(add_new_layout)
+        add_new_layout.addWidget(QLabel("Add New"))
+        add_new.setSizeHint(add_new_widget.sizeHint())
+        self.list_widget.addItem(add_new)
+        self.list_widget.setItemWidget(add_new, add_new_widget)
+        self.list_widget.itemClicked.connect(self.fixtureListClick)
+
         self.settings_layout.addStretch()
+
+    @Slot(object)  # list[Fixture]
+    def updateFixtures(self, fixtures: list[Fixture]) -> None:
+        while self.list_widget.count() > 1:
+            self.list_widget.takeItem(1)
+
+        for index, fixture in enumerate(fixtures):
+            item = QListWidgetItem()
+            item.setData(-1, index)
+            item_widget = QWidget()
+            item_layout = QHBoxLayout()
+            item_widget.setLayout(item_layout)
+
+            edit_button = QPushButton("Edit")
+            edit_button.clicked.connect(lambda x, index=index, fixture=fixture: self.editButtonCallback(index, fixture))
+            item_layout.addWidget(edit_button)
+            calibrate_button = QPushButton("Calibrate")
+            calibrate_button.clicked.connect(
+                lambda x, index=index, fixture=fixture: self.calibrateButtonCallback(index, fixture)
+            )
+            item_layout.addWidget(calibrate_button)
+            item_layout.addWidget(QLabel(f"{fixture.name} {fixture}"))
+
+            item.setSizeHint(item_widget.sizeHint())
+            self.list_widget.addItem(item)
+            self.list_widget.setItemWidget(item, item_widget)
+
+    def fixtureListClick(self, item: QListWidgetItem):
+        if item.data(-1) == -1:
+            dlg = AddFixtureDialog(self.protocol.currentText())
+            if dlg.exec():
+                self.addFixture.emit(dlg.fixture())
+
+    def editButtonCallback(self, index: int, fixture: Fixture):
+        dlg = EditFixtureDialog(fixture, self.protocol.currentText())
+        if dlg.exec():
+            self.editFixture.emit(index, dlg.fixture())
+        elif dlg.delete_status:
+            self.removeFixture.emit(index)
+
+    def calibrateButtonCallback(self, index: int, fixture: Fixture):
+        dlg = FixtureCalibrationDialog(index, fixture, self.parent().data.getHomographyPoints())
+        dlg.aimChanged.connect(self.overrideFixture)
+        dlg.aim_changed()
+        try:
+            if dlg.exec():
+                self.editFixture.emit(index, dlg.fixture())
+        finally:
+            self.clearOverride.emit()
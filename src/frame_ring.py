@@ -0,0 +1,204 @@
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+HEADER_FIELDS = 8  # slots, ndim, 3 shape dimensions, latest seq, spare
+ALIGNMENT = 64
+WRITING = -1  # A slot's seq while the producer is writing into it
+
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class FrameRing:
+    """Fixed size ring of uint8 frame slots in shared memory, for one producer and any number of consumer processes.
+
+    Every slot carries the sequence number and timestamp of the frame in it. The producer writes round the ring without
+    ever waiting for anybody. A consumer takes a view of the latest frame, uses it in place, and then checks valid(seq):
+    if the producer lapped it in the meantime the slot's sequence number has changed and the result should be thrown
+    away (a seqlock). With N slots a consumer has N - 1 frame periods to finish with a frame.
+
+    Consumers attach by name, the shape and slot count are read from the shared header, so nothing is pickled.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        slots, ndim = int(self.header[0]), int(self.header[1])
+        self.shape = tuple(int(d) for d in self.header[2 : 2 + ndim])
+        offset = self.header.nbytes
+        self.seqs = np.ndarray(slots, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.seqs.nbytes
+        self.times = np.ndarray(slots, dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset = _align(offset + self.times.nbytes)
+        self.frames = np.ndarray((slots, *self.shape), dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, shape: tuple[int, ...], slots: int = 4) -> "FrameRing":
+        frame_bytes = _align(int(np.prod(shape)))
+        meta_bytes = _align(HEADER_FIELDS * 8 + slots * 16)
+        shm = shared_memory.SharedMemory(create=True, size=meta_bytes + slots * frame_bytes)
+        header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[0] = slots
+        header[1] = len(shape)
+        header[2 : 2 + len(shape)] = shape
+        del header
+        ring = cls(shm, owner=True)
+        ring.seqs[:] = 0
+        ring.times[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRing":
+        shm = shared_memory.SharedMemory(name=name)
+        if multiprocessing.parent_process() is None:
+            # Not started by the producer, so this process has its own resource tracker which would unlink the ring
+            # when it exits. Children share their parent's tracker and must leave the registration alone.
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def slots(self) -> int:
+        return len(self.seqs)
+
+    @property
+    def latest_seq(self) -> int:
+        return int(self.header[5])
+
+    # Producer
+
+    def beginWrite(self) -> tuple[int, np.ndarray]:
+        """Claim the next slot to render or copy a frame straight into, then call endWrite"""
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        self.seqs[slot] = WRITING
+        return seq, self.frames[slot]
+
+    def endWrite(self, seq: int, t: float) -> None:
+        slot = seq % self.slots
+        self.times[slot] = t
+        self.seqs[slot] = seq
+        self.header[5] = seq
+
+    def write(self, frame: np.ndarray, t: float | None = None) -> int:
+        seq, slot = self.beginWrite()
+        slot[...] = frame
+        self.endWrite(seq, time.monotonic() if t is None else t)
+        return seq
+
+    # Consumers
+
+    def read(self, seq: int) -> tuple[float, np.ndarray] | None:
+        """Timestamp and a view of frame seq, or None if it's no longer in the ring. Check valid(seq) after use."""
+        slot = seq % self.slots
+        if seq <= 0 or self.seqs[slot] != seq:
+            return None
+        t = float(self.times[slot])
+        return t, self.frames[slot]
+
+    def latest(self) -> tuple[int, float, np.ndarray] | None:
+        seq = self.latest_seq
+        frame = self.read(seq)
+        if frame is None:
+            return None
+        return seq, frame[0], frame[1]
+
+    def valid(self, seq: int) -> bool:
+        return self.seqs[seq % self.slots] == seq
+
+    def waitForFrame(self, after: int, timeout: float, interval: float = 0.0005) -> int:
+        """Sleep until a frame newer than after is published, returns the latest seq (which is after on timeout)"""
+        deadline = time.monotonic() + timeout
+        while self.latest_seq <= after and time.monotonic() < deadline:
+            time.sleep(interval)
+        return self.latest_seq
+
+    def close(self) -> None:
+        del self.header, self.seqs, self.times, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _benchmarkConsumer(name: str, work: float, results) -> None:
+    """Reads the latest frame in place, then spends work seconds on what it took from it, until frames stop coming"""
+    ring = FrameRing.attach(name)
+    read = 0
+    skipped = 0
+    lapped = 0
+    latencies = []
+    first_t = last_t = 0.0
+    last = ring.waitForFrame(0, 10)
+    while True:
+        seq = ring.waitForFrame(last, 0.5)
+        if seq == last:
+            break
+        frame = ring.read(seq)
+        if frame is None:
+            lapped += 1
+            last = seq
+            continue
+        t, view = frame
+        small = view[::8, ::8].mean(axis=2)  # Only what the analysis needs leaves the ring
+        if ring.valid(seq):
+            read += 1
+            skipped += seq - last - 1
+            latencies.append(time.monotonic() - t)
+            first_t = first_t or t
+            last_t = t
+        else:
+            lapped += 1
+        del view, small
+        last = seq
+        time.sleep(work)
+    rate = (read - 1) / (last_t - first_t)
+    results.put((work, rate, skipped, lapped, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))))
+    ring.close()
+
+
+if __name__ == "__main__":
+    # One producer at 1080p60 BGR, a fast, a medium and a consumer far too slow to keep up
+    seconds = 4
+    context = multiprocessing.get_context("spawn")
+    ring = FrameRing.create((1080, 1920, 3), slots=4)
+    results = context.Queue()
+    works = [0.001, 0.010, 0.080]
+    consumers = [context.Process(target=_benchmarkConsumer, args=(ring.name, w, results)) for w in works]
+    for consumer in consumers:
+        consumer.start()
+
+    rng = np.random.default_rng(0)
+    source = [rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8) for _ in range(4)]
+    write_times = []
+    start = time.monotonic()
+    frames = 0
+    while time.monotonic() - start < seconds:
+        t = time.perf_counter()
+        ring.write(source[frames % len(source)])
+        write_times.append(time.perf_counter() - t)
+        frames += 1
+        time.sleep(max(0.0, start + frames / 60 - time.monotonic()))
+    produced_rate = frames / (time.monotonic() - start)
+
+    reports = sorted(results.get() for _ in consumers)
+    for consumer in consumers:
+        consumer.join()
+    ring.close()
+
+    write_times = np.array(write_times) * 1000
+    print(f"Producer {produced_rate:.1f} fps, write p50 {np.percentile(write_times, 50):.2f}ms "
+          f"p99 {np.percentile(write_times, 99):.2f}ms ({1080 * 1920 * 3 * produced_rate / 1e9:.2f} GB/s)")
+    for work, rate, skipped, lapped, p50, p99 in reports:
+        print(f"Consumer with {work * 1000:.0f}ms of work: {rate:.1f} fps, {skipped} skipped, {lapped} lapped, "
+              f"latency p50 {p50 * 1000:.1f}ms p99 {p99 * 1000:.1f}ms")
+    assert produced_rate > 57  # The slow consumer never holds the producer up
+    assert reports[0][1] > 57 and reports[0][3] == 0
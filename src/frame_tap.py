@@ -0,0 +1,310 @@
+import collections
+import threading
+import time
+from typing import Callable
+
+import cv2 as cv
+import numpy as np
+from PySide6.QtCore import QObject, Slot
+
+# Pixel formats whose first plane is 8 bit luma, by enum name so this module doesn't need QtMultimedia to import
+Y_PLANE_FORMATS = {
+    "Format_NV12",
+    "Format_NV21",
+    "Format_YUV420P",
+    "Format_YUV422P",
+    "Format_YV12",
+    "Format_IMC1",
+    "Format_IMC2",
+    "Format_IMC3",
+    "Format_IMC4",
+    "Format_Y8",
+}
+PACKED_Y_OFFSET = {"Format_YUYV": 0, "Format_UYVY": 1}  # Luma is every other byte, starting here
+BGRA_FORMATS = {"Format_BGRA8888", "Format_BGRX8888"}
+RGBA_FORMATS = {"Format_RGBA8888", "Format_RGBX8888"}
+# Formats OpenCV can convert to BGR once their planes are laid end to end
+STACKED_YUV_CODES = {
+    "Format_NV12": cv.COLOR_YUV2BGR_NV12,
+    "Format_NV21": cv.COLOR_YUV2BGR_NV21,
+    "Format_YUV420P": cv.COLOR_YUV2BGR_I420,
+    "Format_YV12": cv.COLOR_YUV2BGR_YV12,
+}
+PACKED_YUV_CODES = {"Format_YUYV": cv.COLOR_YUV2BGR_YUYV, "Format_UYVY": cv.COLOR_YUV2BGR_UYVY}
+
+
+class TappedFrame:
+    """A mapped QVideoFrame's planes as NumPy views. Only valid inside the consumer callback, the frame is unmapped
+    straight after."""
+
+    def __init__(self, frame, seq: int, t: float):
+        self.seq = seq
+        self.t = t  # time.monotonic() when the frame arrived from the sink
+        self.stream_time = frame.startTime()  # microseconds, -1 if the backend doesn't stamp frames
+        self.width = frame.width()
+        self.height = frame.height()
+        self.pixel_format = frame.pixelFormat().name
+        self.planes = []  # (rows, bytes per line) uint8 views, chroma planes are shorter than the luma plane
+        for plane in range(frame.planeCount()):
+            stride = frame.bytesPerLine(plane)
+            data = np.frombuffer(frame.bits(plane), dtype=np.uint8, count=frame.mappedBytes(plane))
+            self.planes.append(data[: len(data) // stride * stride].reshape(-1, stride))
+        self._frame = frame
+        self._gray = None
+
+    @property
+    def gray(self) -> np.ndarray | None:
+        """(height, width) 8 bit luma. A view for YUV formats, RGB formats are converted once on first use."""
+        if self._gray is None:
+            self._gray = self._luma()
+        return self._gray
+
+    def bgr(self) -> np.ndarray | None:
+        """(height, width, 3) BGR copy of the frame, still valid after the frame is unmapped"""
+        width = self.width
+        height = self.height
+        if self.pixel_format in STACKED_YUV_CODES:
+            luma = self.planes[0][:height, :width].ravel()
+            if len(self.planes) == 2:  # Interleaved chroma at full width
+                chroma = [self.planes[1][: height // 2, :width].ravel()]
+            else:
+                chroma = [plane[: height // 2, : width // 2].ravel() for plane in self.planes[1:3]]
+            stacked = np.concatenate([luma] + chroma).reshape(height * 3 // 2, width)
+            return cv.cvtColor(stacked, STACKED_YUV_CODES[self.pixel_format])
+        rows = self.planes[0][:height] if self.planes else None
+        if self.pixel_format in PACKED_YUV_CODES:
+            return cv.cvtColor(rows[:, : width * 2].reshape(height, width, 2), PACKED_YUV_CODES[self.pixel_format])
+        if self.pixel_format in BGRA_FORMATS:
+            return cv.cvtColor(rows[:, : width * 4].reshape(height, width, 4), cv.COLOR_BGRA2BGR)
+        if self.pixel_format in RGBA_FORMATS:
+            return cv.cvtColor(rows[:, : width * 4].reshape(height, width, 4), cv.COLOR_RGBA2BGR)
+
+        from PySide6.QtGui import QImage
+
+        image = self._frame.toImage().convertToFormat(QImage.Format.Format_BGR888)
+        if image.isNull():
+            return None
+        data = np.frombuffer(image.constBits(), dtype=np.uint8).reshape(height, image.bytesPerLine())
+        return data[:, : width * 3].reshape(height, width, 3).copy()
+
+    def _luma(self) -> np.ndarray | None:
+        width = self.width
+        rows = self.planes[0][: self.height] if self.planes else None
+        if self.pixel_format in Y_PLANE_FORMATS:
+            return rows[:, :width]
+        if self.pixel_format in PACKED_Y_OFFSET:
+            offset = PACKED_Y_OFFSET[self.pixel_format]
+            return rows[:, offset : width * 2 : 2]
+        if self.pixel_format in BGRA_FORMATS:
+            return cv.cvtColor(rows[:, : width * 4].reshape(self.height, width, 4), cv.COLOR_BGRA2GRAY)
+        if self.pixel_format in RGBA_FORMATS:
+            return cv.cvtColor(rows[:, : width * 4].reshape(self.height, width, 4), cv.COLOR_RGBA2GRAY)
+
+        from PySide6.QtGui import QImage
+
+        image = self._frame.toImage().convertToFormat(QImage.Format.Format_Grayscale8)
+        if image.isNull():
+            return None
+        gray = np.frombuffer(image.constBits(), dtype=np.uint8).reshape(self.height, image.bytesPerLine())
+        return gray[:, :width].copy()
+
+
+class FrameTap(QObject):
+    """Hands camera frames to analysis code as NumPy views, without copying or converting them.
+
+    Connect pushFrame to a QVideoSink's videoFrameChanged with Qt.DirectConnection, it only keeps a reference to the
+    frame so it's cheap on whatever thread the backend delivers frames on. A separate thread maps the newest frame and
+    calls every active consumer with a TappedFrame. At most depth frames wait, when consumers fall behind the oldest
+    waiting frame is dropped, so they always see the freshest picture instead of a growing backlog.
+    """
+
+    def __init__(self, depth: int = 1, parent=None):
+        super().__init__(parent)
+        self._pending = collections.deque(maxlen=depth)
+        self._condition = threading.Condition()
+        self._consumers: list[tuple[Callable, Callable[[], bool]]] = []
+
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0  # Replaced by a newer frame before the consumers got to it
+        self.failed = 0  # Couldn't be mapped
+        self.consumer_errors = 0  # Exceptions raised by consumers, the other consumers still get the frame
+        self.last_t = 0.0
+        self.latency = 0.0  # seconds from arrival to the consumers finishing, exponential moving average
+
+        self._exiting = False
+        self._thread = threading.Thread(target=self.run, name="Frame tap", daemon=True)
+        self._thread.start()
+
+    def addConsumer(self, callback: Callable[[TappedFrame], None], active: Callable[[], bool] = lambda: True) -> None:
+        """callback runs on the tap's thread. Frames aren't even mapped while no consumer is active."""
+        self._consumers = self._consumers + [(callback, active)]
+
+    def active(self) -> bool:
+        return any(active() for _, active in self._consumers)
+
+    @Slot(object)
+    def pushFrame(self, frame) -> None:
+        if not self.active() or not frame.isValid():
+            return
+        with self._condition:
+            self.received += 1
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append((frame, self.received, time.monotonic()))
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "consumer_errors": self.consumer_errors,
+            "latency": self.latency,
+        }
+
+    def stop(self) -> None:
+        with self._condition:
+            self._exiting = True
+            self._condition.notify()
+        self._thread.join()
+
+    def run(self) -> None:
+        last_errors = {}  # Consumer -> repr of its last exception, so a consumer failing every frame is logged once
+        while True:
+            with self._condition:
+                while not self._pending and not self._exiting:
+                    self._condition.wait()
+                if self._exiting:
+                    return
+                frame, seq, t = self._pending.popleft()
+
+            if not frame.map(frame.MapMode.ReadOnly):
+                self.failed += 1
+                continue
+            try:
+                tapped = TappedFrame(frame, seq, t)
+                for callback, active in self._consumers:
+                    try:
+                        if active():
+                            callback(tapped)
+                            last_errors.pop(callback, None)
+                    except Exception as e:
+                        self.consumer_errors += 1
+                        if last_errors.get(callback) != repr(e):
+                            last_errors[callback] = repr(e)
+                            print(f"[Error] Frame consumer {getattr(callback, '__qualname__', callback)} failed: {e!r}")
+            finally:
+                frame.unmap()
+            self.delivered += 1
+            self.last_t = t
+            self.latency += (time.monotonic() - t - self.latency) * 0.05
+
+
+if __name__ == "__main__":
+    import enum
+
+    class FakeFrame:
+        """Stands in for an NV12 QVideoFrame backed by one buffer, QtMultimedia isn't needed to run this"""
+
+        class MapMode(enum.Enum):
+            ReadOnly = 1
+
+        class PixelFormat(enum.Enum):
+            Format_NV12 = 1
+
+        def __init__(self, width, height, value):
+            self.buffer = np.full(width * height * 3 // 2, value, dtype=np.uint8)
+            self._width = width
+            self._height = height
+            self.mapped = False
+
+        def isValid(self):
+            return True
+
+        def map(self, mode):
+            self.mapped = True
+            return True
+
+        def unmap(self):
+            self.mapped = False
+
+        def width(self):
+            return self._width
+
+        def height(self):
+            return self._height
+
+        def startTime(self):
+            return -1
+
+        def pixelFormat(self):
+            return self.PixelFormat.Format_NV12
+
+        def planeCount(self):
+            return 2
+
+        def bytesPerLine(self, plane):
+            return self._width
+
+        def mappedBytes(self, plane):
+            return self._width * self._height // (1 if plane == 0 else 2)
+
+        def bits(self, plane):
+            start = 0 if plane == 0 else self._width * self._height
+            return memoryview(self.buffer[start : start + self.mappedBytes(plane)])
+
+    # 1080p60 from a "camera thread" to a consumer that sometimes takes longer than a frame period
+    seen = []
+
+    def consume(tapped: TappedFrame):
+        gray = tapped.gray
+        assert tapped._frame.mapped and gray.shape == (1080, 1920)
+        assert np.shares_memory(gray, tapped._frame.buffer)  # A view, not a copy
+        assert tapped.planes[1].shape == (540, 1920)
+        seen.append((tapped.seq, int(gray[0, 0])))
+        time.sleep(0.04 if tapped.seq % 10 == 0 else 0.002)
+
+    tap = FrameTap()
+    tap.addConsumer(consume)
+    frames = [FakeFrame(1920, 1080, i % 256) for i in range(180)]
+    start = time.monotonic()
+    pushed = []
+    for i, frame in enumerate(frames):
+        t = time.perf_counter()
+        tap.pushFrame(frame)
+        pushed.append(time.perf_counter() - t)
+        time.sleep(max(0.0, start + (i + 1) / 60 - time.monotonic()))
+    time.sleep(0.1)
+    tap.stop()
+
+    stats = tap.stats()
+    print(f"{stats}, pushFrame {np.mean(pushed) * 1e6:.1f}us on the camera thread")
+    assert stats["delivered"] + stats["dropped"] == stats["received"] == len(frames)
+    assert 0 < stats["dropped"] < len(frames) / 5
+    assert seen[-1][0] == len(frames)  # The newest frame is always delivered
+    assert all(seq % 256 == value + 1 or value == 255 for seq, value in seen)
+    assert [seq for seq, _ in seen] == sorted(seq for seq, _ in seen)
+
+    # A consumer that raises (a tracker worker that died, say) is logged and the others still get every frame
+    def broken(tapped: TappedFrame):
+        raise BrokenPipeError(32, "Broken pipe")
+
+    survivor = FrameTap()
+    survivor.addConsumer(broken)
+    after = []
+    survivor.addConsumer(lambda tapped: after.append(tapped.seq))
+    for frame in frames[:3]:
+        survivor.pushFrame(frame)
+        time.sleep(0.01)
+    time.sleep(0.05)
+    survivor.stop()
+    assert after == [1, 2, 3] and survivor.consumer_errors == 3 and survivor.delivered == 3
+
+    # Nothing is mapped while no consumer wants frames
+    idle = FrameTap()
+    idle.addConsumer(consume, active=lambda: False)
+    idle.pushFrame(frames[0])
+    idle.stop()
+    assert idle.received == 0
@@ -1,3 +1,5 @@
+from typing import Callable
+
 import numpy as np
 from PySide6.QtWidgets import (
     QLabel,
@@ -10,6 +12,7 @@ from PySide6.QtWidgets import (
     QCheckBox,
     QSlider,
     QPushButton,
+    QScrollArea,
 )
 from PySide6.QtCore import Signal, Slot, Qt, QSize
 from PySide6.QtGui import QVector3D, QVector2D, QIconEngine, QIcon
@@ -18,12 +21,19 @@ from data_store import HomographyPoint
 from settings_dialogs import AddNewPointDialog, EditPointDialog
 
 from double_slider import DoubleSlider
+from live_readout import LiveReadout
+
+
+def _formatTrack(id: int) -> Callable[[np.ndarray], str]:
+    return lambda pos: f"Track {id}: {round(pos[0], 2)}, {round(pos[1], 2)}, {round(pos[2], 2)}"
 
 
 class GeometrySettingsDock(QDockWidget):
     addNewHomographyPoint = Signal(str, HomographyPoint)
     editHomographyPoint = Signal(str, str, HomographyPoint)
     removeHomographyPoint = Signal(str)
+    editHomographyPointsChanged = Signal(bool)
+    selectedHomographyPointChanged = Signal(str)  # Item name, "__add_new__" for the Add New row
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -51,16 +61,28 @@ class GeometrySettingsDock(QDockWidget):
         self.settings_layout.addWidget(QLabel("Stage Geometry Points"))
         self.list_widget = QListWidget()
         self.settings_layout.addWidget(self.list_widget)
+        self.list_widget.currentItemChanged.connect(self.currentItemChanged)
 
         self.edit_homography_points = QCheckBox("Edit homography points")
         self.edit_homography_points.setChecked(False)
+        self.edit_homography_points.toggled.connect(self.editHomographyPointsChanged)
         self.settings_layout.addWidget(self.edit_homography_points)
 
-        self.track0 = QLabel("Track 0: 0.0, 0.0")
-        self.track1 = QLabel("Track 0: 0.0, 0.0")
-        self.tracks = [self.track0, self.track1]
-        self.settings_layout.addWidget(self.track0)
-        self.settings_layout.addWidget(self.track1)
+        # Scrolled, so with hundreds of tracks only the readouts on screen are laid out, painted and updated
+        tracks_widget = QWidget()
+        self.tracks_layout = QVBoxLayout(tracks_widget)
+        self.tracks_layout.setContentsMargins(0, 0, 0, 0)
+        self.tracks_layout.addStretch()
+        self.tracks_scroll = QScrollArea()
+        self.tracks_scroll.setWidgetResizable(True)
+        self.tracks_scroll.setFrameShape(QScrollArea.Shape.NoFrame)
+        self.tracks_scroll.setWidget(tracks_widget)
+        self.settings_layout.addWidget(self.tracks_scroll)
+        self.tracks: dict[int, QLabel] = {}
+        self.readout = LiveReadout(self)
+        self.readout.watchScrollArea(self.tracks_scroll)
+        for id in self.parent().data.trackIds():
+            self.addTrack(id)
 
         self.settings_layout.addWidget(QLabel("Height offset"))
         self.height_offset = DoubleSlider(orientation=Qt.Orientation.Horizontal)
@@ -154,11 +176,29 @@ class GeometrySettingsDock(QDockWidget):
             for row in to_remove:
                 self.list_widget.takeItem(row)
 
-    @Slot(int, QVector3D)
-    def updateTrack(self, id: int, pos: QVector3D):
-        # print("Updating track:", pos)
-        label = self.tracks[id]
-        label.setText(f"Track {id}: {round(pos.x(), 2)}, {round(pos.y(), 2)}, {round(pos.z(), 2)}")
+    @Slot(int)
+    def addTrack(self, id: int) -> None:
+        label = QLabel(f"Track {id}: 0.0, 0.0, 0.0")
+        position = sum(1 for other in self.tracks if other < id)
+        self.tracks_layout.insertWidget(position, label)
+        self.tracks[id] = label
+        self.readout.addLabel(id, label, _formatTrack(id))
+
+    @Slot(int)
+    def removeTrack(self, id: int) -> None:
+        label = self.tracks.pop(id, None)
+        if label is not None:
+            self.readout.removeLabel(id)
+            label.deleteLater()
+
+    @Slot(object)
+    def updateTracks(self, ids: np.ndarray):
+        positions = self.parent().data.track_store.position[ids]
+        for id, pos in zip(ids.tolist(), positions):
+            self.readout.setValue(id, pos)
+
+    def currentItemChanged(self, current: QListWidgetItem | None, previous: QListWidgetItem | None):
+        self.selectedHomographyPointChanged.emit("" if current is None else str(current.data(-1)))
 
     def homographyListClick(self, item: QListWidgetItem):
         if str(item.data(-1)) == "__add_new__":
@@ -0,0 +1,62 @@
+"""Runs the tracking and output engine without any windows, for instance on a rack server:
+
+    python headless.py Projects/show.lho --dmx-protocol sACN
+
+Ctrl+C stops it cleanly.
+"""
+import argparse
+import signal
+import sys
+
+from startup_timer import startup
+
+from PySide6.QtCore import QCoreApplication, QSize, QTimer
+
+from dmx_output import DMXOutput
+from engine import Engine
+
+
+def main() -> int:
+    startup.milestone("Modules imported")
+    parser = argparse.ArgumentParser(description="Lighthouse tracking and PSN/DMX output with no GUI")
+    parser.add_argument("show_file", nargs="?", help=".lho show file, defaults to the last one opened")
+    parser.add_argument("--dmx-protocol", choices=DMXOutput.protocols, default="Off")
+    parser.add_argument("--dmx-destination", default="", help="Defaults to multicast / broadcast")
+    parser.add_argument("--no-space-mouse", action="store_true", help="Don't look for SpaceMouse devices")
+    parser.add_argument(
+        "--video-resolution", default="1280x720", help="WIDTHxHEIGHT of the camera the show was calibrated against"
+    )
+    parser.add_argument("--startup-only", action="store_true", help="Quit once the show is loaded, to time startup")
+    args = parser.parse_args()
+    try:
+        width, height = (int(v) for v in args.video_resolution.lower().split("x"))
+    except ValueError:
+        width = height = 0
+    if width <= 0 or height <= 0:
+        parser.error(f"--video-resolution should look like 1920x1080, not {args.video_resolution}")
+
+    app = QCoreApplication(sys.argv)
+    engine = Engine(use_space_mouse=not args.no_space_mouse)
+    engine.data.setVideoResolution(QSize(width, height))
+    engine.dmx_output.setDestination(args.dmx_destination)
+    engine.dmx_output.setProtocol(args.dmx_protocol)
+    startup.expect("Show loaded", path=engine.data.src_folder.parent / "Projects" / ".cache" / "startup_headless.json")
+    if args.startup_only:
+        engine.data.show_loaded.connect(app.quit)
+    engine.load(args.show_file)
+    app.aboutToQuit.connect(engine.stop)
+
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    # Python signal handlers only run between bytecodes, so give the interpreter a look in now and then
+    wake = QTimer()
+    wake.timeout.connect(lambda: None)
+    wake.start(200)
+
+    startup.milestone("Engine running")
+    print("[info] Ctrl+C to stop")
+    return app.exec()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,39 @@
 from typing import Tuple
 import numpy as np
+import cv2 as cv
 
 
 # https://stackoverflow.com/questions/43219259/how-to-get-the-ray-equation-of-a-2d-point-in-world-space
-def imagePointToRay(point: np.ndarray, camera_matrix: np.ndarray, translation: np.ndarray, rotation: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    point_on_camera_plane = np.array([(point[0] - camera_matrix[2, 0]) / camera_matrix[0, 0], (point[1] - camera_matrix[2, 1]) / camera_matrix[1, 1], 1])
-    # transformation_matrix = ...
-    return (translation, transformation_matrix * point_on_camera_plane - translation)
+def imagePointsToRays(
+    points: np.ndarray, camera_matrix: np.ndarray, camera_dist: np.ndarray | None, camera_inv: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert an (N, 2) array of pixel coordinates into world space rays.
+
+    Returns the camera position (shared origin of every ray) and an (N, 3) array of ray directions.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    # If calibrated camera, account for distortion parameters.
+    # Without a projection matrix undistortPoints returns normalised camera plane coordinates directly.
+    if camera_dist is not None:
+        on_camera_plane = cv.undistortPoints(points.reshape(-1, 1, 2), camera_matrix, camera_dist).reshape(-1, 2)
+    else:
+        on_camera_plane = (points - camera_matrix[:2, 2]) / np.diag(camera_matrix)[:2]
+
+    point_on_camera_plane = np.ones((len(points), 3))
+    point_on_camera_plane[:, :2] = on_camera_plane
+
+    cam_pos = camera_inv[:3, 3]
+    rays = point_on_camera_plane @ camera_inv[:3, :3].T
+    return cam_pos, rays
+
+
+if __name__ == "__main__":
+    camera_matrix = np.array([[1000.0, 0, 640], [0, 1000.0, 360], [0, 0, 1]])
+    camera_inv = np.identity(4)
+    camera_inv[:3, 3] = [0, 0, 10]
+    origin, rays = imagePointsToRays(np.array([[640, 360], [1640, 360]]), camera_matrix, None, camera_inv)
+    assert np.linalg.norm(origin - np.array([0, 0, 10])) < 0.00001
+    assert np.linalg.norm(rays - np.array([[0, 0, 1], [1, 0, 1]])) < 0.00001
+    _, rays_dist = imagePointsToRays(np.array([[640, 360], [1640, 360]]), camera_matrix, np.zeros(4), camera_inv)
+    assert np.linalg.norm(rays - rays_dist) < 0.00001
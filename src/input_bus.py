@@ -0,0 +1,213 @@
+import time
+
+import numpy as np
+from PySide6.QtCore import QObject, QPoint, QTimer, Qt, Signal, Slot
+
+from latency import pipeline
+
+CURSOR = "Cursor"
+# Always there so shows can be set up without the SpaceMice plugged in, DataStore.setSpaceMouseCount adds the rest
+DEFAULT_SOURCES = [CURSOR, "Space Mouse 1", "Space Mouse 2"]
+DRAIN_FREQUENCY = 60  # Hz, matches the PSN output rate
+
+
+def spaceMouseSource(id: int) -> str:
+    return f"Space Mouse {id + 1}"
+
+
+def autoFollowSource(track_id: int) -> str:
+    """Each followed track gets its own source, see auto_tracker"""
+    return f"Auto follow {track_id + 1}"
+
+
+def isAutoFollowSource(name: str) -> bool:
+    return name.startswith("Auto follow ")
+
+
+def defaultSource(track_id: int, sources) -> str:
+    """Before anything is chosen each track follows the SpaceMouse with the same index, as it always has, or the
+    cursor for tracks without a SpaceMouse of their own"""
+    source = spaceMouseSource(track_id)
+    return source if source in sources else CURSOR
+
+
+class SampleRing:
+    """Fixed size ring of timestamped (t, x, y) screen samples.
+
+    One producer thread pushes and the GUI thread drains. The write counter is only advanced after the sample is
+    written, so the reader never sees a half written row. If the producer laps the reader the oldest samples are lost.
+    """
+
+    def __init__(self, size: int = 256):
+        self._data = np.zeros((size, 3))
+        self._written = 0
+        self._read = 0
+
+    def push(self, t: float, x: float, y: float) -> None:
+        row = self._data[self._written % len(self._data)]
+        row[0] = t
+        row[1] = x
+        row[2] = y
+        self._written += 1
+
+    def drain(self) -> np.ndarray:
+        """Every sample pushed since the last drain, oldest first, as an (N, 3) array"""
+        written = self._written
+        count = min(written - self._read, len(self._data))
+        self._read = written
+        if count == 0:
+            return self._data[:0]
+        indices = np.arange(written - count, written) % len(self._data)
+        return self._data[indices]
+
+
+class InputBus(QObject):
+    """Collects every input device's samples and hands them to the tracks once per output tick.
+
+    Producers (mouse events on the GUI thread, the SpaceMouse reader thread, network controllers) only push into their
+    source's ring. Once per tick the newest sample of each source is mapped to every track following that source and
+    emitted as a single batch, so a burst of mouse moves costs one homography and one redraw instead of one each.
+    """
+
+    tracks_input = Signal(object, object, object)  # (N,) array of track ids, (N, 2) array of screen points, (N,) input times
+    sources_changed = Signal()  # A source was registered, tracks on their default may have moved to it
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sources: dict[str, SampleRing] = {}
+        self._track_names: list[str | None] = []  # As set, before defaults are filled in
+        self._track_sources: list[str | None] = []
+        self._owners = np.zeros(0, dtype=np.intp)  # Index into sources of each track's source, -1 for none
+        for name in DEFAULT_SOURCES:
+            self.addSource(name)
+        self.pushed = 0
+        self.batches = 0
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.drain)
+        self.timer.start(round(1000 / DRAIN_FREQUENCY))
+
+    def addSource(self, name: str) -> None:
+        if name not in self.sources:
+            sources = dict(self.sources)
+            sources[name] = SampleRing()
+            self.sources = sources
+            self._updateOwners()
+            self.sources_changed.emit()
+
+    def sourceNames(self) -> list[str]:
+        return list(self.sources.keys())
+
+    def deviceNames(self) -> list[str]:
+        """Sources a track can be given, the auto follow sources belong to the auto tracker"""
+        return [name for name in self.sources if not isAutoFollowSource(name)]
+
+    def setTrackSources(self, names: list[str | None]) -> None:
+        """One source name per track id, an empty name means the default for that track and None follows nothing"""
+        self._track_names = list(names)
+        self._updateOwners()
+
+    def _updateOwners(self) -> None:
+        self._track_sources = []
+        for id, name in enumerate(self._track_names):
+            self._track_sources.append(None if name is None else name or defaultSource(id, self.sources))
+        index = {name: i for i, name in enumerate(self.sources)}
+        self._owners = np.array([index.get(name, -1) for name in self._track_sources], dtype=np.intp)
+
+    def trackSource(self, track_id: int) -> str | None:
+        if track_id < len(self._track_sources):
+            return self._track_sources[track_id]
+        return defaultSource(track_id, self.sources)
+
+    def push(self, source: str, x: float, y: float, t: float | None = None) -> None:
+        """Safe from any thread as long as each source only has one producer"""
+        ring = self.sources.get(source)
+        if ring is None:
+            return
+        ring.push(time.monotonic() if t is None else t, x, y)
+        self.pushed += 1
+
+    @Slot(QPoint)
+    def pushCursor(self, point: QPoint) -> None:
+        self.push(CURSOR, point.x(), point.y())
+
+    @Slot(int, QPoint)
+    def pushSpaceMouse(self, id: int, point: QPoint) -> None:
+        """Connect with Qt.DirectConnection so the reader thread writes straight into the ring"""
+        self.push(spaceMouseSource(id), point.x(), point.y())
+
+    @Slot()
+    def drain(self) -> None:
+        owners = self._owners
+        rings = list(self.sources.values())
+        latest = np.zeros((len(rings) + 1, 3))  # The extra row stays empty for tracks without a source
+        fresh = np.zeros(len(rings) + 1, dtype=bool)
+        for index, ring in enumerate(rings):
+            samples = ring.drain()
+            if len(samples):
+                latest[index] = samples[-1]  # Positions are absolute, the newest sample supersedes the rest
+                fresh[index] = True
+
+        if not fresh.any() or len(owners) == 0:
+            return
+        ids = np.flatnonzero(fresh[owners])
+        if len(ids):
+            self.batches += 1
+            samples = latest[owners[ids]]
+            pipeline.recordSince("bus", samples[:, 0].tolist())
+            self.tracks_input.emit(ids, samples[:, 1:], samples[:, 0])
+
+
+if __name__ == "__main__":
+    import threading
+
+    from PySide6.QtCore import QCoreApplication
+
+    app = QCoreApplication([])
+
+    ring = SampleRing(4)
+    for i in range(6):
+        ring.push(i, i, -i)
+    assert ring.drain()[:, 0].tolist() == [2, 3, 4, 5]  # Oldest two were overwritten
+    assert len(ring.drain()) == 0
+
+    # A 1 kHz producer thread for two tracks' sources should reach the tracks as ~60 batches a second
+    bus = InputBus()
+    bus.setTrackSources(["", CURSOR])
+    received = []
+    bus.tracks_input.connect(lambda ids, points, times: received.append((ids, points.copy())))
+
+    def produce():
+        for i in range(1000):
+            bus.push("Space Mouse 1", i, i)
+            time.sleep(0.001)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    for i in range(200):
+        bus.pushCursor(QPoint(i, 0))
+    QTimer.singleShot(1500, app.quit)
+    app.exec()
+    producer.join()
+
+    print(f"{bus.pushed} samples pushed, {len(received)} batches delivered")
+    assert received[0][0].tolist() == [0, 1] and received[0][1][1].tolist() == [199, 0]
+    assert received[-1][1][0].tolist() == [999, 999]
+    assert len(received) < bus.pushed / 5
+
+    # A removed track follows nothing, even though its source has samples
+    bus.setTrackSources([None, CURSOR])
+    received.clear()
+    bus.pushCursor(QPoint(5, 5))
+    bus.push("Space Mouse 1", 1, 1)
+    bus.drain()
+    assert received[0][0].tolist() == [1]
+
+    # Tracks without a SpaceMouse of their own default to the cursor, until one is registered
+    bus.setTrackSources(["", "", ""])
+    assert bus._owners.tolist() == [1, 2, 0] and bus.trackSource(2) == CURSOR
+    bus.addSource(spaceMouseSource(2))
+    assert bus.trackSource(2) == "Space Mouse 3" and bus._owners[2] == 3
+    bus.addSource(autoFollowSource(0))
+    assert bus.deviceNames() == [CURSOR, "Space Mouse 1", "Space Mouse 2", "Space Mouse 3"]
@@ -0,0 +1,139 @@
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+from PySide6.QtCore import QObject, QTimer, Slot
+
+# Each stage is timed from the input event that caused it, so the difference between consecutive stages is where the
+# time went. Input events are the cursor or SpaceMouse sample being pushed, or the camera frame arriving for auto follow.
+STAGES = ["bus", "set_track", "homography", "filter", "encode", "sendto"]
+MIN_LOG = -5  # 10us, the smallest bin edge
+MAX_LOG = 1  # 10s
+BINS_PER_DECADE = 20  # ~12% wide bins
+DUMP_PERIOD = 10  # seconds
+
+
+class LatencyHistogram:
+    """Log spaced latency histogram.
+
+    Each histogram has a single writer thread, so recording is a couple of list increments with no lock. Readers just
+    copy the counts, a sample landing mid copy only shifts a percentile by one sample.
+    """
+
+    def __init__(self):
+        self.bins = (MAX_LOG - MIN_LOG) * BINS_PER_DECADE + 2  # Plus underflow and overflow
+        self.counts = [0] * self.bins
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        if seconds <= 10**MIN_LOG:
+            index = 0
+        else:
+            index = min(int((math.log10(seconds) - MIN_LOG) * BINS_PER_DECADE) + 1, self.bins - 1)
+        self.counts[index] += 1
+        self.count += 1
+
+    def reset(self) -> None:
+        self.counts = [0] * self.bins
+        self.count = 0
+
+    @staticmethod
+    def upperEdge(index: int) -> float:
+        return 10 ** (MIN_LOG + index / BINS_PER_DECADE)
+
+    def percentiles(self, ps: list[float]) -> list[float]:
+        """Upper edge of the bin each percentile falls in, seconds. NaN while empty."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if total == 0:
+            return [math.nan] * len(ps)
+        results = []
+        for p in ps:
+            target = total * p / 100
+            seen = 0
+            for index, count in enumerate(counts):
+                seen += count
+                if seen >= target and count:
+                    results.append(self.upperEdge(index))
+                    break
+        return results
+
+    def summary(self) -> dict:
+        """Percentiles in milliseconds, None while empty"""
+        p50, p95, p99 = (None if math.isnan(p) else p * 1000 for p in self.percentiles([50, 95, 99]))
+        return {"count": self.count, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+class PipelineLatency:
+    """Per stage glass to packet latency histograms, shared by every stage of the pipeline through `pipeline` below"""
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.started = time.time()
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.histograms[stage].record(seconds)
+
+    def recordSince(self, stage: str, input_times, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        histogram = self.histograms[stage]
+        for t in input_times:
+            histogram.record(now - t)
+
+    def reset(self) -> None:
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.started = time.time()
+
+    def summary(self) -> dict:
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+
+pipeline = PipelineLatency()
+
+
+class LatencyDumper(QObject):
+    """Periodically writes the pipeline summary as JSON, replacing the file atomically so readers never see half of it"""
+
+    def __init__(self, path: Path, extra=None, period: float = DUMP_PERIOD, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.extra = extra  # Optional callable returning more sections, for instance the PSN send statistics
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.dump)
+        self.timer.start(round(period * 1000))
+
+    @Slot()
+    def dump(self) -> None:
+        report = {"time": time.time(), "since": pipeline.started, "stages": pipeline.summary()}
+        if self.extra is not None:
+            report.update(self.extra())
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps(report, indent=1))
+            os.replace(tmp_file, self.path)
+        except (OSError, TypeError) as e:
+            print("[Error] Couldn't write the latency report", e)
+
+
+if __name__ == "__main__":
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(np.log(0.004), 0.6, 200_000)
+    histogram = LatencyHistogram()
+    start = time.perf_counter()
+    for sample in samples.tolist():
+        histogram.record(sample)
+    per_sample = (time.perf_counter() - start) / len(samples)
+
+    ours = histogram.percentiles([50, 95, 99])
+    exact = np.percentile(samples, [50, 95, 99])
+    for p, a, b in zip([50, 95, 99], ours, exact):
+        print(f"p{p}: histogram {a * 1000:.3f}ms, exact {b * 1000:.3f}ms")
+        assert b <= a <= b * 10 ** (1 / BINS_PER_DECADE) * 1.001  # Never under, at most one bin over
+    print(f"record {per_sample * 1e9:.0f}ns per sample")
+    assert LatencyHistogram().summary()["p99_ms"] is None
@@ -0,0 +1,196 @@
+from typing import Callable
+
+from PySide6.QtCore import QEvent, QObject, Qt, QTimer, Slot
+from PySide6.QtWidgets import QLabel, QScrollArea, QWidget
+
+DEFAULT_REFRESH_RATE = 60.0  # Hz, when the screen doesn't report one
+
+
+class LiveReadout(QObject):
+    """Labels showing values that change faster than anyone can read them, for one dock.
+
+    setValue only stores the newest value. A timer paced to the screen's refresh rate formats and sets the text of the
+    labels whose values changed, and only while the dock is visible, so a hidden dock costs nothing but the stores.
+    When it's shown again every label catches up with its latest value on the next refresh. Text that comes out the
+    same isn't set again, so a still value doesn't relayout the dock. Labels scrolled out of view aren't set either,
+    see watchScrollArea, so a dock with hundreds of them only pays for the few on screen.
+
+    Docks that pull their values instead, like the network stats, pass poll. It's called before each refresh while
+    visible, at period ms rather than the display rate.
+    """
+
+    def __init__(self, widget: QWidget, poll: Callable[[], None] | None = None, period: int | None = None):
+        super().__init__(widget)
+        self.widget = widget
+        self.poll = poll
+        self.labels: dict[object, tuple[QLabel, Callable[[object], str]]] = {}
+        self.values: dict = {}
+        self.texts: dict = {}  # Last text set on each label
+        self.dirty: set = set()
+        self.offscreen: set = set()  # Changed while scrolled out of view, set when they're scrolled back
+        self._viewports: list[QWidget] = []
+        self.refreshes = 0
+        self.texts_set = 0
+
+        self.period = period
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.refresh)
+        widget.installEventFilter(self)
+
+    def refreshPeriod(self) -> int:
+        if self.period is not None:
+            return self.period
+        screen = self.widget.screen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return max(1, round(1000 / (rate if rate > 0 else DEFAULT_REFRESH_RATE)))
+
+    def addLabel(self, key, label: QLabel, format: Callable[[object], str] = str) -> None:
+        self.labels[key] = (label, format)
+        self.texts.pop(key, None)
+        if key in self.values:
+            self.dirty.add(key)
+            self._wake()
+
+    def removeLabel(self, key) -> None:
+        self.labels.pop(key, None)
+        self.values.pop(key, None)
+        self.texts.pop(key, None)
+        self.dirty.discard(key)
+        self.offscreen.discard(key)
+
+    def setValue(self, key, value) -> None:
+        self.values[key] = value
+        self.dirty.add(key)
+        self._wake()
+
+    def watchScrollArea(self, area: QScrollArea) -> None:
+        """Catch labels up as they're scrolled or resized into view"""
+        area.verticalScrollBar().valueChanged.connect(self.reveal)
+        area.horizontalScrollBar().valueChanged.connect(self.reveal)
+        area.viewport().installEventFilter(self)
+        self._viewports.append(area.viewport())
+
+    @Slot()
+    def reveal(self) -> None:
+        if self.offscreen:
+            self.dirty |= self.offscreen
+            self.offscreen = set()
+            self._wake()
+
+    def _wake(self) -> None:
+        if not self.timer.isActive() and self.widget.isVisible():
+            self.timer.start(self.refreshPeriod())
+
+    @Slot()
+    def refresh(self) -> None:
+        if not self.widget.isVisible():
+            self.timer.stop()
+            return
+        if self.poll is not None:
+            self.poll()
+        elif not self.dirty:
+            self.timer.stop()
+            return
+        self.refreshes += 1
+        dirty = self.dirty
+        self.dirty = set()
+        for key in dirty:
+            entry = self.labels.get(key)
+            if entry is None:
+                continue
+            label, format = entry
+            if label.visibleRegion().isEmpty():
+                self.offscreen.add(key)
+                continue
+            text = format(self.values[key])
+            if self.texts.get(key) != text:
+                label.setText(text)
+                self.texts[key] = text
+                self.texts_set += 1
+
+    def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+        if watched in self._viewports:
+            if event.type() == QEvent.Type.Resize:
+                self.reveal()
+        elif watched is self.widget:
+            if event.type() == QEvent.Type.Show:
+                self.dirty |= self.offscreen
+                self.offscreen = set()
+                if self.dirty or self.poll is not None:
+                    self.timer.start(self.refreshPeriod())
+                    QTimer.singleShot(0, self.refresh)  # Don't show stale text for a whole period
+            elif event.type() == QEvent.Type.Hide:
+                self.timer.stop()
+        return False
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication, QVBoxLayout
+
+    app = QApplication([])
+    dock = QWidget()
+    layout = QVBoxLayout(dock)
+    readout = LiveReadout(dock)
+    labels = [QLabel() for _ in range(256)]
+    for id, label in enumerate(labels):
+        layout.addWidget(label)
+        readout.addLabel(id, label, lambda p: f"{p[0]:.2f}, {p[1]:.2f}")
+    dock.show()
+
+    # Two devices at 60Hz each moving every label's value for a second, and a second of updates while hidden
+    def feed(seconds: float) -> int:
+        updates = 0
+        start = time.monotonic()
+        deadline = start
+        while time.monotonic() - start < seconds:
+            for id in range(len(labels)):
+                readout.setValue(id, (deadline, -deadline))
+            updates += len(labels)
+            deadline += 1 / 120
+            while time.monotonic() < deadline:
+                app.processEvents()
+        return updates
+
+    updates = feed(1.0)
+    shown = (readout.refreshes, readout.texts_set)
+    print(f"Visible: {updates} values set, {shown[0]} refreshes, {shown[1]} labels set")
+    assert shown[0] <= 65 and shown[1] <= 256 * 65
+
+    dock.hide()
+    feed(1.0)
+    assert (readout.refreshes, readout.texts_set) == shown  # Nothing formatted or set while hidden
+    dock.show()
+    for _ in range(5):
+        app.processEvents()
+        time.sleep(0.01)
+    assert labels[0].text() == f"{readout.values[0][0]:.2f}, {readout.values[0][1]:.2f}"  # Caught up on showing
+    print(f"Hidden: nothing set, caught up with {readout.texts_set - shown[1]} labels when shown again")
+
+    # In a scroll area only the labels on screen are set, the rest catch up when they're scrolled to
+    area = QScrollArea()
+    content = QWidget()
+    layout = QVBoxLayout(content)
+    scrolled = LiveReadout(area)
+    scrolled.watchScrollArea(area)
+    labels = [QLabel() for _ in range(256)]
+    for id, label in enumerate(labels):
+        layout.addWidget(label)
+        scrolled.addLabel(id, label, lambda p: f"{p[0]:.2f}, {p[1]:.2f}")
+    area.setWidget(content)
+    area.resize(300, 200)
+    area.show()
+    app.processEvents()
+    for id in range(len(labels)):
+        scrolled.setValue(id, (1.0, float(id)))
+    scrolled.refresh()
+    assert labels[0].text() and not labels[-1].text() and scrolled.texts_set < 20
+    area.verticalScrollBar().setValue(area.verticalScrollBar().maximum())
+    app.processEvents()
+    scrolled.refresh()
+    assert labels[-1].text() == "1.00, 255.00"
+    print(f"Scrolled: {scrolled.texts_set} of {len(labels)} labels set")
@@ -1,13 +1,16 @@
 import os
-import pickle
 import sys
 from pathlib import Path
 
+from startup_timer import startup
+
+import numpy as np
+
 # import ptvsd  # ptvsd.debug_this_thread()
 
 os.environ["QT_DRIVER"] = "PySide6"
 
-from PySide6.QtCore import Slot, Qt, QDir
+from PySide6.QtCore import Slot, Qt, QDir, QTimer
 from PySide6.QtGui import (
     QAction,
     QIcon,
@@ -44,9 +47,10 @@ from geometry_settings_dock import GeometrySettingsDock
 from fixture_settings_dock import FixtureSettingsDock
 from track_settings_dock import TrackSettingsDock
 from video_display_widget import VideoDisplayWidget
-from data_store import DataStore
-from psn_output import PSNOutput
-from space_mouse import SpaceMouse, createAllSpaceMice
+from engine import Engine
+from auto_tracker import AutoTracker, stageRoi
+from frame_tap import FrameTap
+from undistort_view import UndistortView
 from network_settings import NetworkSettings
 
 from dev_status import is_release
@@ -81,64 +85,65 @@ class ConfirmExitDialog(QDialog):
 
 class App(QMainWindow):
     def __init__(self):
-        print("[startup] Creating the main window")
+        startup.begin("Creating the main window")
         super().__init__()
         self.setWindowTitle("Lighthouse")
         self.resize(800, 400)
 
         # self.setWindowFlags(Qt.FramelessWindowHint)
 
-        print("[startup] Creating the data store")
-        self.data = DataStore()
-        self.data.setParent(self)
+        startup.begin("Creating the engine")
+        self.engine = Engine(parent=self)
+        self.data = self.engine.data
+        self.psn_output = self.engine.psn_output
+        self.dmx_output = self.engine.dmx_output
+        self.space_mouse_reader = self.engine.space_mouse_reader
 
         self._previous_save_filename = "showfile.lho"
         self._previous_save_filedir = self.data.src_folder.parents[0] / "Projects"
 
-        print("[startup] Creating central widget and layout")
+        startup.begin("Creating central widget and layout")
         vbox = QVBoxLayout()
         central = QWidget()
         central.setLayout(vbox)
         self.setCentralWidget(central)
 
-        print("[startup] Creating video display")
+        startup.begin("Creating video display")
         # self.video_widget = VideoDisplayWidget()
         # self.video_widget = QVideoWidget()
         # vbox.addWidget(self.video_widget)
 
         self.video_widget = VideoDisplayWidget(parent=self)
-        self.video_widget.addTrack()
-        self.video_widget.addTrack()
+        for id in self.data.trackIds():
+            self.video_widget.addTrack(id)
         vbox.addWidget(self.video_widget)
-        self.data.track_changed.connect(self.video_widget.updateTrack)
+        self.data.tracks_updated.connect(self.video_widget.updateTracks)
+        self.data.track_added.connect(self.video_widget.addTrack)
+        self.data.track_removed.connect(self.video_widget.removeTrack)
+        self.data.setVideoResolution(self.video_widget.video_resolution)
+        self.video_widget.resolution_changed.connect(self.data.setVideoResolution)
         # self.video_scene = QGraphicsScene()
         # self.video_view = QGraphicsView()
         # self.video_widget.video_view.setScene(self.video_scene)
         # vbox.addWidget(self.video_view)
 
-        print("[startup] Creating camera")
+        startup.begin("Creating camera")
         self.camera = QCamera()
-        print("[startup] Creating capture session")
+        startup.begin("Creating capture session")
         self.capture_session = QMediaCaptureSession()
-        # print("[startup] Creating video sink")
-        # self.camera_video_sink = QVideoSink()
 
         self.video_widget.setVideoInput(self.capture_session)
 
-        print("[startup] Setting capture session camera")
+        startup.begin("Setting capture session camera")
         self.capture_session.setCamera(self.camera)
-        # print("[startup] Setting capture session video sink")
-        # self.capture_session.setVideoSink(self.camera_video_sink)
-        # print("[startup] Attaching new frame callback")
-        # self.camera_video_sink.videoFrameChanged.connect(self.displayVideoFrame)
         # self.capture_session.setVideoOutput(self.video_widget)
 
         # self.video_view.fitInView(self.video_item)
 
-        print("[startup] Starting camera")
+        startup.begin("Starting camera")
         self.camera.start()
 
-        print("[startup] Creating settings docks and windows")
+        startup.begin("Creating settings docks and windows")
         self.network_settings = NetworkSettings()
 
         self.geometry_settings_dock = GeometrySettingsDock(parent=self)
@@ -149,7 +154,7 @@ class App(QMainWindow):
         self.track_settings_dock = TrackSettingsDock(parent=self)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.track_settings_dock)
 
-        print("[startup] Creating action bar")
+        startup.begin("Creating action bar")
         # https://icons8.com/icon/set/lighthouse/cotton
         self.lighthouse_action = QAction(
             QIcon(str((self.data.src_folder / "images/icons/icons8-lighthouse-64.png").absolute())), "&Lighthouse", self
@@ -203,6 +208,13 @@ class App(QMainWindow):
         )
         self.track_settings_action.triggered.connect(self.toggleTrackSettings)
 
+        self.undistort_action = QAction("&Undistort", self)
+        self.undistort_action.setCheckable(True)
+        self.undistort_action.setToolTip("Show the video with lens distortion removed")
+        self.updateUndistortAction()
+        self.undistort_action.toggled.connect(self.undistortActionCallback)
+        self.data.show_loaded.connect(self.updateUndistortAction)
+
         self.exit_action = QAction(
             QIcon(str((self.data.src_folder / "images/icons/icons8-cancel-64.png").absolute())), "&Exit", self
         )
@@ -218,40 +230,109 @@ class App(QMainWindow):
         file_tool_bar.addAction(self.track_settings_action)
         file_tool_bar.addAction(self.geometry_settings_action)
         file_tool_bar.addAction(self.network_settings_action)
+        file_tool_bar.addAction(self.undistort_action)
         file_tool_bar.addAction(self.exit_action)
         file_tool_bar.setMovable(False)
 
-        print("[startup] Connecting slots and signals")
+        startup.begin("Connecting slots and signals")
 
         self.geometry_settings_dock.height_offset.doubleValueChanged.connect(self.data.setHeightOffset)
+        self.data.height_offset_changed.connect(self.geometry_settings_dock.height_offset.setValue)
+        self.geometry_settings_dock.editHomographyPointsChanged.connect(self.data.setEditHomographyPoints)
+        self.geometry_settings_dock.selectedHomographyPointChanged.connect(self.data.setSelectedHomographyPoint)
 
-        self.data.track_changed.connect(self.geometry_settings_dock.updateTrack)
+        self.data.tracks_updated.connect(self.geometry_settings_dock.updateTracks)
+        self.data.track_added.connect(self.geometry_settings_dock.addTrack)
+        self.data.track_removed.connect(self.geometry_settings_dock.removeTrack)
         self.data.homography_points_changed.connect(self.geometry_settings_dock.updateHomographyPoints)
 
         self.video_widget.click_position.connect(self.data.setHomographyScreenPoint)
+        self.video_widget.click_position.connect(self.data.input_bus.pushCursor)
+        self.track_settings_dock.trackInputDeviceChanged.connect(self.data.setTrackInputDevice)
+        self.track_settings_dock.trackResponseCurveChanged.connect(self.data.setTrackResponseCurve)
+        self.track_settings_dock.addNewTrack.connect(self.data.addTrack)
+        self.track_settings_dock.removeTrack.connect(self.data.removeTrack)
+        self.data.track_added.connect(self.track_settings_dock.insertTrackEditor)
+        self.data.track_removed.connect(self.track_settings_dock.removeTrackEditor)
         # self.video_widget.click_position.connect(self.data.setTrack0)
 
         self.geometry_settings_dock.addNewHomographyPoint.connect(self.data.addNewHomographyPoint)
         self.geometry_settings_dock.editHomographyPoint.connect(self.data.setHomographyPoint)
         self.geometry_settings_dock.removeHomographyPoint.connect(self.data.removeHomographyPoint)
 
+        self.data.fixtures_changed.connect(self.fixture_settings_dock.updateFixtures)
+        self.fixture_settings_dock.addFixture.connect(self.data.addFixture)
+        self.fixture_settings_dock.editFixture.connect(self.data.setFixture)
+        self.fixture_settings_dock.removeFixture.connect(self.data.removeFixture)
+
         self.data.broadcast()
 
-        print("[startup] Setting up PSN")
-        self.psn_output = PSNOutput()
-        self.psn_output.addTrack()
-        self.psn_output.addTrack()
-        self.data.track_changed.connect(self.psn_output.setTrackWithPos)
+        self.track_settings_dock.trackFilterChanged.connect(self.psn_output.setTrackFilter)
+        self.network_settings.setPSNOutput(self.psn_output)
+        self.fixture_settings_dock.protocol.currentTextChanged.connect(self.dmx_output.setProtocol)
+        self.fixture_settings_dock.destination.textChanged.connect(self.dmx_output.setDestination)
+        self.fixture_settings_dock.overrideFixture.connect(self.dmx_output.setOverride)
+        self.fixture_settings_dock.clearOverride.connect(self.dmx_output.clearOverride)
+
+        if self.space_mouse_reader is not None:
+            self.space_mouse_reader.setClampResolution(self.video_widget.video_resolution)
+            self.video_widget.resolution_changed.connect(self.space_mouse_reader.setClampResolution)
+
+        startup.begin("Tapping video frames")
+        self.frame_tap = FrameTap(parent=self)
+        # Direct so the tap only takes a reference on the thread frames arrive on, rather than queueing every frame
+        self.video_widget.video_item.videoSink().videoFrameChanged.connect(self.frame_tap.pushFrame, Qt.DirectConnection)
+
+        self.undistort_view = UndistortView(parent=self)
+        self.frame_tap.addConsumer(self.undistort_view.onFrame, self.undistort_view.active)
+        self.undistort_view.frame_ready.connect(self.video_widget.showUndistortedFrame)
+        self.video_widget.undistorted_frame_shown.connect(self.undistort_view.displayed)
+        self.video_widget.view_resized.connect(self.undistort_view.setViewSize)
+
+        startup.begin("Starting auto tracker")
+        self.auto_tracker = AutoTracker(self.data.input_bus, parent=self)
+        self.auto_tracker.setResolution(self.video_widget.video_resolution)
+        self.frame_tap.addConsumer(self.auto_tracker.onFrame, self.auto_tracker.active)
+        self.video_widget.resolution_changed.connect(self.auto_tracker.setResolution)
+        self.video_widget.resolution_changed.connect(self.updateAutoTrackerRoi)
+        self.data.homography_points_changed.connect(self.updateAutoTrackerRoi)
+        self.track_settings_dock.trackAutoFollowChanged.connect(self.autoFollowCallback)
+        self.auto_tracker.lost.connect(self.autoFollowLost)
+        self.data.track_removed.connect(self.auto_tracker.release)
+        self.updateAutoTrackerRoi()
+
+        self.engine.load()
+        startup.end()
+
+    @Slot()
+    def updateUndistortAction(self):
+        # The camera calibration only arrives with the first show load
+        self.undistort_action.setEnabled(self.data.cameraModel() is not None)
+
+    def undistortActionCallback(self, checked: bool):
+        camera = self.data.cameraModel() if checked else None
+        self.undistort_view.setCamera(camera)
+        self.undistort_view.setViewSize(self.video_widget.size())
+        self.undistort_view.setEnabled(camera is not None)
+        self.video_widget.setUndistortedView(camera)
+
+    def autoFollowCallback(self, id: int, follow: bool):
+        if follow:
+            target = self.data.getTracks2D()[id][1]
+            self.auto_tracker.follow(id, target, self.data.tracks[id].tracker)
+        else:
+            self.auto_tracker.release(id)
+        self.data.setTrackAutoFollow(id, follow)
 
-        print("[startup] Setting up SpaceMouse")
-        try:
-            self.space_mice = createAllSpaceMice(self)
-            for mouse in self.space_mice:
-                mouse.watcher.cursor_moved.connect(self.data.setTrack)
-        except AttributeError as e:
-            print("[Error] No 3d input device found", e)
+    def autoFollowLost(self, id: int):
+        print(f"[info] Auto follow lost track {id}, back to its input device")
+        self.data.setTrackAutoFollow(id, False)
+        self.track_settings_dock.setAutoFollow(id, False)
 
-        self.data.find_previous_config()
+    def updateAutoTrackerRoi(self, _=None):
+        resolution = self.video_widget.video_resolution
+        points = [(p.screen_coord.x(), p.screen_coord.y()) for p in self.data.getHomographyPoints().values()]
+        self.auto_tracker.setRoi(stageRoi(np.array(points).reshape(-1, 2), resolution.width(), resolution.height()))
 
     def exitActionCallback(self, s):
         self.close()
@@ -280,9 +361,7 @@ class App(QMainWindow):
             filter="Lighthouse Save Files (*.lho)", options=QFileDialog.DontUseNativeDialog
         )[0]
         if fileName != "":
-            file = open(fileName, "wb")
-            pickle.dump(self.data.serialise(), file)
-            file.close()
+            self.data.save(fileName)
             self._previous_save_filedir = Path(fileName).parents[0]
             self._previous_save_filename = Path(fileName).name
             self.data.write_previous_config(fileName)
@@ -294,7 +373,7 @@ class App(QMainWindow):
         )[0]
         if fileName != "":
             print(fileName)
-            self.data.deserialise(fileName)
+            self.engine.load(fileName)
             self._previous_save_filedir = Path(fileName).parents[0]
             self._previous_save_filename = Path(fileName).name
             self.data.write_previous_config(fileName)
@@ -308,8 +387,6 @@ class App(QMainWindow):
             del self.camera
         # if hasattr(self, "captureSession"):
         #     del self.capture_session
-        # if hasattr(self, "cameraVideoSink"):
-        #     del self.camera_video_sink
 
         if id == -1:
             self.camera = QCamera()
@@ -317,8 +394,6 @@ class App(QMainWindow):
             self.camera = QCamera(QMediaDevices.videoInputs()[id])
 
         self.capture_session.setCamera(self.camera)
-        # self.capture_session.setVideoSink(self.camera_video_sink)
-        # self.camera_video_sink.videoFrameChanged.connect(self.displayVideoFrame)
         self.camera.start()
 
     def cameraChangedActionCallback(self, s):
@@ -326,38 +401,12 @@ class App(QMainWindow):
         if dialog.exec():
             self.initCamera(dialog.getCameraId())
 
-    # @Slot(QVideoFrame)
-    # def displayVideoFrame(self, frame: QVideoFrame):
-    #     # image_as_numpy_array = qimage2ndarray.rgb_view(frame.toImage(), byteorder=None)
-    #     img = frame.toImage()
-
-    #     painter = QPainter(img)
-
-    #     painter.setRenderHints(QPainter.Antialiasing, True)
-    #     # set the brush and pen to the same color
-    #     painter.setBrush(QColor(255, 0, 0))
-    #     pen = QPen()
-    #     pen.setColor(QColor(255, 0, 0))
-    #     pen.setWidth(3)
-    #     painter.setPen(pen)
-
-    #     brush = QBrush()
-    #     brush.setColor(QColor(0, 0, 0, 0))
-    #     painter.setBrush(brush)
-
-    #     for t in range(self.data.getNumTracks()):
-    #         painter.drawEllipse(self.data.getTrack2D(t), 30, 30)
-
-    #     painter.end()
-
-    #     pix = QPixmap.fromImage(img)
-    #     self.video_widget.setPixmap(pix)
-    #     # self.videoWidget.videoSink().setVideoFrame(frame)
-
     def cleanup(self):
         self.network_settings.close()
-        for mouse in self.space_mice:
-            mouse.cleanup()
+        self.engine.stop()
+        self.frame_tap.stop()
+        self.undistort_view.stop()
+        self.auto_tracker.stop()
 
     def closeEvent(self, event):
         if is_release:
@@ -372,9 +421,12 @@ class App(QMainWindow):
 
 
 if __name__ == "__main__":
+    startup.milestone("Modules imported")
     app = QApplication(sys.argv)
     a = App()
     app.setWindowIcon(QIcon(str((a.data.src_folder / "images/icons/icons8-lighthouse-64.png").absolute())))
 
+    startup.expect("Window shown", "Show loaded", path=a.data.src_folder.parent / "Projects/.cache/startup.json")
     a.show()
+    QTimer.singleShot(0, lambda: startup.milestone("Window shown"))  # First pass of the event loop, once it's painted
     sys.exit(app.exec())
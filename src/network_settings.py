@@ -9,15 +9,74 @@ from PySide6.QtWidgets import (
     QCheckBox,
     QSlider,
     QPushButton,
+    QGridLayout,
 )
 from PySide6.QtCore import Signal, Slot, Qt
 from PySide6.QtGui import QVector3D, QVector2D, QIconEngine, QIcon
 
+from latency import STAGES, pipeline
+from live_readout import LiveReadout
+
+REFRESH_PERIOD = 1000  # ms, only while the window is open
+COLUMNS = ["count", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _psn(stats: tuple[dict, dict]) -> str:
+    jitter, sent = stats
+    return (
+        f"PSN: {sent['sent']} packets sent, {sent['errors']} errors, "
+        f"send jitter p99 {_ms(jitter.get('p99_ms'))} ms, {jitter['overruns']} overruns"
+    )
+
 
 class NetworkSettings(QDockWidget):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.setWindowTitle("Network")
+        self.psn_output = None
+        self.readout = LiveReadout(self, poll=self.poll, period=REFRESH_PERIOD)
+
+        widget = QWidget()
         layout = QVBoxLayout()
-        self.label = QLabel("Another Window")
-        layout.addWidget(self.label)
-        self.setLayout(layout)
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        layout.addWidget(QLabel("Latency from input, ms"))
+        grid = QGridLayout()
+        for column, heading in enumerate(["Stage", "Samples", "p50", "p95", "p99"]):
+            grid.addWidget(QLabel(heading), 0, column)
+        for row, stage in enumerate(STAGES, start=1):
+            grid.addWidget(QLabel(stage), row, 0)
+            for column, key in enumerate(COLUMNS, start=1):
+                label = QLabel("-")
+                label.setAlignment(Qt.AlignmentFlag.AlignRight)
+                grid.addWidget(label, row, column)
+                self.readout.addLabel((stage, key), label, str if key == "count" else _ms)
+        layout.addLayout(grid)
+
+        self.psn_label = QLabel()
+        layout.addWidget(self.psn_label)
+        self.readout.addLabel("psn", self.psn_label, _psn)
+
+        reset = QPushButton("Reset")
+        reset.clicked.connect(self.reset)
+        layout.addWidget(reset)
+
+    def setPSNOutput(self, psn_output) -> None:
+        self.psn_output = psn_output
+
+    @Slot()
+    def reset(self) -> None:
+        pipeline.reset()
+        self.readout.refresh()
+
+    def poll(self) -> None:
+        for stage, summary in pipeline.summary().items():
+            for key in COLUMNS:
+                self.readout.setValue((stage, key), summary[key])
+        if self.psn_output is not None:
+            self.readout.setValue("psn", (self.psn_output.jitterStats(), self.psn_output.sendStats()))
@@ -0,0 +1,239 @@
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Tuple
+
+import numpy as np
+
+from image_point_to_ray import imagePointsToRays
+from plane_ray_intersection import planeRayIntersections
+
+
+class PixelLookupTable:
+    """Cached pixel -> stage position table for a fixed camera.
+
+    The table is an (height, width, 3) float32 .npy file that is memory mapped once built. Pixels whose ray misses the
+    stage plane are stored as NaN. Rebuilds run on a background thread and lookups fall back to the caller's exact path
+    (sample() reports them as invalid) until the new table is ready.
+    """
+
+    rows_per_chunk = 64
+    rebuild_delay = 0.2  # Seconds to wait for further changes (e.g. dragging the height slider) before building
+
+    def __init__(self, cache_folder: Path, resolution: Tuple[int, int] = (1280, 720)):
+        self.cache_folder = cache_folder
+        self.resolution = resolution  # width, height
+
+        self._table: np.ndarray | None = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def ready(self) -> bool:
+        return self._table is not None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._table = None
+
+    def rebuild(
+        self, camera_matrix: np.ndarray, camera_dist: np.ndarray | None, camera_inv: np.ndarray, height_offset: float
+    ) -> None:
+        with self._lock:
+            self._generation += 1
+            self._table = None
+            generation = self._generation
+        params = (
+            np.array(camera_matrix, dtype=np.float64),
+            None if camera_dist is None else np.array(camera_dist, dtype=np.float64),
+            np.array(camera_inv, dtype=np.float64),
+            float(height_offset),
+        )
+        thread = threading.Thread(target=self._rebuildThread, args=(generation, params), daemon=True)
+        thread.start()
+
+    def _rebuildThread(self, generation: int, params) -> None:
+        time.sleep(self.rebuild_delay)
+        if generation != self._generation:
+            return
+        start = time.perf_counter()
+        table = self.build(*params, generation=generation)
+        if table is None:
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._table = np.asarray(table)  # Plain ndarray view, indexing np.memmap is much slower
+                print(f"[info] Pixel lookup table ready in {time.perf_counter() - start:.2f}s")
+
+    def _cacheFile(self, camera_matrix, camera_dist, camera_inv, height_offset) -> Path:
+        key = hashlib.sha1()
+        for arr in (camera_matrix, camera_dist, camera_inv):
+            if arr is not None:
+                key.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+        key.update(np.array([height_offset, *self.resolution], dtype=np.float64).tobytes())
+        return self.cache_folder / f"pixel_lut_{key.hexdigest()[:16]}.npy"
+
+    def build(
+        self,
+        camera_matrix: np.ndarray,
+        camera_dist: np.ndarray | None,
+        camera_inv: np.ndarray,
+        height_offset: float,
+        generation: int | None = None,
+    ) -> np.ndarray | None:
+        """Build (or load from the cache) the table and return it memory mapped.
+
+        Returns None if a newer rebuild was requested part way through.
+        """
+        cache_file = self._cacheFile(camera_matrix, camera_dist, camera_inv, height_offset)
+        if cache_file.is_file():
+            try:
+                return np.load(cache_file, mmap_mode="r")
+            except (OSError, ValueError):
+                pass
+
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        width, height = self.resolution
+        tmp_file = cache_file.with_suffix(f".{threading.get_ident()}.tmp")
+        table = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float32, shape=(height, width, 3))
+
+        xs = np.arange(width, dtype=np.float64)
+        for row in range(0, height, self.rows_per_chunk):
+            if generation is not None and generation != self._generation:
+                del table
+                tmp_file.unlink(missing_ok=True)
+                return None
+            rows = np.arange(row, min(row + self.rows_per_chunk, height), dtype=np.float64)
+            grid = np.stack(np.meshgrid(xs, rows), axis=-1).reshape(-1, 2)
+            cam_pos, rays = imagePointsToRays(grid, camera_matrix, camera_dist, camera_inv)
+            world, valid = planeRayIntersections(cam_pos, rays, height_offset)
+            world[~valid] = np.nan
+            table[row : row + len(rows)] = world.reshape(len(rows), width, 3)
+
+        table.flush()
+        del table
+        tmp_file.replace(cache_file)
+
+        # Only the current calibration is worth keeping on disk
+        for old_file in self.cache_folder.glob("pixel_lut_*.npy"):
+            if old_file != cache_file:
+                try:
+                    old_file.unlink()
+                except OSError:
+                    pass  # Still mapped on platforms that don't allow deleting open files
+
+        return np.load(cache_file, mmap_mode="r")
+
+    def sample(self, screen_points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Bilinearly interpolate the table at an (N, 2) array of screen points.
+
+        Returns an (N, 3) array of world points and an (N,) validity mask. Points outside the table, next to pixels
+        that miss the stage, or requested while the table is being rebuilt are marked invalid.
+        """
+        screen_points = np.asarray(screen_points, dtype=np.float64).reshape(-1, 2)
+        table = self._table
+        if table is None:
+            return np.zeros((len(screen_points), 3)), np.zeros(len(screen_points), dtype=bool)
+
+        height, width = table.shape[:2]
+        if len(screen_points) == 1:
+            # Single cursor updates are the common case, index with plain scalars to skip the array machinery
+            x, y = screen_points[0].tolist()
+            if not (0 <= x <= width - 1 and 0 <= y <= height - 1):
+                return np.zeros((1, 3)), np.zeros(1, dtype=bool)
+            x0 = min(int(x), width - 2)
+            y0 = min(int(y), height - 2)
+            fx = x - x0
+            fy = y - y0
+            (a, b), (c, d) = table[y0 : y0 + 2, x0 : x0 + 2].tolist()
+            value = [
+                (a[i] * (1 - fx) + b[i] * fx) * (1 - fy) + (c[i] * (1 - fx) + d[i] * fx) * fy for i in range(3)
+            ]
+            if value[0] != value[0]:  # NaN
+                return np.zeros((1, 3)), np.zeros(1, dtype=bool)
+            return np.array([value]), np.ones(1, dtype=bool)
+
+        x = screen_points[:, 0]
+        y = screen_points[:, 1]
+        inside = (x >= 0) & (x <= width - 1) & (y >= 0) & (y <= height - 1)
+
+        x0 = np.clip(np.floor(x), 0, width - 2).astype(np.intp)
+        y0 = np.clip(np.floor(y), 0, height - 2).astype(np.intp)
+        fx = np.clip(x - x0, 0, 1)[:, np.newaxis]
+        fy = np.clip(y - y0, 0, 1)[:, np.newaxis]
+
+        top = table[y0, x0] * (1 - fx) + table[y0, x0 + 1] * fx
+        bottom = table[y0 + 1, x0] * (1 - fx) + table[y0 + 1, x0 + 1] * fx
+        result = (top * (1 - fy) + bottom * fy).astype(np.float64)
+
+        valid = inside & ~np.isnan(result).any(axis=1)
+        result[~valid] = 0
+        return result, valid
+
+    def accuracyReport(
+        self, exact: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]], samples: int = 10000
+    ) -> dict | None:
+        """Compare sample() against the exact mapping at random sub-pixel positions. Errors are in mm."""
+        if self._table is None:
+            return None
+        height, width = self._table.shape[:2]
+        points = np.random.default_rng(0).random((samples, 2)) * [width - 1, height - 1]
+        approx, approx_valid = self.sample(points)
+        truth, truth_valid = exact(points)
+        both = approx_valid & truth_valid
+        error = np.linalg.norm(approx[both] - truth[both], axis=1)
+        if len(error) == 0:
+            return {"samples": samples, "compared": 0}
+        return {
+            "samples": samples,
+            "compared": int(both.sum()),
+            "mean_mm": float(error.mean()),
+            "p99_mm": float(np.percentile(error, 99)),
+            "max_mm": float(error.max()),
+        }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    import cv2 as cv
+
+    # Synthetic rig: camera 8m up, 10m downstage, looking at the stage
+    camera_matrix = np.array([[1100.0, 0, 640], [0, 1100.0, 360], [0, 0, 1]])
+    camera_dist = np.array([-0.12, 0.05, 0.001, -0.0005])
+    r_vec = np.array([[-2.2], [0.0], [0.0]])
+    t_vec = np.array([[0.0], [3000.0], [12000.0]])
+    rot_m = cv.Rodrigues(r_vec)[0]
+    camera_inv = np.identity(4)
+    camera_inv[:3, :3] = rot_m.T
+    camera_inv[:3, 3] = (-rot_m.T @ t_vec).ravel()
+
+    def exact(points):
+        cam_pos, rays = imagePointsToRays(points, camera_matrix, camera_dist, camera_inv)
+        return planeRayIntersections(cam_pos, rays, 0.5)
+
+    with tempfile.TemporaryDirectory() as folder:
+        lut = PixelLookupTable(Path(folder))
+        start = time.perf_counter()
+        lut._table = np.asarray(lut.build(camera_matrix, camera_dist, camera_inv, 0.5))
+        print(f"Build: {time.perf_counter() - start:.2f}s")
+
+        report = lut.accuracyReport(exact)
+        print("Accuracy:", report)
+        assert report["compared"] > 0 and report["max_mm"] < 5
+
+        points = np.random.default_rng(1).random((1000, 2)) * [1279, 719]
+        start = time.perf_counter()
+        for p in points:
+            lut.sample(p)
+        lut_time = (time.perf_counter() - start) / len(points)
+        start = time.perf_counter()
+        for p in points:
+            exact(p)
+        exact_time = (time.perf_counter() - start) / len(points)
+        print(f"Per point: lookup {lut_time * 1e6:.1f}us, exact {exact_time * 1e6:.1f}us")
+        start = time.perf_counter()
+        lut.sample(points)
+        print(f"Batch of {len(points)}: lookup {(time.perf_counter() - start) * 1e3:.2f}ms")
+        del lut
@@ -1,3 +1,4 @@
+from typing import Tuple
 import numpy as np
 
 
@@ -13,11 +14,37 @@ def planeRayIntersection(ray_origin: np.array, ray_direction: np.array, target_h
     return
 
 
+# Vectorised version of planeRayIntersection for an (N, 3) array of rays sharing one origin
+def planeRayIntersections(
+    ray_origin: np.ndarray, ray_directions: np.ndarray, target_height: float = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    ray_directions = np.asarray(ray_directions, dtype=np.float64).reshape(-1, 3)
+    denom = ray_directions[:, 2]
+    valid = np.abs(denom) > 0.000001
+    t = np.zeros(len(ray_directions))
+    np.divide(target_height * 1000 - ray_origin[2], denom, out=t, where=valid)
+    valid &= t > 0
+    result = ray_origin + ray_directions * t[:, np.newaxis]
+    result[~valid] = 0
+    return result, valid
+
+
 if __name__ == "__main__":
     assert np.linalg.norm(planeRayIntersection(np.array([0, 10, 10]), np.array([0, -1, -1])) - np.array([0, 0, 0])) < 0.00001
     assert np.linalg.norm(planeRayIntersection(np.array([0, 0, 10]), np.array([0, 0, -1])) - np.array([0, 0, 0])) < 0.00001
     assert np.linalg.norm(planeRayIntersection(np.array([0, 20, 10]), np.array([0, -2, -1])) - np.array([0, 0, 0])) < 0.00001
     assert np.linalg.norm(planeRayIntersection(np.array([0, 10, 10]), np.array([0, -2, -1])) - np.array([0, -10, 0])) < 0.00001
     assert planeRayIntersection(np.array([0, 0, 10]), np.array([0, 0, 1])) is None
-    assert np.linalg.norm(planeRayIntersection(np.array([0, 10, 12]), np.array([0, -1, -1]), 2) - np.array([0, 0, 2])) < 0.00001
-    assert np.linalg.norm(planeRayIntersection(np.array([0, 0, 10]), np.array([0, 0, -1]), 2) - np.array([0, 0, 2])) < 0.00001
+    # target_height is in metres, positions in mm
+    assert np.linalg.norm(planeRayIntersection(np.array([0, 10, 2010]), np.array([0, -1, -1]), 2) - np.array([0, 0, 2000])) < 0.00001
+    assert np.linalg.norm(planeRayIntersection(np.array([0, 0, 2010]), np.array([0, 0, -1]), 2) - np.array([0, 0, 2000])) < 0.00001
+    assert planeRayIntersection(np.array([0, 0, 10]), np.array([0, 0, -1]), 2) is None  # The plane is above the origin
+
+    pts, valid = planeRayIntersections(
+        np.array([0, 10, 10]), np.array([[0, -1, -1], [0, -2, -1], [0, 0, 1], [1, 0, 0]])
+    )
+    assert list(valid) == [True, True, False, False]
+    assert np.linalg.norm(pts[0] - np.array([0, 0, 0])) < 0.00001
+    assert np.linalg.norm(pts[1] - np.array([0, -10, 0])) < 0.00001
+    pts, valid = planeRayIntersections(np.array([0, 10, 2010]), np.array([[0, -1, -1]]), 2)
+    assert valid[0] and np.linalg.norm(pts[0] - np.array([0, 0, 2000])) < 0.00001
@@ -0,0 +1,265 @@
+"""Pure Python PosiStageNet v2 encoder.
+
+Mirrors the API of the compiled psn module (Float3, Tracker, Encoder.encode_info/encode_data) so PSNOutput can fall
+back to it when the module hasn't been built for this platform. Packets are laid out once into preallocated
+bytearrays and later frames only patch the packet headers and the tracker fields that changed.
+"""
+
+import struct
+from collections import namedtuple
+
+VERSION_HIGH = 2
+VERSION_LOW = 3
+MAX_UDP_PACKET_SIZE = 1500
+
+CHUNK_HEADER_SIZE = 4
+PACKET_HEADER_SIZE = 12
+
+INFO_PACKET = 0x6756
+INFO_PACKET_HEADER = 0x0000
+INFO_SYSTEM_NAME = 0x0001
+INFO_TRACKER_LIST = 0x0002
+INFO_TRACKER_NAME = 0x0000
+
+DATA_PACKET = 0x6755
+DATA_PACKET_HEADER = 0x0000
+DATA_TRACKER_LIST = 0x0001
+DATA_TRACKER_POS = 0x0000
+DATA_TRACKER_SPEED = 0x0001
+DATA_TRACKER_ORI = 0x0002
+DATA_TRACKER_STATUS = 0x0003
+DATA_TRACKER_ACCEL = 0x0004
+DATA_TRACKER_TRGTPOS = 0x0005
+DATA_TRACKER_TIMESTAMP = 0x0006
+
+FIELD_FORMATS = {
+    DATA_TRACKER_POS: struct.Struct("<fff"),
+    DATA_TRACKER_SPEED: struct.Struct("<fff"),
+    DATA_TRACKER_ORI: struct.Struct("<fff"),
+    DATA_TRACKER_STATUS: struct.Struct("<f"),
+    DATA_TRACKER_ACCEL: struct.Struct("<fff"),
+    DATA_TRACKER_TRGTPOS: struct.Struct("<fff"),
+    DATA_TRACKER_TIMESTAMP: struct.Struct("<Q"),
+}
+
+_chunk_header = struct.Struct("<I")
+_packet_header = struct.Struct("<QBBBB")
+
+Float3 = namedtuple("Float3", ["x", "y", "z"])
+
+
+def _chunkHeader(id: int, data_len: int, has_subchunks: bool) -> int:
+    return (id & 0xFFFF) | ((data_len & 0x7FFF) << 16) | (int(has_subchunks) << 31)
+
+
+class Tracker:
+    def __init__(self, id: int, name: str = ""):
+        self.id = id
+        self.name = name
+        self.fields: dict[int, tuple] = {}
+        self.dirty: set[int] = set()
+
+    def _set(self, field: int, value: tuple) -> None:
+        self.fields[field] = value
+        self.dirty.add(field)
+
+    def set_pos(self, pos: Float3) -> None:
+        self._set(DATA_TRACKER_POS, (pos.x, pos.y, pos.z))
+
+    def set_speed(self, speed: Float3) -> None:
+        self._set(DATA_TRACKER_SPEED, (speed.x, speed.y, speed.z))
+
+    def set_ori(self, ori: Float3) -> None:
+        self._set(DATA_TRACKER_ORI, (ori.x, ori.y, ori.z))
+
+    def set_status(self, status: float) -> None:
+        self._set(DATA_TRACKER_STATUS, (status,))
+
+    def set_accel(self, accel: Float3) -> None:
+        self._set(DATA_TRACKER_ACCEL, (accel.x, accel.y, accel.z))
+
+    def set_target_pos(self, target_pos: Float3) -> None:
+        self._set(DATA_TRACKER_TRGTPOS, (target_pos.x, target_pos.y, target_pos.z))
+
+    def set_timestamp(self, timestamp: int) -> None:
+        self._set(DATA_TRACKER_TIMESTAMP, (int(timestamp),))
+
+    def get_pos(self) -> Float3:
+        return Float3(*self.fields.get(DATA_TRACKER_POS, (0.0, 0.0, 0.0)))
+
+
+class _Layout:
+    """Preallocated packets for one frame plus the offsets needed to patch them in place"""
+
+    def __init__(self, packets: list[bytearray], field_offsets: dict[tuple[int, int], tuple[bytearray, int]]):
+        self.packets = packets
+        self.field_offsets = field_offsets  # (tracker id, field id) -> (packet, offset)
+
+
+class Encoder:
+    def __init__(self, system_name: str, max_packet_size: int = MAX_UDP_PACKET_SIZE):
+        self.system_name = system_name.encode()
+        self.max_packet_size = max_packet_size
+        self.frame_id = 0
+
+        self._info_key = None
+        self._info_layout: _Layout | None = None
+        self._data_key = None
+        self._data_layout: _Layout | None = None
+
+    def _buildLayout(
+        self, packet_id: int, list_id: int, preamble: bytes, tracker_chunks: list[tuple[int, bytes, dict[int, int]]]
+    ) -> _Layout:
+        """Split tracker chunks across as few packets as fit in max_packet_size, in tracker id order"""
+        fixed_size = 2 * CHUNK_HEADER_SIZE + PACKET_HEADER_SIZE + len(preamble) + CHUNK_HEADER_SIZE
+        groups = [[]]
+        size = fixed_size
+        for chunk in tracker_chunks:
+            if groups[-1] and size + len(chunk[1]) > self.max_packet_size:
+                groups.append([])
+                size = fixed_size
+            groups[-1].append(chunk)
+            size += len(chunk[1])
+
+        packets = []
+        field_offsets = {}
+        for group in groups:
+            list_len = sum(len(c[1]) for c in group)
+            packet = bytearray(fixed_size + list_len)
+            _chunk_header.pack_into(packet, 0, _chunkHeader(packet_id, len(packet) - CHUNK_HEADER_SIZE, True))
+            _chunk_header.pack_into(packet, 4, _chunkHeader(0x0000, PACKET_HEADER_SIZE, False))
+            offset = 2 * CHUNK_HEADER_SIZE + PACKET_HEADER_SIZE
+            packet[offset : offset + len(preamble)] = preamble
+            offset += len(preamble)
+            _chunk_header.pack_into(packet, offset, _chunkHeader(list_id, list_len, True))
+            offset += CHUNK_HEADER_SIZE
+            for tracker_id, chunk, offsets in group:
+                packet[offset : offset + len(chunk)] = chunk
+                for field, field_offset in offsets.items():
+                    field_offsets[(tracker_id, field)] = (packet, offset + field_offset)
+                offset += len(chunk)
+            packets.append(packet)
+        return _Layout(packets, field_offsets)
+
+    def _finishFrame(self, layout: _Layout, timestamp: int) -> list[bytes]:
+        count = len(layout.packets)
+        for packet in layout.packets:
+            _packet_header.pack_into(packet, 8, timestamp, VERSION_HIGH, VERSION_LOW, self.frame_id, count)
+        self.frame_id = (self.frame_id + 1) % 256
+        return [bytes(packet) for packet in layout.packets]
+
+    def encode_info(self, trackers: dict[int, Tracker], timestamp: int = 0) -> list[bytes]:
+        ordered = sorted(trackers.items())
+        key = tuple((id, tracker.name) for id, tracker in ordered)
+        if key != self._info_key:
+            name_chunk = _chunk_header.pack(_chunkHeader(INFO_SYSTEM_NAME, len(self.system_name), False))
+            preamble = name_chunk + self.system_name
+            tracker_chunks = []
+            for id, tracker in ordered:
+                name = tracker.name.encode()
+                sub = _chunk_header.pack(_chunkHeader(INFO_TRACKER_NAME, len(name), False)) + name
+                chunk = _chunk_header.pack(_chunkHeader(id, len(sub), True)) + sub
+                tracker_chunks.append((id, chunk, {}))
+            self._info_layout = self._buildLayout(INFO_PACKET, INFO_TRACKER_LIST, preamble, tracker_chunks)
+            self._info_key = key
+        return self._finishFrame(self._info_layout, timestamp)
+
+    def encode_data(self, trackers: dict[int, Tracker], timestamp: int = 0) -> list[bytes]:
+        ordered = sorted(trackers.items())
+        key = tuple((id, tuple(sorted(tracker.fields))) for id, tracker in ordered)
+        if key != self._data_key:
+            tracker_chunks = []
+            for id, tracker in ordered:
+                sub = bytearray()
+                offsets = {}
+                for field in sorted(tracker.fields):
+                    fmt = FIELD_FORMATS[field]
+                    sub += _chunk_header.pack(_chunkHeader(field, fmt.size, False))
+                    offsets[field] = CHUNK_HEADER_SIZE + len(sub)
+                    sub += fmt.pack(*tracker.fields[field])
+                chunk = _chunk_header.pack(_chunkHeader(id, len(sub), True)) + sub
+                tracker_chunks.append((id, chunk, offsets))
+                tracker.dirty.clear()
+            self._data_layout = self._buildLayout(DATA_PACKET, DATA_TRACKER_LIST, b"", tracker_chunks)
+            self._data_key = key
+        else:
+            field_offsets = self._data_layout.field_offsets
+            for id, tracker in ordered:
+                if tracker.dirty:
+                    for field in tracker.dirty:
+                        packet, offset = field_offsets[(id, field)]
+                        FIELD_FORMATS[field].pack_into(packet, offset, *tracker.fields[field])
+                    tracker.dirty.clear()
+        return self._finishFrame(self._data_layout, timestamp)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    import psn_encoder as python_psn
+
+    try:
+        import psn as native_psn
+    except ImportError:
+        native_psn = None
+
+    def makeTrackers(module, count):
+        trackers = {}
+        for i in range(count):
+            trackers[i] = module.Tracker(i, f"Tracker {i}")
+            trackers[i].set_pos(module.Float3(0, 0, 0))
+            trackers[i].set_status(1)
+        return trackers
+
+    # Sanity check the chunk layout
+    encoder = Encoder("Lighthouse server")
+    trackers = makeTrackers(python_psn, 1)
+    packet = encoder.encode_data(trackers, 1234)[0]
+    header = struct.unpack_from("<I", packet)[0]
+    assert header & 0xFFFF == DATA_PACKET and (header >> 16) & 0x7FFF == len(packet) - 4 and header >> 31 == 1
+    assert struct.unpack_from("<QBBBB", packet, 8) == (1234, VERSION_HIGH, VERSION_LOW, 0, 1)
+    trackers[0].set_pos(Float3(1, 2, 3))
+    packet = encoder.encode_data(trackers, 1235)[0]
+    assert packet.find(struct.pack("<fff", 1, 2, 3)) > 0
+
+    # Large tracker counts must split, and every packet must fit
+    packets = Encoder("Lighthouse server").encode_data(makeTrackers(python_psn, 500))
+    assert len(packets) > 1 and all(len(p) <= MAX_UDP_PACKET_SIZE for p in packets)
+
+    frame_rate = 60
+    for count in (1, 10, 100, 500):
+        results = {}
+        modules = [("python", python_psn)]
+        if native_psn is not None:
+            modules.append(("native", native_psn))
+        for label, module in modules:
+            encoder = module.Encoder("Lighthouse server")
+            trackers = makeTrackers(module, count)
+            frames = frame_rate * 2
+            start = time.perf_counter()
+            for frame in range(frames):
+                for tracker in trackers.values():
+                    tracker.set_pos(module.Float3(random.random(), random.random(), random.random()))
+                if frame % frame_rate == 0:
+                    encoder.encode_info(trackers, frame)
+                encoder.encode_data(trackers, frame)
+            results[label] = (time.perf_counter() - start) / frames
+        budget = 1 / frame_rate
+        print(
+            f"{count:4d} trackers: "
+            + ", ".join(f"{label} {t * 1e3:.3f}ms/frame ({100 * t / budget:.1f}% of budget)" for label, t in results.items())
+        )
+
+    if native_psn is not None:
+        ours = makeTrackers(python_psn, 50)
+        theirs = makeTrackers(native_psn, 50)
+        for i in range(50):
+            ours[i].set_pos(Float3(i, -i, 0.5))
+            theirs[i].set_pos(native_psn.Float3(i, -i, 0.5))
+        a, b = Encoder("Lighthouse server"), native_psn.Encoder("Lighthouse server")
+        assert [bytes(p) for p in a.encode_info(ours, 42)] == [bytes(p) for p in b.encode_info(theirs, 42)]
+        assert [bytes(p) for p in a.encode_data(ours, 42)] == [bytes(p) for p in b.encode_data(theirs, 42)]
+        print("Byte compatible with the native psn module")
+    else:
+        print("Native psn module not found, skipping the byte comparison")
@@ -1,24 +1,36 @@
 try:
     import psn
 
-    no_psn = False
+    native_psn = True
 except:
-    no_psn = True
+    # Fall back to the pure Python encoder when the compiled module hasn't been built for this platform
+    import psn_encoder as psn
 
+    native_psn = False
+
+import collections
 import socket
+import threading
 import time
 
-from PySide6.QtCore import Slot, QObject, QTimer
+import numpy as np
+from PySide6.QtCore import Slot, QObject
 from PySide6.QtGui import QVector3D
 
+from latency import pipeline
+from track_filter import TrackFilterBank
+from udp_batch_sender import BatchSender
+
 PSN_DEFAULT_UDP_PORT = 56565
 PSN_DEFAULT_UDP_MULTICAST_ADDR = "236.10.10.10"
 MULTICAST_TTL = 2
+DEFAULT_MTU = 1500
+IP_UDP_HEADER_SIZE = 28
 
 
 # Helper functions
 def get_time_ms():
-    return int(time.time() * 1000)
+    return int(time.monotonic() * 1000)
 
 
 start_time = get_time_ms()
@@ -28,34 +40,118 @@ def get_elapsed_time_ms():
     return get_time_ms() - start_time
 
 
+def _float3(v: QVector3D | None):
+    return None if v is None else (v.x(), v.y(), v.z())
+
+
+class JitterStats:
+    """Fixed size ring of send time - scheduled time samples. Only the transmit thread writes to it."""
+
+    def __init__(self, size: int = 1024):
+        self._samples = np.zeros(size)
+        self._count = 0
+        self.overruns = 0
+
+    def record(self, lateness: float) -> None:
+        self._samples[self._count % len(self._samples)] = lateness
+        self._count += 1
+
+    def summary(self) -> dict:
+        samples = self._samples[: min(self._count, len(self._samples))].copy()
+        if len(samples) == 0:
+            return {"samples": 0, "overruns": self.overruns}
+        return {
+            "samples": len(samples),
+            "overruns": self.overruns,
+            "mean_ms": float(samples.mean() * 1000),
+            "p99_ms": float(np.percentile(samples, 99) * 1000),
+            "max_ms": float(samples.max() * 1000),
+        }
+
+
 class PSNOutput(QObject):
-    def __init__(self):
+    """Sends PSN on a dedicated thread so the GUI loop can't delay or drop packets.
+
+    The GUI only publishes track state: each call to setTrack swaps in a new dict of per-track tuples, which the
+    transmit thread picks up as a snapshot at the start of each frame without taking a lock. Positions coming through
+    setTrackWithPos or setTracksWithPos go through the track filters instead, which the transmit thread steps once per frame so the
+    smoothed, latency compensated position, speed and acceleration are all sent together.
+    """
+
+    def __init__(self, mtu: int = DEFAULT_MTU):
         super().__init__()
-        if no_psn:
-            print("PSN module couldn't be found")
-            return
-        self.encoder = psn.Encoder("Lighthouse server")
+        self.transmit_frequency = 60
+        self.jitter = JitterStats()
+        self._published: dict[int, dict] = {}
+        self._is_published = np.zeros(0, dtype=bool)
+        self.filters = TrackFilterBank()
+
+        if not native_psn:
+            print("[info] PSN module couldn't be found, using the Python encoder")
+            # Keep every datagram inside one MTU so large tracker counts never rely on IP fragmentation
+            self.encoder = psn.Encoder("Lighthouse server", max_packet_size=mtu - IP_UDP_HEADER_SIZE)
+        else:
+            self.encoder = psn.Encoder("Lighthouse server")
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+        self.sender = BatchSender(self.sock, (PSN_DEFAULT_UDP_MULTICAST_ADDR, PSN_DEFAULT_UDP_PORT))
 
-        self.tracks = {}
+        self.tracks = {}  # Owned by the transmit thread
+        self._applied: dict[int, dict] = {}
 
-        self.transmit_frequency = 60
         self.info_counter = 0
+        self._input_times = collections.deque()  # Input time behind each measurement, for the latency stats
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.send)
-        self.timer.start(1000 / self.transmit_frequency)
+        self._exiting = False
+        self._thread = threading.Thread(target=self.run, name="PSN output", daemon=True)
+        self._thread.start()
 
-    def addTrack(self) -> None:
-        if no_psn:
-            return
-        self.tracks[len(self.tracks)] = psn.Tracker(len(self.tracks), f"Tracker {len(self.tracks)}")
+    @Slot(int)
+    def addTrack(self, id: int | None = None) -> None:
+        published = dict(self._published)
+        published[len(published) if id is None else id] = {}
+        self._setPublished(published)
+
+    @Slot(int)
+    def removeTrack(self, id: int) -> None:
+        published = dict(self._published)
+        published.pop(id, None)
+        self._setPublished(published)
+        self.filters.reset(id)
+
+    def _setPublished(self, published: dict[int, dict]) -> None:
+        is_published = np.zeros(max(published, default=-1) + 1, dtype=bool)
+        is_published[list(published)] = True
+        self._is_published = is_published  # By track id, for filtering batches without a Python loop
+        self._published = published
 
     @Slot(int, QVector3D, float)
-    def setTrackWithPos(self, id: int, pos: QVector3D, offset: float = 0):
-        self.setTrack(id=id, pos=QVector3D(pos.x(), pos.z() + offset, pos.y()))
+    def setTrackWithPos(self, id: int, pos: QVector3D, offset: float = 0, input_time: float | None = None):
+        """input_time is the time.monotonic() of the input pos came from, the filter predicts forward from it"""
+        if id not in self._published:
+            return
+        if input_time is None:
+            input_time = time.monotonic()
+        # PSN is y up and in metres
+        self.filters.measure(id, pos.x() / 1000, (pos.z() + offset) / 1000, pos.y() / 1000, input_time)
+        self._input_times.append(input_time)
+
+    def setTracksWithPos(self, ids: np.ndarray, positions: np.ndarray, input_times: np.ndarray) -> None:
+        """A batch of (N, 3) stage positions in mm for tracks ids, one filter queue entry however many there are"""
+        is_published = self._is_published
+        known = ids < len(is_published)
+        known[known] = is_published[ids[known]]
+        if not known.any():
+            return
+        # PSN is y up and in metres
+        times = input_times[known]
+        self.filters.measureMany(ids[known], positions[known][:, [0, 2, 1]] / 1000, times)
+        self._input_times.extend(times.tolist())
+
+    @Slot(int, str, float)
+    def setTrackFilter(self, id: int, kind: str, smoothing: float) -> None:
+        self.filters.setFilter(id, kind, smoothing)
 
     @Slot(int, QVector3D, QVector3D, QVector3D, QVector3D, float, QVector3D, float)
     def setTrack(
@@ -69,27 +165,97 @@ class PSNOutput(QObject):
             target_pos: QVector3D | None = None,
             timestamp: float | None = None,
     ) -> None:
-        if no_psn:
+        if id not in self._published:
             return
-        tracker = self.tracks[id]
-        tracker.set_pos(psn.Float3(pos.x() / 1000, pos.y() / 1000, pos.z() / 1000))
+        state = dict(self._published[id])
+        state["pos"] = (pos.x() / 1000, pos.y() / 1000, pos.z() / 1000)
         if speed is not None:
-            tracker.set_speed(psn.Float3(speed.x(), speed.y(), speed.z()))
+            state["speed"] = _float3(speed)
         if accel is not None:
-            tracker.set_accel(psn.Float3(accel.x(), accel.y(), accel.z()))
+            state["accel"] = _float3(accel)
         if ori is not None:
-            tracker.set_ori(psn.Float3(ori.x(), ori.y(), ori.z()))
+            state["ori"] = _float3(ori)
         if status is not None:
-            tracker.set_status(status)
+            state["status"] = status
         if target_pos is not None:
-            tracker.set_target_pos(psn.Float3(target_pos.x(), target_pos.y(), target_pos.z()))
+            state["target_pos"] = _float3(target_pos)
         if timestamp is not None:
-            tracker.set_timestamp(timestamp)
-        self.tracks[id] = tracker
+            state["timestamp"] = timestamp
+
+        published = dict(self._published)
+        published[id] = state
+        self._published = published
+
+    def jitterStats(self) -> dict:
+        return self.jitter.summary()
+
+    def sendStats(self) -> dict:
+        return {"sent": self.sender.sent, "errors": self.sender.errors, "batched": self.sender.batched}
+
+    def run(self) -> None:
+        period = 1 / self.transmit_frequency
+        deadline = time.monotonic()
+        while not self._exiting:
+            deadline += period
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            now = time.monotonic()
+            if now - deadline > period:
+                # Fell more than a whole frame behind, skip the missed frames rather than bursting to catch up
+                self.jitter.overruns += 1
+                deadline = now
+            self.jitter.record(now - deadline)
+            self.send()
+
+    def stop(self) -> None:
+        self._exiting = True
+        self._thread.join()
+
+    def _applySnapshot(self, published: dict[int, dict]) -> None:
+        for id in self.tracks.keys() - published.keys():
+            del self.tracks[id]
+            self._applied.pop(id, None)
+        for id, state in published.items():
+            if self._applied.get(id) is state:
+                continue
+            if id not in self.tracks:
+                self.tracks[id] = psn.Tracker(id, f"Tracker {id}")
+            tracker = self.tracks[id]
+            if "pos" in state:
+                tracker.set_pos(psn.Float3(*state["pos"]))
+            if "speed" in state:
+                tracker.set_speed(psn.Float3(*state["speed"]))
+            if "accel" in state:
+                tracker.set_accel(psn.Float3(*state["accel"]))
+            if "ori" in state:
+                tracker.set_ori(psn.Float3(*state["ori"]))
+            if "status" in state:
+                tracker.set_status(state["status"])
+            if "target_pos" in state:
+                tracker.set_target_pos(psn.Float3(*state["target_pos"]))
+            if "timestamp" in state:
+                tracker.set_timestamp(state["timestamp"])
+            self._applied[id] = state
+
+    def _applyFilters(self) -> None:
+        filters = self.filters
+        filters.step(time.monotonic())
+        for id, tracker in self.tracks.items():
+            if id >= filters.capacity or not filters.active[id]:
+                continue
+            tracker.set_pos(psn.Float3(*filters.position[id].tolist()))
+            tracker.set_speed(psn.Float3(*filters.speed[id].tolist()))
+            tracker.set_accel(psn.Float3(*filters.accel[id].tolist()))
 
     def send(self) -> None:
-        if no_psn:
-            return
+        input_times = []
+        while self._input_times:
+            input_times.append(self._input_times.popleft())
+
+        self._applySnapshot(self._published)
+        self._applyFilters()
+        pipeline.recordSince("filter", input_times)
 
         if len(self.tracks) == 0:
             return
@@ -103,10 +269,7 @@ class PSNOutput(QObject):
             self.info_counter = self.transmit_frequency
         self.info_counter -= 1
         packets.extend(self.encoder.encode_data(self.tracks, time_stamp))
+        pipeline.recordSince("encode", input_times)
 
-        for packet in packets:
-            try:
-                self.sock.sendto(packet, (PSN_DEFAULT_UDP_MULTICAST_ADDR, PSN_DEFAULT_UDP_PORT))
-            except OSError as err:
-                print("PACKET SEND ERROR")
-                continue
+        self.sender.send(packets)
+        pipeline.recordSince("sendto", input_times)
@@ -1,7 +1,13 @@
+import copy
+
+from PySide6.QtCore import Signal
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import QDialog, QDialogButtonBox, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox, \
-    QPushButton, QStyle
-from data_store import HomographyPoint
+    QPushButton, QStyle, QCheckBox, QDoubleSpinBox, QListWidget, QProgressBar, QSpinBox
+from PySide6.QtGui import QVector3D
+from data_store import HomographyPoint, Fixture
+from dmx_output import DMX_UNIVERSE_SIZE, universeRange
+from fixture_calibration import MIN_SAMPLES, FixtureCalibrationWorker, FixturePose
 
 
 class AddNewPointDialog(QDialog):
@@ -90,3 +96,317 @@ class EditPointDialog(AddNewPointDialog):
 
     def delete_callback(self):
         self.delete_status = True
+
+
+def _doubleSpinBox(minimum: float, maximum: float, value: float, decimals: int = 1) -> QDoubleSpinBox:
+    spin_box = QDoubleSpinBox()
+    spin_box.setDecimals(decimals)
+    spin_box.setRange(minimum, maximum)
+    spin_box.setValue(value)
+    return spin_box
+
+
+class AddFixtureDialog(QDialog):
+    def __init__(self, protocol: str = ""):
+        super().__init__()
+        self.setWindowTitle("Add New Fixture")
+
+        self.buttonBox = QDialogButtonBox()
+        self.create_btn = QPushButton("Create Fixture")
+        self.cancel_btn = QPushButton("Cancel")
+        self.create_btn.setIcon(self.style().standardIcon(getattr(QStyle, "SP_DialogOkButton")))
+        self.cancel_btn.setIcon(self.style().standardIcon(getattr(QStyle, "SP_DialogCancelButton")))
+        self.buttonBox.addButton(self.cancel_btn, QDialogButtonBox.RejectRole)
+        self.buttonBox.addButton(self.create_btn, QDialogButtonBox.AcceptRole)
+
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+
+        verticalLayout = QVBoxLayout()
+        verticalLayout.setSpacing(12)
+
+        # Label:
+        horizontalNameLayout = QHBoxLayout()
+        self.name_input = QLineEdit("Fixture")
+        horizontalNameLayout.addWidget(QLabel("Fixture Name:"))
+        horizontalNameLayout.addWidget(self.name_input)
+
+        # Patch:
+        horizontalPatchLayout = QHBoxLayout()
+        self.universe_input = QSpinBox()
+        universes = universeRange(protocol)  # sACN starts at 1, Art-Net at 0
+        self.universe_input.setRange(universes.start, universes.stop - 1)
+        self.universe_input.setValue(1)
+        self.address_input = QSpinBox()
+        # The fine channel of the highest offset pair has to fit in the universe
+        fixture = Fixture("")
+        self.address_input.setRange(1, DMX_UNIVERSE_SIZE - max(fixture.pan_offset, fixture.tilt_offset) - 1)
+        self.address_input.setValue(1)
+        self.track_input = QSpinBox()
+        self.track_input.setRange(0, 9999)
+        for widget in [
+            QLabel("Universe:"),
+            self.universe_input,
+            QLabel("Address:"),
+            self.address_input,
+            QLabel("Track:"),
+            self.track_input,
+        ]:
+            horizontalPatchLayout.addWidget(widget)
+
+        # Position:
+        message = QLabel("Please enter the position of the fixture from your chosen reference point")
+        horizontalLayout = QHBoxLayout()
+        self.x_input = _doubleSpinBox(-100000, 100000, 0)
+        self.y_input = _doubleSpinBox(-100000, 100000, 0)
+        self.z_input = _doubleSpinBox(-100000, 100000, 0)
+        for widget in [QLabel("Width:"), self.x_input, QLabel("Depth:"), self.y_input, QLabel("Height:"), self.z_input]:
+            horizontalLayout.addWidget(widget)
+
+        # Unit selection:
+        self.current_unit_multiplier = 1
+        self.unitSelect = QComboBox()
+        self.unitSelect.addItems(["mm", "cm", "m", "in", "ft", "yd"])
+        self.unitSelect.currentIndexChanged.connect(self.unit_changed)
+        horizontalUnitLayout = QHBoxLayout()
+        horizontalUnitLayout.addWidget(QLabel("Measurement Unit:"))
+        horizontalUnitLayout.addWidget(self.unitSelect)
+
+        # Range of movement:
+        horizontalRangeLayout = QHBoxLayout()
+        self.pan_range_input = _doubleSpinBox(1, 720, 540)  # The solver handles up to two full turns
+        self.tilt_range_input = _doubleSpinBox(1, 360, 270)
+        for widget in [QLabel("Pan range (deg):"), self.pan_range_input, QLabel("Tilt range (deg):"), self.tilt_range_input]:
+            horizontalRangeLayout.addWidget(widget)
+
+        # Orientation:
+        horizontalOrientationLayout = QHBoxLayout()
+        self.rx_input = _doubleSpinBox(-360, 360, 0)
+        self.ry_input = _doubleSpinBox(-360, 360, 0)
+        self.rz_input = _doubleSpinBox(-360, 360, 0)
+        self.invert_pan_input = QCheckBox("Invert pan")
+        self.invert_tilt_input = QCheckBox("Invert tilt")
+        for widget in [
+            QLabel("Rotation X:"),
+            self.rx_input,
+            QLabel("Y:"),
+            self.ry_input,
+            QLabel("Z:"),
+            self.rz_input,
+            self.invert_pan_input,
+            self.invert_tilt_input,
+        ]:
+            horizontalOrientationLayout.addWidget(widget)
+
+        # Add all to dialog layout:
+        verticalLayout.addLayout(horizontalNameLayout)
+        verticalLayout.addLayout(horizontalPatchLayout)
+        verticalLayout.addWidget(message)
+        verticalLayout.addLayout(horizontalLayout)
+        verticalLayout.addLayout(horizontalUnitLayout)
+        verticalLayout.addLayout(horizontalRangeLayout)
+        verticalLayout.addLayout(horizontalOrientationLayout)
+        verticalLayout.addWidget(self.buttonBox)
+
+        self.setLayout(verticalLayout)
+
+    def unit_changed(self, unit_id):
+        multipliers = [1, 10, 1000, 25.4, 304.8, 914.4]
+        self.current_unit_multiplier = multipliers[unit_id]
+
+    def fixture(self) -> Fixture:
+        position = self.current_unit_multiplier * QVector3D(
+            self.x_input.value(), self.y_input.value(), self.z_input.value()
+        )
+        return Fixture(
+            self.name_input.text(),
+            universe=self.universe_input.value(),
+            address=self.address_input.value(),
+            position=position,
+            pan_range=self.pan_range_input.value(),
+            tilt_range=self.tilt_range_input.value(),
+            track=self.track_input.value(),
+            orientation=QVector3D(self.rx_input.value(), self.ry_input.value(), self.rz_input.value()),
+            invert_pan=self.invert_pan_input.isChecked(),
+            invert_tilt=self.invert_tilt_input.isChecked(),
+        )
+
+
+class EditFixtureDialog(AddFixtureDialog):
+    def __init__(self, fixture: Fixture, protocol: str = ""):
+        super().__init__(protocol)
+        self.setWindowTitle("Edit Fixture")
+        self.delete_status = False
+
+        self.name_input.setText(fixture.name)
+        self.universe_input.setValue(fixture.universe)
+        self.address_input.setValue(fixture.address)
+        self.track_input.setValue(fixture.track)
+        self.x_input.setValue(fixture.position.x())
+        self.y_input.setValue(fixture.position.y())
+        self.z_input.setValue(fixture.position.z())
+        self.pan_range_input.setValue(fixture.pan_range)
+        self.tilt_range_input.setValue(fixture.tilt_range)
+        self.rx_input.setValue(fixture.orientation.x())
+        self.ry_input.setValue(fixture.orientation.y())
+        self.rz_input.setValue(fixture.orientation.z())
+        self.invert_pan_input.setChecked(fixture.invert_pan)
+        self.invert_tilt_input.setChecked(fixture.invert_tilt)
+        self.calibration_samples = fixture.calibration_samples
+
+        self.create_btn.setText("Save Edits")
+        self.delete_btn = QPushButton("Delete Fixture")
+        self.delete_btn.clicked.connect(self.delete_callback)
+        self.create_btn.setIcon(self.style().standardIcon(getattr(QStyle, "SP_DialogSaveButton")))
+        self.delete_btn.setIcon(self.style().standardIcon(getattr(QStyle, "SP_DialogDiscardButton")))
+        self.buttonBox.addButton(self.delete_btn, QDialogButtonBox.RejectRole)
+
+    def delete_callback(self):
+        self.delete_status = True
+
+    def fixture(self) -> Fixture:
+        fixture = super().fixture()
+        fixture.calibration_samples = self.calibration_samples
+        return fixture
+
+
+class FixtureCalibrationDialog(QDialog):
+    """Aim a fixture at several known stage points, then solve for where it is rigged and which way it faces"""
+
+    aimChanged = Signal(int, float, float)  # fixture index, pan, tilt
+
+    def __init__(self, index: int, fixture: Fixture, homography_points: dict[str, HomographyPoint]):
+        super().__init__()
+        self.setWindowTitle(f"Calibrate {fixture.name}")
+        self.index = index
+        self._fixture = fixture
+        self.homography_points = homography_points
+        self.samples = dict(fixture.calibration_samples)
+        self.pose = None
+        self.worker = None
+
+        self.buttonBox = QDialogButtonBox()
+        self.apply_btn = QPushButton("Apply Calibration")
+        self.cancel_btn = QPushButton("Cancel")
+        self.apply_btn.setIcon(self.style().standardIcon(getattr(QStyle, "SP_DialogSaveButton")))
+        self.cancel_btn.setIcon(self.style().standardIcon(getattr(QStyle, "SP_DialogCancelButton")))
+        self.apply_btn.setEnabled(False)
+        self.buttonBox.addButton(self.cancel_btn, QDialogButtonBox.RejectRole)
+        self.buttonBox.addButton(self.apply_btn, QDialogButtonBox.AcceptRole)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+
+        verticalLayout = QVBoxLayout()
+        verticalLayout.setSpacing(12)
+        verticalLayout.addWidget(
+            QLabel(f"Aim the fixture at each stage point and record it, {MIN_SAMPLES} or more, extra points fit better")
+        )
+
+        # Aiming:
+        horizontalAimLayout = QHBoxLayout()
+        self.point_select = QComboBox()
+        self.point_select.addItems(list(homography_points.keys()))
+        self.pan_input = QDoubleSpinBox()
+        self.pan_input.setRange(-fixture.pan_range / 2, fixture.pan_range / 2)
+        self.tilt_input = QDoubleSpinBox()
+        self.tilt_input.setRange(-fixture.tilt_range / 2, fixture.tilt_range / 2)
+        for spin_box in [self.pan_input, self.tilt_input]:
+            spin_box.setDecimals(2)
+            spin_box.setSingleStep(0.1)
+            spin_box.valueChanged.connect(self.aim_changed)
+        self.record_btn = QPushButton("Record")
+        self.record_btn.clicked.connect(self.record_callback)
+        for widget in [
+            QLabel("Point:"),
+            self.point_select,
+            QLabel("Pan:"),
+            self.pan_input,
+            QLabel("Tilt:"),
+            self.tilt_input,
+            self.record_btn,
+        ]:
+            horizontalAimLayout.addWidget(widget)
+
+        self.samples_list = QListWidget()
+
+        # Solving:
+        horizontalSolveLayout = QHBoxLayout()
+        self.solve_btn = QPushButton("Solve")
+        self.solve_btn.clicked.connect(self.solve_callback)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        horizontalSolveLayout.addWidget(self.solve_btn)
+        horizontalSolveLayout.addWidget(self.progress_bar)
+        self.result_label = QLabel("")
+
+        verticalLayout.addLayout(horizontalAimLayout)
+        verticalLayout.addWidget(self.samples_list)
+        verticalLayout.addLayout(horizontalSolveLayout)
+        verticalLayout.addWidget(self.result_label)
+        verticalLayout.addWidget(self.buttonBox)
+        self.setLayout(verticalLayout)
+
+        self.updateSamples()
+
+    def aim_changed(self):
+        self.aimChanged.emit(self.index, self.pan_input.value(), self.tilt_input.value())
+
+    def record_callback(self):
+        name = self.point_select.currentText()
+        if name:
+            self.samples = {**self.samples, name: (self.pan_input.value(), self.tilt_input.value())}
+            self.updateSamples()
+
+    def updateSamples(self):
+        self.samples_list.clear()
+        for name, (pan, tilt) in self.samples.items():
+            if name in self.homography_points:
+                self.samples_list.addItem(f"{name}: pan {round(pan, 2)}, tilt {round(tilt, 2)}")
+        self.updateSolveButton()
+
+    def updateSolveButton(self):
+        solving = self.worker is not None and self.worker.isRunning()
+        self.solve_btn.setEnabled(not solving and self.samples_list.count() >= MIN_SAMPLES)
+
+    def solve_callback(self):
+        samples = [
+            (self.homography_points[name].world_coord.toTuple(), pan, tilt)
+            for name, (pan, tilt) in self.samples.items()
+            if name in self.homography_points
+        ]
+        self.solve_btn.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.result_label.setText("Solving...")
+        self.worker = FixtureCalibrationWorker(self.index, self._fixture, samples, parent=self)
+        self.worker.progress.connect(self.solve_progress)
+        self.worker.solved.connect(self.solve_finished)
+        self.worker.failed.connect(self.solve_failed)
+        self.worker.finished.connect(self.updateSolveButton)
+        self.worker.start()
+
+    def solve_progress(self, percent: int, rms: float):
+        self.progress_bar.setValue(percent)
+        self.result_label.setText(f"Best so far: {rms:.2f} deg rms")
+
+    def solve_finished(self, index: int, pose: FixturePose):
+        self.pose = pose
+        self.progress_bar.setValue(100)
+        self.result_label.setText(f"{pose}, worst point {pose.errors.max():.2f} deg")
+        self.apply_btn.setEnabled(True)
+
+    def solve_failed(self, index: int, reason: str):
+        self.result_label.setText(reason)
+
+    def done(self, result):
+        if self.worker is not None:
+            self.worker.exiting = True
+            self.worker.wait()
+        super().done(result)
+
+    def fixture(self) -> Fixture:
+        fixture = copy.copy(self._fixture)
+        fixture.calibration_samples = dict(self.samples)
+        if self.pose is not None:
+            fixture.position = QVector3D(*self.pose.position)
+            fixture.orientation = QVector3D(*self.pose.orientation)
+        return fixture
@@ -0,0 +1,507 @@
+import json
+import math
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from response_curve import DEFAULT_EXPO, DEFAULT_GAIN
+
+MAGIC = b"LHOSHOW\0"
+VERSION = 1
+ALIGNMENT = 64  # Every section starts on a 64 byte boundary so it can be mapped and used in place
+LENGTH = struct.Struct("<Q")  # Header length, after the magic
+
+CALIBRATION = ["camera_matrix", "camera_dist", "camera_inv", "r_vec", "t_vec"]
+SHOW_SECTIONS = ("calibration/", "homography/", "tracks/", "fixtures/")  # Anything else is extra data, like recordings
+REQUIRED_HEADER = ["sections", "homography_names", "tracks", "track_columns", "fixtures", "fixture_columns"]
+REQUIRED_SECTIONS = ["homography/world", "homography/screen", "tracks/values", "fixtures/values"]
+# Numeric per-track and per-fixture fields are columns of one float64 array each. The column names are stored in the
+# header, so columns added later are filled from these defaults when older files are read.
+TRACK_COLUMNS = {
+    "height_offset": 0.0,
+    "smoothing": 0.0,
+    "curve_expo": DEFAULT_EXPO,
+    "curve_dead_zone": 0.0,
+    "curve_gain": DEFAULT_GAIN,
+    "curve_max_speed": math.inf,
+}
+FIXTURE_COLUMNS = {
+    "position_x": 0.0,
+    "position_y": 0.0,
+    "position_z": 0.0,
+    "orientation_x": 0.0,
+    "orientation_y": 0.0,
+    "orientation_z": 0.0,
+    "pan_range": 540.0,
+    "tilt_range": 270.0,
+    "universe": 1,
+    "address": 1,
+    "pan_offset": 0,
+    "tilt_offset": 2,
+    "track": 0,
+    "invert_pan": 0,
+    "invert_tilt": 0,
+}
+
+# Version n -> n + 1 header upgrades, applied in order to files older than VERSION
+MIGRATIONS: dict[int, Callable[[dict], dict]] = {}
+
+
+class ShowFileError(Exception):
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _columns(rows: list[dict], columns: dict) -> np.ndarray:
+    values = [[row.get(name, default) for name, default in columns.items()] for row in rows]
+    return np.array(values, dtype="<f8").reshape(len(rows), len(columns))
+
+
+def _rows(values: np.ndarray, names: list[str], columns: dict) -> list[dict]:
+    index = {name: i for i, name in enumerate(names)}
+    return [
+        {name: (float(row[index[name]]) if name in index else default) for name, default in columns.items()}
+        for row in values
+    ]
+
+
+def encode(contents: dict) -> tuple[dict, dict[str, np.ndarray]]:
+    """Show contents -> JSON header fields and named arrays"""
+    arrays = {}
+    for name in CALIBRATION:
+        value = contents["calibration"].get(name)
+        if value is not None:
+            arrays[f"calibration/{name}"] = np.asarray(value, dtype="<f8")
+
+    points = contents["homography_points"]
+    arrays["homography/world"] = np.array([world for world, _ in points.values()], dtype="<f8").reshape(-1, 3)
+    arrays["homography/screen"] = np.array([screen for _, screen in points.values()], dtype="<f8").reshape(-1, 2)
+
+    tracks = contents["tracks"]
+    arrays["tracks/values"] = _columns([track or {} for track in tracks], TRACK_COLUMNS)
+    fixtures = contents["fixtures"]
+    arrays["fixtures/values"] = _columns(fixtures, FIXTURE_COLUMNS)
+
+    header = {
+        "height_offset": contents["height_offset"],
+        "homography_names": list(points.keys()),
+        "tracks": [
+            None if track is None else {k: track[k] for k in ("name", "input_device", "filter", "tracker")}
+            for track in tracks
+        ],
+        "track_columns": list(TRACK_COLUMNS),
+        "fixtures": [
+            {"name": f["name"], "calibration_samples": {k: list(v) for k, v in f["calibration_samples"].items()}}
+            for f in fixtures
+        ],
+        "fixture_columns": list(FIXTURE_COLUMNS),
+    }
+    return header, arrays
+
+
+def decode(header: dict, section: Callable[[str], np.ndarray | None]) -> dict:
+    """The inverse of encode, section(name) returns a stored array or None"""
+    calibration = {}
+    for name in CALIBRATION:
+        value = section(f"calibration/{name}")
+        calibration[name] = None if value is None else np.array(value, dtype=np.float64)
+
+    world = section("homography/world")
+    screen = section("homography/screen")
+    points = {
+        name: (tuple(world[i].tolist()), tuple(screen[i].tolist())) for i, name in enumerate(header["homography_names"])
+    }
+
+    tracks = []
+    values = _rows(section("tracks/values"), header["track_columns"], TRACK_COLUMNS)
+    for fields, numbers in zip(header["tracks"], values):
+        tracks.append(None if fields is None else {**numbers, **fields})
+
+    fixtures = []
+    values = _rows(section("fixtures/values"), header["fixture_columns"], FIXTURE_COLUMNS)
+    for fields, numbers in zip(header["fixtures"], values):
+        fixture = dict(numbers)
+        for name in ("universe", "address", "pan_offset", "tilt_offset", "track"):
+            fixture[name] = int(fixture[name])
+        for name in ("invert_pan", "invert_tilt"):
+            fixture[name] = bool(fixture[name])
+        fixture["name"] = fields["name"]
+        fixture["calibration_samples"] = {k: tuple(v) for k, v in fields.get("calibration_samples", {}).items()}
+        fixtures.append(fixture)
+
+    return {
+        "height_offset": header.get("height_offset", 0.0),
+        "calibration": calibration,
+        "homography_points": points,
+        "tracks": tracks,
+        "fixtures": fixtures,
+    }
+
+
+def writeShow(path: str | Path, contents: dict, extra: dict[str, np.ndarray] | None = None) -> None:
+    """Write a show file, replacing path atomically. extra are any more named arrays to store, like recorded data."""
+    header, arrays = encode(contents)
+    arrays.update(extra or {})
+
+    sections = {}
+    offset = 0  # From the start of the data, which is aligned after the header
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        arrays[name] = array
+        offset = _align(offset)
+        sections[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += array.nbytes
+    header = {"version": VERSION, **header, "sections": sections}
+
+    encoded = json.dumps(header).encode()
+    data_start = _align(len(MAGIC) + LENGTH.size + len(encoded))
+
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(LENGTH.pack(len(encoded)))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.write(b"\0" * (data_start + sections[name]["offset"] - file.tell()))
+            file.write(memoryview(array.reshape(-1)).cast("B"))
+    os.replace(tmp_path, path)
+
+
+class ShowFile:
+    """An opened show file. The header is read straight away, sections only when asked for.
+
+    section() memory maps, so large sections like recorded data cost nothing until their pages are touched, and
+    contents() only copies out the small ones the show itself is made of.
+    """
+
+    def __init__(self, path: Path, header: dict, data_start: int):
+        self.path = path
+        self.header = header
+        self.data_start = data_start
+        self._maps: dict[str, np.ndarray] = {}
+
+    @classmethod
+    def open(cls, path: str | Path) -> "ShowFile":
+        path = Path(path)
+        with open(path, "rb") as file:
+            magic = file.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ShowFileError("Not a Lighthouse show file")
+            try:
+                (length,) = LENGTH.unpack(file.read(LENGTH.size))
+                header = json.loads(file.read(length))
+            except (struct.error, ValueError) as e:
+                raise ShowFileError(f"Corrupt header: {e}")
+            size = os.fstat(file.fileno()).st_size
+        if not isinstance(header, dict):
+            raise ShowFileError("Corrupt header: not an object")
+        header = migrate(header)
+        data_start = _align(len(MAGIC) + LENGTH.size + length)
+        _validate(header, data_start, size)
+        return cls(path, header, data_start)
+
+    def sectionNames(self) -> list[str]:
+        return list(self.header["sections"])
+
+    def section(self, name: str) -> np.ndarray | None:
+        """Read only memory mapped view of a section, None if the file doesn't have it"""
+        info = self.header["sections"].get(name)
+        if info is None:
+            return None
+        if name not in self._maps:
+            shape = tuple(info["shape"])
+            if np.prod(shape) == 0:
+                self._maps[name] = np.zeros(shape, dtype=info["dtype"])
+            else:
+                offset = self.data_start + info["offset"]
+                self._maps[name] = np.memmap(self.path, dtype=info["dtype"], mode="r", offset=offset, shape=shape)
+        return self._maps[name]
+
+    def contents(self) -> dict:
+        return decode(self.header, self.section)
+
+    def extraSections(self) -> list[str]:
+        """Sections that aren't part of the show itself, left mapped rather than loaded"""
+        return [name for name in self.header["sections"] if not name.startswith(SHOW_SECTIONS)]
+
+    def close(self) -> None:
+        self._maps = {}
+
+
+def _validate(header: dict, data_start: int, size: int) -> None:
+    """Check a header describes a whole file before anything is read from it, so a truncated or hand edited show
+    raises ShowFileError rather than failing part way through loading"""
+    missing = [key for key in REQUIRED_HEADER if key not in header]
+    if missing:
+        raise ShowFileError(f"Corrupt header: missing {', '.join(missing)}")
+    sections = header["sections"]
+    if not isinstance(sections, dict):
+        raise ShowFileError("Corrupt header: sections isn't an object")
+    missing = [name for name in REQUIRED_SECTIONS if name not in sections]
+    if missing:
+        raise ShowFileError(f"Corrupt header: missing sections {', '.join(missing)}")
+    for name, info in sections.items():
+        try:
+            shape = tuple(int(n) for n in info["shape"])
+            end = data_start + int(info["offset"]) + np.dtype(info["dtype"]).itemsize * math.prod(shape)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ShowFileError(f"Corrupt section {name}: {e!r}")
+        if min(shape, default=0) < 0 or int(info["offset"]) < 0:
+            raise ShowFileError(f"Corrupt section {name}: negative size or offset")
+        if end > size:
+            raise ShowFileError(f"Section {name} ends at byte {end} but the file is only {size} bytes, is it truncated?")
+
+
+def migrate(header: dict) -> dict:
+    version = header.get("version", 0)
+    if version > VERSION:
+        raise ShowFileError(f"Show file version {version} is newer than this version of Lighthouse ({VERSION})")
+    while version < VERSION:
+        if version not in MIGRATIONS:
+            raise ShowFileError(f"No migration from show file version {version}")
+        header = MIGRATIONS[version](header)
+        version += 1
+        header["version"] = version
+    return header
+
+
+class _Record:
+    """Stands in for the classes in old pickled shows, so loading one never runs any of our code"""
+
+
+def _vector(*args) -> tuple:
+    return tuple(float(a) for a in args)
+
+
+class _ShowUnpickler(pickle.Unpickler):
+    allowed = {
+        ("data_store", "Track"): _Record,
+        ("data_store", "Fixture"): _Record,
+        ("data_store", "HomographyPoint"): _Record,
+        ("response_curve", "ResponseCurve"): _Record,
+        ("PySide6.QtGui", "QVector3D"): _vector,
+        ("PySide6.QtGui", "QVector2D"): _vector,
+        ("PySide6.QtCore", "QPoint"): _vector,
+        ("PySide6.QtCore", "QPointF"): _vector,
+        ("numpy.core.multiarray", "_reconstruct"): np.core.multiarray._reconstruct,
+        ("numpy.core.multiarray", "scalar"): np.core.multiarray.scalar,
+        ("numpy", "ndarray"): np.ndarray,
+        ("numpy", "dtype"): np.dtype,
+    }
+
+    def find_class(self, module: str, name: str):
+        try:
+            return self.allowed[(module, name)]
+        except KeyError:
+            raise ShowFileError(f"Pickled show refers to {module}.{name}, which isn't allowed")
+
+
+def importPickle(path: str | Path) -> dict:
+    """Contents of a show saved by versions before the show file format, which pickled the data store"""
+    with open(path, "rb") as file:
+        try:
+            attributes = _ShowUnpickler(file).load()
+        except (pickle.UnpicklingError, EOFError, AttributeError, TypeError, ValueError) as e:
+            raise ShowFileError(f"Corrupt pickled show: {e}")
+    if not isinstance(attributes, dict):
+        raise ShowFileError("Pickled show isn't a dictionary")
+
+    def vector(value, length: int) -> tuple:
+        if isinstance(value, tuple) and len(value) >= length:
+            return value[:length]
+        return (0.0,) * length
+
+    tracks = []
+    for track in attributes.get("tracks", []):
+        if track is None:
+            tracks.append(None)
+            continue
+        fields = track.__dict__
+        curve = getattr(fields.get("response_curve"), "__dict__", {})
+        tracks.append(
+            {
+                "name": str(fields.get("name", "")),
+                "input_device": str(fields.get("input_device", "")),
+                "filter": str(fields.get("filter", "One-Euro")),
+                "tracker": str(fields.get("tracker", "Template")),
+                "height_offset": float(fields.get("height_offset", 0.0)),
+                "smoothing": float(fields.get("smoothing", 0.0)),
+                "curve_expo": float(curve.get("expo", TRACK_COLUMNS["curve_expo"])),
+                "curve_dead_zone": float(curve.get("dead_zone", 0.0)),
+                "curve_gain": float(curve.get("gain", TRACK_COLUMNS["curve_gain"])),
+                "curve_max_speed": float(curve.get("max_speed", math.inf)),
+            }
+        )
+
+    fixtures = []
+    for fixture in attributes.get("fixtures", []):
+        fields = {**FIXTURE_COLUMNS, **fixture.__dict__}
+        position = vector(fields.get("position"), 3)
+        orientation = vector(fields.get("orientation"), 3)
+        fixtures.append(
+            {
+                "name": str(fields.get("name", "")),
+                "position_x": position[0],
+                "position_y": position[1],
+                "position_z": position[2],
+                "orientation_x": orientation[0],
+                "orientation_y": orientation[1],
+                "orientation_z": orientation[2],
+                **{name: fields[name] for name in list(FIXTURE_COLUMNS)[6:]},
+                "calibration_samples": {
+                    str(k): tuple(float(x) for x in v) for k, v in dict(fields.get("calibration_samples", {})).items()
+                },
+            }
+        )
+
+    points = {}
+    for name, point in attributes.get("_homography_points", {}).items():
+        fields = point.__dict__
+        points[str(name)] = (vector(fields.get("world_coord"), 3), vector(fields.get("screen_coord"), 2))
+
+    calibration = {}
+    for name in CALIBRATION:
+        if f"_{name}" in attributes:
+            value = attributes[f"_{name}"]
+            calibration[name] = None if value is None else np.array(value, dtype=np.float64)
+
+    return {
+        "height_offset": float(attributes.get("_height_offset", 0.0)),
+        "calibration": calibration,
+        "homography_points": points,
+        "tracks": tracks,
+        "fixtures": fixtures,
+    }
+
+
+def loadShow(path: str | Path) -> ShowFile | dict:
+    """Contents of a show file of either format. Show files come back open, so their extra sections stay mapped."""
+    with open(path, "rb") as file:
+        magic = file.read(len(MAGIC))
+    if magic == MAGIC:
+        return ShowFile.open(path)
+    if magic[:1] == b"\x80":  # Pickle protocol 2 and up
+        return importPickle(path)
+    raise ShowFileError("Not a Lighthouse show file")
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from PySide6.QtCore import QPoint
+    from PySide6.QtGui import QVector2D, QVector3D
+
+    from data_store import Fixture, HomographyPoint, Track
+
+    folder = Path(tempfile.mkdtemp())
+    track = {
+        "name": "Lead",
+        "input_device": "SpaceMouse 1",
+        "filter": "Kalman",
+        "tracker": "CSRT",
+        **TRACK_COLUMNS,
+        "smoothing": 0.5,
+    }
+    fixture = {**FIXTURE_COLUMNS, "name": "Spot 1", "universe": 2, "invert_tilt": True}
+    fixture["calibration_samples"] = {"A": (1.0, 2.0)}
+    contents = {
+        "height_offset": 1500.0,
+        "calibration": {name: None for name in CALIBRATION} | {"camera_matrix": np.eye(3), "camera_dist": np.zeros(4)},
+        "homography_points": {"A": ((0.0, 1.0, 2.0), (3.0, 4.0)), "B": ((5.0, 6.0, 7.0), (8.0, 9.0))},
+        "tracks": [track, None],
+        "fixtures": [fixture],
+    }
+    recording = np.arange(3_000_000, dtype=np.float64).reshape(-1, 3)
+    writeShow(folder / "show.lho", contents, {"recordings/take 1": recording})
+
+    show = loadShow(folder / "show.lho")
+    loaded = show.contents()
+    assert loaded["tracks"] == [track, None] and loaded["fixtures"] == [fixture]
+    assert loaded["homography_points"] == contents["homography_points"] and loaded["height_offset"] == 1500.0
+    assert np.array_equal(loaded["calibration"]["camera_matrix"], np.eye(3)) and loaded["calibration"]["r_vec"] is None
+    assert show.extraSections() == ["recordings/take 1"]
+    take = show.section("recordings/take 1")
+    assert isinstance(take, np.memmap) and take.ctypes.data % ALIGNMENT == 0 and np.array_equal(take[-1], recording[-1])
+
+    # Columns added after a file was written get their defaults
+    header = dict(show.header, track_columns=["smoothing"])
+    assert decode(header, show.section)["tracks"][0]["curve_gain"] == TRACK_COLUMNS["curve_gain"]
+    try:
+        migrate({"version": VERSION + 1})
+        assert False
+    except ShowFileError:
+        pass
+
+    # Truncated and malformed files are rejected when they're opened, not part way through reading them
+    data = (folder / "show.lho").read_bytes()
+    encoded = json.dumps({"version": VERSION}).encode()
+    broken = {
+        "truncated.lho": data[:-1000],
+        "short.lho": data[:10],
+        "no sections.lho": MAGIC + LENGTH.pack(len(encoded)) + encoded,
+    }
+    for name, data in broken.items():
+        (folder / name).write_bytes(data)
+        try:
+            ShowFile.open(folder / name)
+            assert False, name
+        except ShowFileError as e:
+            print("Rejected:", e)
+
+    # A show pickled by earlier versions
+    old = Track("Old")
+    old.__dict__.pop("tracker")  # Saved before auto tracking existed
+    old_fixture = Fixture("Old spot", position=QVector3D(1, 2, 3))
+    attributes = {
+        "_camera_matrix": np.eye(3, dtype=np.float32),
+        "_homography_points": {
+            "A": HomographyPoint(QVector3D(1, 2, 3), QVector2D(4, 5)),
+            "B": HomographyPoint(screen_coord=QPoint(6, 7)),  # Clicked points were stored as QPoints
+        },
+        "_height_offset": 100.0,
+        "tracks": [old, None],
+        "fixtures": [old_fixture],
+    }
+    with open(folder / "old.lho", "wb") as file:
+        pickle.dump(attributes, file)
+    imported = loadShow(folder / "old.lho")
+    assert imported["tracks"][0]["tracker"] == "Template" and imported["tracks"][1] is None
+    assert imported["fixtures"][0]["position_y"] == 2.0 and imported["fixtures"][0]["orientation_x"] == 0.0
+    assert imported["homography_points"]["B"] == ((0.0, 0.0, 0.0), (6.0, 7.0))
+    assert "camera_inv" not in imported["calibration"]
+    writeShow(folder / "converted.lho", imported)
+    assert loadShow(folder / "converted.lho").contents()["fixtures"] == imported["fixtures"]
+
+    class Payload:
+        def __reduce__(self):
+            return (os.system, ("echo unsafe",))
+
+    with open(folder / "evil.lho", "wb") as file:
+        pickle.dump({"tracks": [Payload()]}, file)
+    try:
+        loadShow(folder / "evil.lho")
+        assert False
+    except ShowFileError as e:
+        print("Rejected:", e)
+
+    # Loading a show with a large recording only reads the header and the show itself
+    start = time.perf_counter()
+    for _ in range(100):
+        loadShow(folder / "show.lho").contents()
+    print(f"Load with {recording.nbytes / 1e6:.0f}MB recorded: {(time.perf_counter() - start) * 10:.2f}ms")
+    with open(folder / "recording.pickle", "wb") as file:
+        pickle.dump({**attributes, "recording": recording}, file)
+    start = time.perf_counter()
+    with open(folder / "recording.pickle", "rb") as file:
+        pickle.load(file)
+    print(f"Same as a pickle: {(time.perf_counter() - start) * 1000:.2f}ms")
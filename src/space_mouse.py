@@ -1,94 +1,317 @@
 import pyspacemouse
-from PySide6.QtCore import Slot, QObject, QTimer, Signal, QPoint, Qt, QThread, QSize
-from PySide6.QtGui import QVector3D, QVector2D
+from PySide6.QtCore import Slot, Signal, QPoint, QThread, QSize, Qt
 
 import math
+import os
+import select
 import time
 
+import numpy as np
+
+from response_curve import ResponseCurve, applyCurves
+
+EMIT_PERIOD = 1 / 60  # seconds between cursor updates per device
+FALLBACK_POLL_PERIOD = 0.002  # seconds, only for devices without a pollable file descriptor
+
+
+class HidrawSource:
+    """A SpaceMouse read through its hidraw node so it can be multiplexed with poll"""
+
+    def __init__(self, device):
+        self.device = device
+        self.fd = os.open(os.fsdecode(device.device.path), os.O_RDONLY | os.O_NONBLOCK)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def readReports(self) -> list:
+        reports = []
+        while True:
+            try:
+                report = os.read(self.fd, 64)
+            except BlockingIOError:
+                break
+            if not report:
+                break
+            reports.append(report)
+        return reports
+
+    def decode(self, report) -> tuple[float, float, float, float]:
+        state = self.device.process(list(report))
+        return state.roll, state.pitch, state.x, state.y
+
+    def setLed(self, on: bool) -> None:
+        self.device.set_led(int(on))
+
+    def close(self) -> None:
+        os.close(self.fd)
+        self.device.close()
+
+
+class PolledSource:
+    """Fallback for platforms without hidraw: non-blocking reads on every pass of the reader loop"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def fileno(self) -> None:
+        return None
+
+    def readReports(self) -> list:
+        state = self.device.read()
+        return [state] if state else []
+
+    def decode(self, state) -> tuple[float, float, float, float]:
+        return state.roll, state.pitch, state.x, state.y
+
+    def setLed(self, on: bool) -> None:
+        self.device.set_led(int(on))
+
+    def close(self) -> None:
+        self.device.close()
+
+
+class _Motion:
+    """Integrated cursor position of one device"""
+
+    def __init__(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.velocity = (0.0, 0.0)  # pixels per second, from the response curve
+        self.last_t = None
+        self.last_emit = -math.inf
+        self.pending = False  # Moved since the last emit
+
+    def moving(self) -> bool:
+        return self.velocity != (0.0, 0.0)
+
+    def advance(self, now: float, clamp: tuple[int, int]) -> None:
+        """Integrate the current velocity from the previous report up to now"""
+        if self.last_t is not None and self.moving():
+            dt = now - self.last_t
+            self.x = max(0.0, min(self.x + self.velocity[0] * dt, clamp[0]))
+            self.y = max(0.0, min(self.y + self.velocity[1] * dt, clamp[1]))
+            self.pending = True
+        self.last_t = now
+
+
+class SpaceMouseReader(QThread):
+    """Reads every SpaceMouse from one thread.
+
+    The reader blocks in poll() on all of the devices' file descriptors, so it costs nothing while the devices are idle.
+    Motion is integrated between the times reports actually arrive rather than on a fixed loop tick, and cursor moves
+    are emitted at most every EMIT_PERIOD per device. Deflections go through each device's response curve tables, all
+    devices at once, only when new reports arrive. Devices that can't be polled fall back to being read every
+    FALLBACK_POLL_PERIOD from the same thread.
+    """
 
-class SpaceMouseWatcher(QThread):
     cursor_moved = Signal(int, QPoint)  # Mouse ID, point
 
-    def __init__(self, device, id: int, parent=None):
+    def __init__(self, sources: list, parent=None):
         QThread.__init__(self, parent)
         self.exiting = False
-        self.device = device
-        self.id = id
+        self.sources = sources
+        self.motion = [_Motion() for _ in sources]
+        self.axes = np.zeros((len(sources), 4))  # roll, pitch, x, y deflection of each device
+        self._tables = np.repeat(ResponseCurve().tables()[None], len(sources), axis=0)
+        self._clamp = (1280, 720)
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+
+    @Slot(QSize)
+    def setClampResolution(self, size: QSize) -> None:
+        """Safe from any thread, the reader picks up the new tuple on its next pass"""
+        self._clamp = (size.width(), size.height())
 
-        self.pos = QVector2D(0, 0)
+    def setCurves(self, tables: np.ndarray) -> None:
+        """(devices, 4, TABLE_SIZE) response curve tables, swapped in whole so it's safe from any thread.
 
-        self.roll = 0
-        self.pitch = 0
-        self.x = 0
-        self.y = 0
-        self.t = None
+        Devices without a table of their own keep the default curve.
+        """
+        devices = len(self.sources)
+        if tables.shape[0] < devices:
+            print(f"[Error] Response curves for {tables.shape[0]} of {devices} SpaceMice, the rest use the default")
+            default = np.repeat(ResponseCurve().tables()[None], devices - tables.shape[0], axis=0)
+            tables = np.concatenate([tables, default])
+        self._tables = tables[:devices]
+        os.write(self._wake_write, b"\0")
 
-        self.last_update_t = None
-        self.last_emit_change = 0
+    def stop(self) -> None:
+        self.exiting = True
+        os.write(self._wake_write, b"\0")
+        self.wait()
 
     def run(self):
-        self.device.set_led(1)
+        poller = select.poll()
+        poller.register(self._wake_read, select.POLLIN)
+        by_fd = {}
+        polled = []
+        for id, source in enumerate(self.sources):
+            source.setLed(True)
+            fd = source.fileno()
+            if fd is None:
+                polled.append(id)
+            else:
+                poller.register(fd, select.POLLIN)
+                by_fd[fd] = id
 
+        tables = None
         while not self.exiting:
-            state = self.device.read()
-            current_time = time.time()
-            if state:
-                self.t = state.t
-                self.roll = state.roll
-                self.pitch = state.pitch
-                self.x = state.x
-                self.y = state.y
-
-            if self.t is not None and self.last_update_t is None:
-                self.last_update_t = current_time
-
-            if self.t is not None and self.last_update_t is not None:
-                update_t_diff = current_time - self.last_update_t
-                self.last_update_t = current_time
-
-                emit_t_diff = current_time - self.last_emit_change
-
-                linear_sensitivity = 1
-
-                self.pos = self.pos + QVector2D(
-                    (self.moveCurve(self.roll) + self.x * linear_sensitivity) * update_t_diff * 100,
-                    (-self.moveCurve(self.pitch) - self.y * linear_sensitivity) * update_t_diff * 100,
-                )
-                # res: QSize = self.parent().parent().video_widget.originalPixmap().size()
-                res: QSize = self.parent().parent().video_widget.video_resolution
-                self.pos.setX(max(0, min(self.pos.x(), res.width())))
-                self.pos.setY(max(0, min(self.pos.y(), res.height())))
-
-                if emit_t_diff >= 1 / 60:
-                    self.last_emit_change = current_time
-                    self.cursor_moved.emit(self.id, QPoint(self.pos.x(), self.pos.y()))
-            time.sleep(0.001)
-        self.device.set_led(0)
-        self.device.close()
+            events = poller.poll(self._timeout(polled))
+            now = time.monotonic()
+            clamp = self._clamp
+            ready = []
+            for fd, _ in events:
+                if fd == self._wake_read:
+                    os.read(self._wake_read, 64)
+                elif fd in by_fd:
+                    ready.append(by_fd[fd])
 
-    def moveCurve(self, x):
-        return 3 * x**3 + math.copysign(3 * x**2, x) + 1 * x
+            changed = False
+            for id in ready + polled:
+                reports = self.sources[id].readReports()
+                if not reports:
+                    continue
+                self.motion[id].advance(now, clamp)
+                for report in reports:
+                    self.axes[id] = self.sources[id].decode(report)
+                changed = True
+            if changed or tables is not self._tables:
+                tables = self._tables
+                for motion in self.motion:
+                    motion.advance(now, clamp)  # Up to now at the old speed
+                speeds = applyCurves(tables, self.axes)
+                for id, (roll, pitch, x, y) in enumerate(speeds.tolist()):
+                    self.motion[id].velocity = (roll + x, -pitch - y)
 
+            for id, motion in enumerate(self.motion):
+                motion.advance(now, clamp)
+                if motion.pending and now - motion.last_emit >= EMIT_PERIOD:
+                    motion.pending = False
+                    motion.last_emit = now
+                    self.cursor_moved.emit(id, QPoint(round(motion.x), round(motion.y)))
 
-class SpaceMouse(QObject):
-    def __init__(self, device, id, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.active = False
-        self.watcher = SpaceMouseWatcher(device, id, parent=self)
-        self.watcher.start()
+        for source in self.sources:
+            source.setLed(False)
+            source.close()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
 
-    def cleanup(self):
-        self.watcher.exiting = True
-        self.watcher.wait()
+    def _timeout(self, polled: list) -> int | None:
+        """Milliseconds poll may block for: forever when nothing is moving, otherwise until the next emit is due"""
+        timeout = None
+        now = time.monotonic()
+        for motion in self.motion:
+            if motion.moving() or motion.pending:
+                due = max(0.0, motion.last_emit + EMIT_PERIOD - now)
+                timeout = due if timeout is None else min(timeout, due)
+        if polled:
+            timeout = FALLBACK_POLL_PERIOD if timeout is None else min(timeout, FALLBACK_POLL_PERIOD)
+        return None if timeout is None else math.ceil(timeout * 1000)
 
 
-def createAllSpaceMice(parent) -> list[SpaceMouse]:
+def openSource(device):
+    try:
+        return HidrawSource(device)
+    except (OSError, AttributeError, TypeError):
+        return PolledSource(device)
+
+
+def createSpaceMouseReader(parent) -> SpaceMouseReader | None:
     devices = pyspacemouse.open_all()
-    result = []
+    if not devices or not all([device for device in devices]):
+        return None
+
+    sources = []
+    for device in devices:
+        device.set_led(0)
+        sources.append(openSource(device))
+    reader = SpaceMouseReader(sources, parent=parent)
+    reader.start()
+    return reader
+
+
+if __name__ == "__main__":
+    import struct
+
+    from response_curve import SPEED
+
+    class FakeSource:
+        """Pipe backed stand-in for a device, each report is a send timestamp and four axes"""
+
+        def __init__(self):
+            self.read_fd, self.write_fd = os.pipe()
+            os.set_blocking(self.read_fd, False)
+            self.report = struct.Struct("<d4f")
+
+        def send(self, roll, pitch, x, y):
+            os.write(self.write_fd, self.report.pack(time.perf_counter(), roll, pitch, x, y))
+
+        def fileno(self):
+            return self.read_fd
+
+        def readReports(self):
+            data = b""
+            while True:
+                try:
+                    chunk = os.read(self.read_fd, 4096)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    break
+                data += chunk
+            return [data[i : i + self.report.size] for i in range(0, len(data), self.report.size)]
+
+        def decode(self, report):
+            sent, *axes = self.report.unpack(report)
+            self.last_sent = sent
+            return tuple(axes)
+
+        def setLed(self, on):
+            pass
+
+        def close(self):
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+
+    # Two devices reporting at the SpaceMouse's usual ~125 Hz while deflected, then idle
+    sources = [FakeSource(), FakeSource()]
+    reader = SpaceMouseReader(sources)
+    reader.setClampResolution(QSize(1920, 1080))
+    latencies = []
+    emitted = [0, 0]
+
+    def onMove(id, point):
+        latencies.append(time.perf_counter() - sources[id].last_sent)
+        emitted[id] += 1
+
+    reader.cursor_moved.connect(onMove, Qt.DirectConnection)  # No event loop here
+    reader.start()
+    time.sleep(0.1)
+
+    seconds = 3
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    deadline = wall_start
+    while time.monotonic() - wall_start < seconds:
+        for source in sources:
+            source.send(0.0, 0.0, 0.5, -0.5)
+        deadline += 1 / 125
+        time.sleep(max(0.0, deadline - time.monotonic()))
+    active_cpu = (time.process_time() - cpu_start) / seconds
+    for source in sources:
+        source.send(0.0, 0.0, 0.0, 0.0)
 
-    if all([device for device in devices]):
-        for i, device in enumerate(devices):
-            device.set_led(0)
-            result.append(SpaceMouse(device, i, parent=parent))
+    time.sleep(0.1)
+    cpu_start = time.process_time()
+    time.sleep(seconds)
+    idle_cpu = (time.process_time() - cpu_start) / seconds
 
-    return result
+    reader.stop()
+    latencies = np.array(latencies) * 1000
+    print(f"Emitted {emitted} moves in {seconds}s, final position {reader.motion[0].x:.1f}, {reader.motion[0].y:.1f}")
+    print(f"Report -> emit latency p50 {np.percentile(latencies, 50):.2f}ms, p99 {np.percentile(latencies, 99):.2f}ms")
+    print(f"CPU while moving {active_cpu * 100:.1f}% (including the fake senders), idle {idle_cpu * 100:.2f}%")
+    # 0.5 translation for 3s at SPEED pixels per second, starting from the corner
+    assert abs(reader.motion[0].x - 0.5 * SPEED * seconds) < 0.05 * SPEED * seconds
+    assert idle_cpu < 0.01
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class StartupTimer:
+    """Times a cold start, from this module being imported until the app is usable.
+
+    Phases are spans of work on any thread, the show loader's overlap the main thread's. Milestones are points in time
+    since the start, like the window first being shown. Once every expected milestone is reached a summary is printed
+    and, with a path set, the timings are written as JSON so startup regressions can be caught by comparing runs.
+    Anything timed after that (opening another show, say) is ignored.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: list[dict] = []
+        self.milestones: dict[str, float] = {}  # ms since the start
+        self.expected: set[str] = set()
+        self.path: Path | None = None
+        self.finished = False
+        self._current: tuple[str, float] | None = None  # The phase begin() started
+        self._lock = threading.Lock()
+
+    def elapsed(self, at: float | None = None) -> float:
+        """ms since the start"""
+        return ((time.perf_counter() if at is None else at) - self.start) * 1000
+
+    @contextmanager
+    def phase(self, name: str):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, begin, time.perf_counter())
+
+    def begin(self, name: str) -> None:
+        """End the phase the last begin() started and start name, for long stretches of setup code"""
+        now = time.perf_counter()
+        self.end(now)
+        self._current = (name, now)
+
+    def end(self, at: float | None = None) -> None:
+        if self._current is not None:
+            self._record(*self._current, time.perf_counter() if at is None else at)
+            self._current = None
+
+    def _record(self, name: str, begin: float, end: float) -> None:
+        if self.finished:
+            return
+        with self._lock:
+            self.phases.append(
+                {
+                    "name": name,
+                    "thread": threading.current_thread().name,
+                    "start_ms": self.elapsed(begin),
+                    "duration_ms": (end - begin) * 1000,
+                }
+            )
+        print(f"[startup] {name}: {(end - begin) * 1000:.0f}ms")
+
+    def expect(self, *names: str, path: Path | None = None) -> None:
+        """Finish once all of names have been reached, writing the report to path"""
+        self.expected.update(names)
+        self.path = path
+
+    def milestone(self, name: str) -> None:
+        if self.finished:
+            return
+        with self._lock:
+            self.milestones.setdefault(name, self.elapsed())
+            done = bool(self.expected) and self.expected <= self.milestones.keys()
+        print(f"[startup] {name} after {self.milestones[name]:.0f}ms")
+        if done:
+            self.finish()
+
+    def report(self) -> dict:
+        return {"time": time.time(), "phases": self.phases, "milestones": self.milestones}
+
+    def finish(self) -> None:
+        self.finished = True
+        slowest = sorted(self.phases, key=lambda p: p["duration_ms"], reverse=True)[:3]
+        print(
+            f"[info] Started in {max(self.milestones.values(), default=self.elapsed()):.0f}ms, slowest phases:",
+            ", ".join(f"{p['name']} {p['duration_ms']:.0f}ms" for p in slowest),
+        )
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps(self.report(), indent=1))
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            print("[Error] Couldn't write the startup report", e)
+
+
+# The one timer for this process, everything that's part of starting up records into it
+startup = StartupTimer()
@@ -0,0 +1,47 @@
+import numpy as np
+import cv2 as cv
+
+
+class TrackProjector:
+    """Projects every track's ground and target point into the image with one projectPoints call.
+
+    Results are cached against the track positions and the calibration version, so repeated overlay updates for an
+    unchanged frame are free.
+    """
+
+    def __init__(self):
+        self._cache_key = None
+        self._cache = np.zeros((0, 2, 2))
+
+    def project(
+        self,
+        tracks: np.ndarray,
+        height_offset: float,
+        r_vec: np.ndarray,
+        t_vec: np.ndarray,
+        camera_matrix: np.ndarray,
+        camera_dist: np.ndarray | None,
+        calibration_version: int,
+    ) -> np.ndarray:
+        """Returns an (N, 2, 2) array of [ground, target] screen points for an (N, 3) array of track positions"""
+        tracks = np.asarray(tracks, dtype=np.float64).reshape(-1, 3)
+        key = (calibration_version, tracks.tobytes())
+        if key == self._cache_key:
+            return self._cache
+
+        if len(tracks) == 0:
+            result = np.zeros((0, 2, 2))
+        else:
+            grounds = tracks.copy()
+            grounds[:, 2] -= height_offset * 1000
+            pts = np.concatenate((grounds, tracks))
+            res, _ = cv.projectPoints(pts, r_vec, t_vec, camera_matrix, camera_dist)
+            res = res.reshape(2, len(tracks), 2)
+            result = np.stack((res[0], res[1]), axis=1)
+
+        self._cache_key = key
+        self._cache = result
+        return result
+
+    def invalidate(self) -> None:
+        self._cache_key = None
@@ -15,19 +15,32 @@ from PySide6.QtWidgets import (
     QLineEdit,
     QSizePolicy,
     QColorDialog,
+    QSpinBox,
 )
 from PySide6.QtCore import Signal, Slot, Qt, QSize
 from PySide6.QtGui import QVector3D, QVector2D, QIconEngine, QIcon
 
+from auto_tracker import availableTrackers
 from data_store import HomographyPoint, Track
+from input_bus import defaultSource
+from response_curve import ResponseCurve, gainForSensitivity, sensitivityForGain
+from track_filter import FILTER_TYPES
 from settings_dialogs import AddNewPointDialog, EditPointDialog
 
 from double_slider import DoubleSlider
 
 
 class TrackEditor(QWidget):
-    def __init__(self, track: Track, id: int, *args, **kwargs):
+    filterChanged = Signal(int, str, float)  # id, filter type, smoothing
+    inputDeviceChanged = Signal(int, str)  # id, input bus source name
+    responseCurveChanged = Signal(int, object)  # id, ResponseCurve
+    autoFollowChanged = Signal(int, bool)  # id, following
+    removeRequested = Signal(int)  # id
+
+    def __init__(self, track: Track, id: int, sources: list[str], *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.track = track
+        self.id = id
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Maximum)
 
         self.v_layout = QVBoxLayout()
@@ -39,11 +52,31 @@ class TrackEditor(QWidget):
         self.color_pick.clicked.connect(self.showColourPicker)
         self.color_pick.setStyleSheet(f"background-color:rgb(255, 0, 0);")
         self.name_layout.addWidget(self.color_pick)
+        self.remove = QPushButton("Remove")
+        self.remove.clicked.connect(lambda _: self.removeRequested.emit(self.id))
+        self.name_layout.addWidget(self.remove)
         self.v_layout.addLayout(self.name_layout)
 
         self.input_device = QComboBox()
-        self.input_device.addItems(["Cursor", "Space Mouse 1", "Space Mouse 2"])
+        self.setSources(sources)
+        self.input_device.currentTextChanged.connect(lambda name: self.inputDeviceChanged.emit(self.id, name))
         self.v_layout.addWidget(self.input_device)
+
+        self.auto_follow_layout = QHBoxLayout()
+        self.auto_follow = QPushButton("Auto follow")
+        self.auto_follow.setCheckable(True)
+        self.auto_follow.setToolTip("Follow the performer under the track in the video, uncheck to take control back")
+        self.auto_follow.toggled.connect(lambda checked: self.autoFollowChanged.emit(self.id, checked))
+        self.auto_follow_layout.addWidget(self.auto_follow)
+        self.tracker_type = QComboBox()
+        # Only what this OpenCV build can create, a show from a build with more falls back like createTracker does
+        trackers = availableTrackers()
+        self.tracker_type.addItems(trackers)
+        self.tracker_type.setCurrentText(track.tracker if track.tracker in trackers else trackers[0])
+        self.tracker_type.currentTextChanged.connect(self.updateTracker)
+        self.auto_follow_layout.addWidget(self.tracker_type)
+        self.v_layout.addLayout(self.auto_follow_layout)
+
         self.v_layout.addWidget(QLabel("Height offset"))
         self.height_offset = DoubleSlider(orientation=Qt.Orientation.Horizontal)
         self.height_offset.setMinimum(-0.5)
@@ -55,13 +88,83 @@ class TrackEditor(QWidget):
         self.sensitivity.setMinimum(0)
         self.sensitivity.setMaximum(1)
         self.sensitivity.setTickInterval(0.01)
+        self.sensitivity.setValue(sensitivityForGain(track.response_curve.gain))
+        self.sensitivity.doubleValueChanged.connect(
+            lambda value: self.updateResponseCurve(gain=gainForSensitivity(value))
+        )
         self.v_layout.addWidget(self.sensitivity)
+        self.v_layout.addWidget(QLabel("Expo"))
+        self.expo = DoubleSlider(orientation=Qt.Orientation.Horizontal)
+        self.expo.setMinimum(0)
+        self.expo.setMaximum(1)
+        self.expo.setTickInterval(0.01)
+        self.expo.setValue(track.response_curve.expo)
+        self.expo.doubleValueChanged.connect(lambda value: self.updateResponseCurve(expo=value))
+        self.v_layout.addWidget(self.expo)
+        self.v_layout.addWidget(QLabel("Dead zone"))
+        self.dead_zone = DoubleSlider(orientation=Qt.Orientation.Horizontal)
+        self.dead_zone.setMinimum(0)
+        self.dead_zone.setMaximum(0.5)
+        self.dead_zone.setTickInterval(0.01)
+        self.dead_zone.setValue(track.response_curve.dead_zone)
+        self.dead_zone.doubleValueChanged.connect(lambda value: self.updateResponseCurve(dead_zone=value))
+        self.v_layout.addWidget(self.dead_zone)
+        self.v_layout.addWidget(QLabel("Max speed"))
+        self.max_speed = QSpinBox()
+        self.max_speed.setRange(0, 20000)
+        self.max_speed.setSingleStep(100)
+        self.max_speed.setSuffix(" px/s")
+        self.max_speed.setSpecialValueText("Unlimited")  # Shown for 0
+        max_speed = track.response_curve.max_speed
+        self.max_speed.setValue(0 if max_speed == float("inf") else round(max_speed))
+        self.max_speed.valueChanged.connect(lambda value: self.updateResponseCurve(max_speed=value or float("inf")))
+        self.v_layout.addWidget(self.max_speed)
         self.v_layout.addWidget(QLabel("Smoothing"))
         self.smoothing = DoubleSlider(orientation=Qt.Orientation.Horizontal)
         self.smoothing.setMinimum(0)
         self.smoothing.setMaximum(1)
         self.smoothing.setTickInterval(0.01)
+        self.smoothing.setValue(track.smoothing)
+        self.smoothing.doubleValueChanged.connect(self.updateFilter)
         self.v_layout.addWidget(self.smoothing)
+        self.filter_type = QComboBox()
+        self.filter_type.addItems(FILTER_TYPES)
+        self.filter_type.setCurrentText(track.filter)
+        self.filter_type.currentTextChanged.connect(self.updateFilter)
+        self.v_layout.addWidget(self.filter_type)
+
+    def setSources(self, sources: list[str]):
+        """Input devices to choose from, showing the one the input bus has the track on"""
+        current = self.track.input_device or defaultSource(self.id, sources)
+        self.input_device.blockSignals(True)
+        self.input_device.clear()
+        self.input_device.addItems(sources)
+        if current not in sources:
+            self.input_device.addItem(current)  # Chosen before, but not connected now
+        self.input_device.setCurrentText(current)
+        self.input_device.blockSignals(False)
+
+    def updateFilter(self, _=None):
+        self.track.filter = self.filter_type.currentText()
+        self.track.smoothing = self.smoothing.value()
+        self.filterChanged.emit(self.id, self.track.filter, self.track.smoothing)
+
+    def updateResponseCurve(self, **changes):
+        """Only the changed setting is taken from its control, so the others don't pick up the sliders' rounding"""
+        curve = self.track.response_curve
+        settings = {"expo": curve.expo, "dead_zone": curve.dead_zone, "gain": curve.gain, "max_speed": curve.max_speed}
+        self.responseCurveChanged.emit(self.id, ResponseCurve(**{**settings, **changes}))
+
+    def updateTracker(self, kind: str):
+        self.track.tracker = kind
+        if self.auto_follow.isChecked():
+            self.autoFollowChanged.emit(self.id, True)  # Restart with the new tracker
+
+    def setAutoFollow(self, follow: bool):
+        """Reflect a change made elsewhere, for instance the tracker losing the performer"""
+        self.auto_follow.blockSignals(True)
+        self.auto_follow.setChecked(follow)
+        self.auto_follow.blockSignals(False)
 
     def showColourPicker(self, _):
         picker = QColorDialog()
@@ -74,6 +177,12 @@ class TrackSettingsDock(QDockWidget):
     addNewHomographyPoint = Signal(str, HomographyPoint)
     editHomographyPoint = Signal(str, str, HomographyPoint)
     removeHomographyPoint = Signal(str)
+    trackFilterChanged = Signal(int, str, float)  # id, filter type, smoothing
+    trackInputDeviceChanged = Signal(int, str)  # id, input bus source name
+    trackResponseCurveChanged = Signal(int, object)  # id, ResponseCurve
+    trackAutoFollowChanged = Signal(int, bool)  # id, following
+    addNewTrack = Signal()
+    removeTrack = Signal(int)  # id
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -97,6 +206,9 @@ class TrackSettingsDock(QDockWidget):
         title_layout.addSpacing(2)
         title_layout.addWidget(QLabel("Track settings"))
         title_layout.addStretch()
+        add_track = QPushButton("Add track")
+        add_track.clicked.connect(lambda _: self.addNewTrack.emit())
+        title_layout.addWidget(add_track)
 
         self.track_list = QListWidget()
         self.track_list.setFlow(QListWidget.Flow.LeftToRight)
@@ -104,22 +216,51 @@ class TrackSettingsDock(QDockWidget):
         self.track_list.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.settings_layout.addWidget(self.track_list)
 
-        new_item = QListWidgetItem()
-        new_item.setFlags(new_item.flags() & ~Qt.ItemIsSelectable)
-        widget = TrackEditor(self.parent().data.tracks[0], 0)
-        new_item.setSizeHint(widget.sizeHint())
-        self.track_list.addItem(new_item)
-        self.track_list.setItemWidget(new_item, widget)
+        self.editors: dict[int, TrackEditor] = {}
+        for id in self.parent().data.trackIds():
+            self.insertTrackEditor(id)
+        self.parent().data.input_bus.sources_changed.connect(self.updateSources)
 
+        self.track_list.setFixedHeight(self.track_list.sizeHintForRow(0))
+        # self.track_list.setMinimumWidth(self.track_list.sizeHintForColumn(0))
+        # self.track_list.setFixedHeight(self.track_list.sizeHintForRow(0) * self.track_list.count() + 2)
+
+        self.resize(self.sizeHint())
+
+    @Slot(int)
+    def insertTrackEditor(self, id: int):
+        data = self.parent().data
         new_item = QListWidgetItem()
         new_item.setFlags(new_item.flags() & ~Qt.ItemIsSelectable)
-        widget = TrackEditor(self.parent().data.tracks[1], 1)
+        widget = TrackEditor(data.tracks[id], id, data.input_bus.deviceNames())
+        widget.filterChanged.connect(self.trackFilterChanged)
+        widget.inputDeviceChanged.connect(self.trackInputDeviceChanged)
+        widget.responseCurveChanged.connect(self.trackResponseCurveChanged)
+        widget.autoFollowChanged.connect(self.trackAutoFollowChanged)
+        widget.removeRequested.connect(self.removeTrack)
         new_item.setSizeHint(widget.sizeHint())
-        self.track_list.addItem(new_item)
+        self.track_list.insertItem(sum(1 for other in self.editors if other < id), new_item)
         self.track_list.setItemWidget(new_item, widget)
+        self.editors[id] = widget
 
-        self.track_list.setFixedHeight(self.track_list.sizeHintForRow(0))
-        # self.track_list.setMinimumWidth(self.track_list.sizeHintForColumn(0))
-        # self.track_list.setFixedHeight(self.track_list.sizeHintForRow(0) * self.track_list.count() + 2)
+    @Slot(int)
+    def removeTrackEditor(self, id: int):
+        widget = self.editors.pop(id, None)
+        if widget is None:
+            return
+        for row in range(self.track_list.count()):
+            if self.track_list.itemWidget(self.track_list.item(row)) is widget:
+                self.track_list.takeItem(row)
+                break
+        widget.deleteLater()
 
-        self.resize(self.sizeHint())
+    @Slot()
+    def updateSources(self):
+        sources = self.parent().data.input_bus.deviceNames()
+        for editor in self.editors.values():
+            editor.setSources(sources)
+
+    @Slot(int, bool)
+    def setAutoFollow(self, id: int, follow: bool):
+        if id in self.editors:
+            self.editors[id].setAutoFollow(follow)
@@ -0,0 +1,132 @@
+import numpy as np
+
+FLAG_ALIVE = 1  # The row holds a track
+FLAG_VALID = 2  # Has had a position since it was added
+
+OWNER_INPUT = 0  # Driven by its input device through the input bus
+OWNER_AUTO_FOLLOW = 1  # Driven by the auto tracker
+
+
+class TrackStore:
+    """Every track's live state in contiguous arrays, one row per track id.
+
+    Positions are stage coordinates in mm, velocities mm/s and timestamps the time.monotonic() of the input behind the
+    position. The mapping stage writes whole batches with update() and everything downstream reads rows or views of
+    the arrays, so no per-track Python object is touched on the way through.
+
+    Removing a track only clears its row, ids of the other tracks never change because they are also the PSN tracker
+    ids. Cleared rows are reused by the next add(). Like TrackFilterBank the arrays grow by doubling, anything holding
+    on to a view should take a new one after adding tracks.
+    """
+
+    def __init__(self, capacity: int = 8):
+        self.count = 0  # Rows in use, every id is below this
+        self.capacity = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        previous = {k: v for k, v in self.__dict__.items() if isinstance(v, np.ndarray)}
+        n = capacity
+
+        self.position = np.zeros((n, 3))
+        self.velocity = np.zeros((n, 3))
+        self.timestamp = np.zeros(n)
+        self.flags = np.zeros(n, dtype=np.uint8)
+        self.owner = np.zeros(n, dtype=np.uint8)
+
+        for name, value in previous.items():
+            getattr(self, name)[: len(value)] = value
+        self.capacity = n
+
+    def add(self) -> int:
+        free = np.flatnonzero((self.flags[: self.count] & FLAG_ALIVE) == 0)
+        if len(free):
+            id = int(free[0])
+        else:
+            id = self.count
+            if id >= self.capacity:
+                self._allocate(2 * self.capacity)
+            self.count += 1
+        self.position[id] = 0
+        self.velocity[id] = 0
+        self.timestamp[id] = 0
+        self.flags[id] = FLAG_ALIVE
+        self.owner[id] = OWNER_INPUT
+        return id
+
+    def remove(self, id: int) -> None:
+        if not self.isAlive(id):
+            return
+        self.flags[id] = 0
+        while self.count and not self.flags[self.count - 1] & FLAG_ALIVE:
+            self.count -= 1
+
+    def isAlive(self, id: int) -> bool:
+        return 0 <= id < self.count and bool(self.flags[id] & FLAG_ALIVE)
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(self.flags[: self.count] & FLAG_ALIVE)
+
+    def alive(self, ids: np.ndarray) -> np.ndarray:
+        """Mask of which of ids are live tracks"""
+        ids = np.asarray(ids, dtype=np.intp)
+        mask = (ids >= 0) & (ids < self.count)
+        mask[mask] = (self.flags[ids[mask]] & FLAG_ALIVE) != 0
+        return mask
+
+    def positions(self) -> np.ndarray:
+        """(count, 3) view of every row's position, rows of removed tracks are stale"""
+        return self.position[: self.count]
+
+    def update(self, ids: np.ndarray, positions: np.ndarray, times: np.ndarray) -> None:
+        """Set the positions of live tracks ids at times, with the velocity from each track's previous position"""
+        ids = np.asarray(ids, dtype=np.intp)
+        if len(ids) == 0:
+            return
+        dt = times - self.timestamp[ids]
+        moving = ((self.flags[ids] & FLAG_VALID) != 0) & (dt > 0)
+        velocity = np.zeros((len(ids), 3))
+        velocity[moving] = (positions[moving] - self.position[ids[moving]]) / dt[moving, None]
+        self.velocity[ids] = velocity
+        self.position[ids] = positions
+        self.timestamp[ids] = times
+        self.flags[ids] |= FLAG_VALID
+
+    def setOwner(self, id: int, owner: int) -> None:
+        self.owner[id] = owner
+
+    def owned(self, owner: int) -> np.ndarray:
+        """Ids of the live tracks driven by owner"""
+        rows = self.flags[: self.count] & FLAG_ALIVE != 0
+        return np.flatnonzero(rows & (self.owner[: self.count] == owner))
+
+
+if __name__ == "__main__":
+    import time
+
+    store = TrackStore(capacity=2)
+    ids = [store.add() for _ in range(3)]
+    assert ids == [0, 1, 2] and store.capacity == 4
+    store.remove(1)
+    assert store.ids().tolist() == [0, 2] and store.alive([0, 1, 2, 7]).tolist() == [True, False, True, False]
+    assert store.add() == 1  # Removed rows are reused, the other ids don't move
+    store.remove(2)
+    assert store.count == 2
+
+    store.update(np.array([0, 1]), np.array([[0.0, 0, 0], [10, 0, 0]]), np.array([1.0, 1.0]))
+    store.update(np.array([1]), np.array([[20.0, 0, 0]]), np.array([1.5]))
+    assert store.velocity[1].tolist() == [20, 0, 0] and store.velocity[0].tolist() == [0, 0, 0]
+    store.setOwner(1, OWNER_AUTO_FOLLOW)
+    assert store.owned(OWNER_AUTO_FOLLOW).tolist() == [1]
+
+    # A frame of input for 256 tracks
+    store = TrackStore()
+    for _ in range(256):
+        store.add()
+    ids = np.arange(256)
+    points = np.random.default_rng(0).random((256, 3)) * 10000
+    repeats = 1000
+    start = time.perf_counter()
+    for i in range(repeats):
+        store.update(ids, points, np.full(256, float(i)))
+    print(f"update of 256 tracks: {(time.perf_counter() - start) / repeats * 1e6:.1f}us")
@@ -0,0 +1,184 @@
+import ctypes
+import ctypes.util
+import socket
+import sys
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+
+def _loadSendmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError, TypeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _loadSendmmsg()
+
+
+class BatchSender:
+    """Sends a whole frame of UDP packets to one address, with a single sendmmsg syscall where the platform has it.
+
+    Failures are counted rather than printed so a bad network can't flood the console from the output thread.
+    """
+
+    def __init__(self, sock: socket.socket, address: tuple[str, int]):
+        self.sock = sock
+        self.address = address
+        self.sent = 0
+        self.errors = 0
+        self.batched = _sendmmsg is not None and sock.family == socket.AF_INET
+
+        if self.batched:
+            self._addr = _SockAddrIn()
+            self._addr.sin_family = socket.AF_INET
+            self._addr.sin_port = socket.htons(address[1])
+            self._addr.sin_addr[:] = socket.inet_aton(address[0])
+            self._capacity = 0
+            self._growTo(16)
+
+    def _growTo(self, capacity: int) -> None:
+        self._iovecs = (_IOVec * capacity)()
+        self._msgs = (_MMsgHdr * capacity)()
+        for i in range(capacity):
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._addr)
+            hdr.msg_namelen = ctypes.sizeof(self._addr)
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+        self._capacity = capacity
+
+    def send(self, packets: list[bytes]) -> int:
+        """Send every packet, returns how many were sent"""
+        if not packets:
+            return 0
+        if not self.batched:
+            return self._sendEach(packets)
+
+        if len(packets) > self._capacity:
+            self._growTo(max(len(packets), 2 * self._capacity))
+        buffers = [ctypes.c_char_p(packet) for packet in packets]  # Keeps the packet memory alive for the call
+        for i, (packet, buffer) in enumerate(zip(packets, buffers)):
+            self._iovecs[i].iov_base = ctypes.cast(buffer, ctypes.c_void_p)
+            self._iovecs[i].iov_len = len(packet)
+
+        sent = 0
+        fd = self.sock.fileno()
+        while sent < len(packets):
+            result = _sendmmsg(fd, ctypes.addressof(self._msgs[sent]), len(packets) - sent, 0)
+            if result <= 0:
+                # Drop the rest of the frame, the next frame supersedes it anyway
+                self.errors += len(packets) - sent
+                break
+            sent += result
+        self.sent += sent
+        return sent
+
+    def _sendEach(self, packets: list[bytes]) -> int:
+        sent = 0
+        for packet in packets:
+            try:
+                self.sock.sendto(packet, self.address)
+                sent += 1
+            except OSError:
+                self.errors += 1
+        self.sent += sent
+        return sent
+
+
+if __name__ == "__main__":
+    import threading
+    import time
+
+    import psn_encoder as psn
+
+    # Load test: 1000 trackers at 60 Hz through a loopback receiver
+    trackers_count = 1000
+    frame_rate = 60
+    seconds = 3
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(0.5)
+    received = {"packets": 0, "bytes": 0, "largest": 0}
+
+    def receive():
+        while True:
+            try:
+                data = receiver.recv(65536)
+            except socket.timeout:
+                return
+            received["packets"] += 1
+            received["bytes"] += len(data)
+            received["largest"] = max(received["largest"], len(data))
+
+    receive_thread = threading.Thread(target=receive)
+    receive_thread.start()
+
+    mtu = 1500
+    encoder = psn.Encoder("Lighthouse load test", max_packet_size=mtu - 28)
+    trackers = {i: psn.Tracker(i, f"Tracker {i}") for i in range(trackers_count)}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sender = BatchSender(sock, receiver.getsockname())
+
+    frames = frame_rate * seconds
+    sent = 0
+    send_time = 0.0
+    encode_time = 0.0
+    period = 1 / frame_rate
+    deadline = time.monotonic()
+    for frame in range(frames):
+        for tracker in trackers.values():
+            tracker.set_pos(psn.Float3(frame, frame, frame))
+        start = time.perf_counter()
+        packets = encoder.encode_data(trackers, frame)
+        if frame % frame_rate == 0:
+            packets = encoder.encode_info(trackers, frame) + packets
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        sent += sender.send(packets)
+        send_time += time.perf_counter() - start
+        deadline += period
+        time.sleep(max(0.0, deadline - time.monotonic()))
+
+    receive_thread.join()
+    print(f"sendmmsg: {sender.batched}, packets per data frame: {len(encoder.encode_data(trackers))}")
+    print(f"Encode {encode_time / frames * 1e3:.3f}ms/frame, send {send_time / frames * 1e3:.3f}ms/frame")
+    print(f"Sent {sent} packets, {sender.errors} errors, received {received['packets']} ({received['bytes']} bytes)")
+    print(f"Largest datagram {received['largest']} bytes, limit {mtu - 28}")
+    assert received["largest"] <= mtu - 28
+    assert received["packets"] == sent
@@ -0,0 +1,173 @@
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+from PySide6.QtCore import QObject, QSize, Signal, Slot
+from PySide6.QtGui import QImage
+
+from camera_model import CameraModel
+from frame_tap import TappedFrame
+
+PREVIEW_SCALES = (0.25, 0.5, 0.75, 1.0)  # Output sizes the maps are built for, so resizing the window rarely rebuilds
+
+
+class UndistortMaps:
+    """initUndistortRectifyMap maps in fixed point CV_16SC2 form.
+
+    Built once per calibration, frame size and output scale, and reused for every frame after that. Scaling the new
+    camera matrix lets remap sample the full resolution frame straight into a smaller preview.
+    """
+
+    def __init__(self):
+        self._key = None
+        self.maps = None
+        self.builds = 0
+
+    def get(self, camera: CameraModel, size: tuple[int, int], scale: float = 1.0) -> tuple[np.ndarray, np.ndarray]:
+        key = (camera.camera_matrix.tobytes(), camera.camera_dist.tobytes(), size, scale)
+        if key != self._key:
+            new_matrix = camera.camera_matrix.copy()
+            new_matrix[:2] *= scale
+            output_size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+            self.maps = cv.initUndistortRectifyMap(
+                camera.camera_matrix, camera.camera_dist, None, new_matrix, output_size, cv.CV_16SC2
+            )
+            self._key = key
+            self.builds += 1
+        return self.maps
+
+
+def previewScale(frame_size: tuple[int, int], view_size: tuple[int, int]) -> float:
+    """Smallest of PREVIEW_SCALES that still fills the view"""
+    needed = max(view_size[0] / frame_size[0], view_size[1] / frame_size[1])
+    for scale in PREVIEW_SCALES:
+        if scale >= needed:
+            return scale
+    return PREVIEW_SCALES[-1]
+
+
+class UndistortView(QObject):
+    """Undistorted live preview. A FrameTap consumer that remaps frames on its own thread.
+
+    Only the newest frame waits to be remapped, and no new frame is taken from the tap until the GUI reports the last
+    one as shown, so a slow GUI drops frames instead of queueing them.
+    """
+
+    frame_ready = Signal(QImage)  # Call displayed() once it's on screen
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.maps = UndistortMaps()
+        self._camera: CameraModel | None = None
+        self._enabled = False
+        self._view_size = (1920, 1080)
+        self._shown = True
+        self._image = None  # Keeps the buffer behind the last emitted QImage alive
+
+        self.frames = 0
+        self.dropped = 0
+        self.remap_time = 0.0  # seconds, exponential moving average
+
+        self._pending = None
+        self._condition = threading.Condition()
+        self._exiting = False
+        self._thread = threading.Thread(target=self.run, name="Undistort view", daemon=True)
+        self._thread.start()
+
+    def setCamera(self, camera: CameraModel | None) -> None:
+        self._camera = camera
+
+    def setEnabled(self, enabled: bool) -> None:
+        self._enabled = enabled
+        self._shown = True
+
+    @Slot(QSize)
+    def setViewSize(self, size: QSize) -> None:
+        self._view_size = (max(1, size.width()), max(1, size.height()))
+
+    def active(self) -> bool:
+        return self._enabled and self._camera is not None and self._shown
+
+    @Slot()
+    def displayed(self) -> None:
+        self._shown = True
+
+    def onFrame(self, frame: TappedFrame) -> None:
+        """FrameTap consumer, only converts the frame out of the mapped buffer and leaves the remap to our thread"""
+        bgr = frame.bgr()
+        if bgr is None:
+            return
+        with self._condition:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = bgr
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._exiting = True
+            self._condition.notify()
+        self._thread.join()
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._exiting:
+                    self._condition.wait()
+                if self._exiting:
+                    return
+                bgr = self._pending
+                self._pending = None
+
+            camera = self._camera
+            if camera is None or not self._enabled:
+                continue
+            start = time.perf_counter()
+            size = (bgr.shape[1], bgr.shape[0])
+            map1, map2 = self.maps.get(camera, size, previewScale(size, self._view_size))
+            undistorted = cv.remap(bgr, map1, map2, cv.INTER_LINEAR)
+            self.remap_time += (time.perf_counter() - start - self.remap_time) * 0.05
+            self.frames += 1
+
+            self._shown = False
+            self._image = undistorted
+            height, width = undistorted.shape[:2]
+            self.frame_ready.emit(QImage(undistorted.data, width, height, undistorted.strides[0], QImage.Format.Format_BGR888))
+
+
+if __name__ == "__main__":
+    camera_matrix = np.array([[1400.0, 0, 960], [0, 1400.0, 540], [0, 0, 1]])
+    camera = CameraModel(camera_matrix, np.array([-0.25, 0.08, 0.001, -0.0005]))
+
+    # A straight line drawn in undistorted space, distorted into a raw frame, comes back straight after the remap
+    line = np.stack((np.linspace(200, 1700, 400), np.full(400, 150.0)), axis=1)
+    raw = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    for x, y in np.round(camera.distortPixels(line)).astype(int):
+        cv.circle(raw, (x, y), 3, (255, 255, 255), -1)
+
+    maps = UndistortMaps()
+    map1, map2 = maps.get(camera, (1920, 1080))
+    assert map1.dtype == np.int16 and map1.shape == (1080, 1920, 2) and map2.dtype == np.uint16
+    undistorted = cv.remap(raw, map1, map2, cv.INTER_LINEAR)
+    rows = np.nonzero(undistorted[:, 300:1600, 0].max(axis=1) > 128)[0]
+    print(f"Line spans rows {rows.min()}..{rows.max()} after undistorting, {np.ptp(np.round(camera.distortPixels(line)[:, 1]))} before")
+    assert rows.max() - rows.min() <= 10
+
+    # Maps are only rebuilt when something changes
+    maps.get(camera, (1920, 1080))
+    maps.get(camera, (1920, 1080), previewScale((1920, 1080), (1280, 700)))
+    assert maps.builds == 2
+
+    repeats = 20
+    for scale in (1.0, 0.5):
+        map1, map2 = maps.get(camera, (1920, 1080), scale)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            cv.remap(raw, map1, map2, cv.INTER_LINEAR)
+        remap = (time.perf_counter() - start) / repeats
+        print(f"1080p BGR remap to {scale:.0%} preview: {remap * 1000:.1f}ms")
+    start = time.perf_counter()
+    for _ in range(5):
+        cv.undistort(raw, camera_matrix, camera.camera_dist)
+    print(f"cv.undistort per frame: {(time.perf_counter() - start) / 5 * 1000:.1f}ms")
@@ -1,13 +1,19 @@
 from typing import Tuple
+import numpy as np
 from PySide6.QtCore import Signal, QPoint, Slot, QSize, Qt
-from PySide6.QtGui import QMouseEvent, QResizeEvent, QPen, QBrush, QColor, QVector3D, QVector2D
+from PySide6.QtGui import QMouseEvent, QResizeEvent, QPen, QBrush, QColor, QVector3D, QVector2D, QImage, QPixmap
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QGraphicsView, QGraphicsScene
 from PySide6.QtMultimediaWidgets import QVideoWidget, QGraphicsVideoItem
 from PySide6.QtMultimedia import QMediaCaptureSession, QCameraFormat
 
+from camera_model import CameraModel
+
 
 class VideoDisplayWidget(QGraphicsView):
     click_position = Signal(QPoint)  # screen point
+    resolution_changed = Signal(QSize)
+    view_resized = Signal(QSize)
+    undistorted_frame_shown = Signal()
 
     def __init__(self, parent=None):
         super().__init__()
@@ -20,8 +26,10 @@ class VideoDisplayWidget(QGraphicsView):
         # self.setAttribute(Qt.WA_AcceptTouchEvents, False)
         # self.h_layout.addWidget(self.video_view)
         self.video_item = None
+        self.undistorted_item = None
+        self.view_camera: CameraModel | None = None  # Set while showing the undistorted preview
         self.video_resolution = QSize(1280, 720)
-        self.cursors: list[Tuple[QPoint, QPoint]] = []  # ground, target
+        self.cursors: dict[int, tuple] = {}  # Track id -> (line from the ground, circle around the target)
 
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
@@ -33,9 +41,28 @@ class VideoDisplayWidget(QGraphicsView):
         self.video_scene.addItem(self.video_item)
         self.video_item.setSize(QSize(1920, 1080))
         self.video_item.setPos(0, 0)
+        self.undistorted_item = self.video_scene.addPixmap(QPixmap())
+        self.undistorted_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        self.undistorted_item.hide()
 
         self.setSceneRect(0, 0, 1920, 1080)
 
+    def setUndistortedView(self, camera: CameraModel | None) -> None:
+        """Show the undistorted preview instead of the raw video, clicks and overlays follow it into undistorted space"""
+        self.view_camera = camera
+        self.video_item.setVisible(camera is None)
+        self.undistorted_item.setVisible(camera is not None)
+        self.updateAllTracks()
+
+    @Slot(QImage)
+    def showUndistortedFrame(self, image: QImage) -> None:
+        if self.view_camera is not None:
+            rect = self.video_item.boundingRect()
+            self.undistorted_item.setPixmap(QPixmap.fromImage(image))
+            self.undistorted_item.setPos(rect.topLeft())
+            self.undistorted_item.setScale(rect.width() / image.width())
+        self.undistorted_frame_shown.emit()
+
     def mapToLocalCoord(self, p: QVector2D()) -> QVector2D:
         video_res = self.video_resolution
         display_res_x = self.video_item.boundingRect().width()
@@ -44,7 +71,8 @@ class VideoDisplayWidget(QGraphicsView):
         y = display_res_y * p.y() / float(video_res.height())
         return QVector2D(x, y)
 
-    def addTrack(self) -> None:
+    @Slot(int)
+    def addTrack(self, id: int) -> None:
         pen = QPen()
         pen.setColor(QColor(255, 0, 0))
         pen.setWidth(3)
@@ -54,24 +82,41 @@ class VideoDisplayWidget(QGraphicsView):
 
         r = 30
 
-        t = len(self.cursors)
-        c: Tuple[QVector2D, QVector2D] = self.main_window.data.getTrack2D(t)
+        c: Tuple[QVector2D, QVector2D] = self.main_window.data.getTrack2D(id)
         lower = self.video_scene.addLine(c[0].x(), c[0].y(), c[1].x(), c[1].y(), pen)
         lower.setZValue(1)
         upper = self.video_scene.addEllipse(c[0].x() - r, c[0].y() - r, 2 * r, 2 * r, pen, brush)
         upper.setZValue(1)
 
-        self.cursors.append((lower, upper))
+        self.cursors[id] = (lower, upper)
 
-    @Slot(int, QPoint)
-    def updateTrack(self, id):
-        c: Tuple[QVector2D, QVector2D] = self.main_window.data.getTrack2D(id)
+    @Slot(int)
+    def removeTrack(self, id: int) -> None:
+        for item in self.cursors.pop(id, ()):
+            self.video_scene.removeItem(item)
+
+    @Slot(object)
+    def updateTracks(self, ids: np.ndarray):
+        """Move the cursors of just the tracks in ids, all projected together"""
+        tracks = self.main_window.data.getTracks2D()
+        for id in ids.tolist():
+            if id in self.cursors:
+                self.moveTrackCursor(id, tracks[id][0], tracks[id][1])
+
+    @Slot()
+    def updateAllTracks(self):
+        tracks = self.main_window.data.getTracks2D()
+        for id in self.cursors:
+            self.moveTrackCursor(id, tracks[id][0], tracks[id][1])
 
+    def moveTrackCursor(self, id: int, ground: np.ndarray, target: np.ndarray) -> None:
         r = 30
 
-        c0 = self.mapToLocalCoord(c[0])
-        c1 = self.mapToLocalCoord(c[1])
-        c1_offset = self.mapToLocalCoord(c[1] - QVector2D(r, r))
+        if self.view_camera is not None:
+            ground, target = self.view_camera.undistortPixels(np.array([ground, target]))
+        c0 = self.mapToLocalCoord(QVector2D(*ground))
+        c1 = self.mapToLocalCoord(QVector2D(*target))
+        c1_offset = self.mapToLocalCoord(QVector2D(target[0] - r, target[1] - r))
         rm = self.mapToLocalCoord(QVector2D(2 * r, 2 * r))
         self.cursors[id][0].setLine(c0.x(), c0.y(), c1.x(), c1.y())
         self.cursors[id][1].setRect(c1_offset.x(), c1_offset.y(), rm.x(), rm.y())
@@ -95,6 +140,8 @@ class VideoDisplayWidget(QGraphicsView):
             y_extra = size.height() - y_height
             y_use = pos.y() - y_extra / 2
             y = max(0, min(y_use / y_height * res.height(), res.height()))
+        if self.view_camera is not None:
+            x, y = self.view_camera.distortPixels(np.array([[x, y]]))[0]  # Back to raw image pixels
         return QPoint(x, y)
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
@@ -115,8 +162,11 @@ class VideoDisplayWidget(QGraphicsView):
     @Slot(QCameraFormat)
     def formatChange(self, format: QCameraFormat) -> None:
         self.video_resolution = format.resolution()
+        self.resolution_changed.emit(self.video_resolution)
         self.fitView()
+        self.updateAllTracks()
 
     def resizeEvent(self, event: QResizeEvent) -> None:
         super().resizeEvent(event)
         self.fitView()
+        self.view_resized.emit(event.size())